@@ -0,0 +1,282 @@
+# Times each operation the pages of the app make against a generated
+# database, using the headless InventoryStore that the pages call into.
+#
+# Run with: python -m benchmarks.bench_queries [--scale 10k|1m|10m]
+#     [--iterations N] [--only NAME,...] [--data-dir DIR] [--json PATH]
+import argparse
+import json
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, where the process peak is not reported
+    resource = None
+
+from A1_inventory_management.csv_export import exportSearch
+from A1_inventory_management.database_init import initialiseDb
+from A1_inventory_management.expiry_forecast import forecastExpiry
+from A1_inventory_management.inventory_store import InventoryStore
+from A1_inventory_management.query_builder import BATCHES, TRANSACTIONS, SearchQuery
+from A1_inventory_management.row_source import SearchRowSource
+from A1_inventory_management.utils.datetime_helpers import fromDayNumber
+from A1_inventory_management.validation import checkAddition, checkRemoval
+from benchmarks.datagen import DEFAULT_SEED, DELIVERY_HISTORY_DAYS, LAST_DELIVERY_DAY, REMOVAL_REASONS, SCALES, generateDatabase
+
+# Runs of each operation made with tracemalloc on, to find its peak memory
+MEMORY_RUNS = 5
+
+
+##########################
+## class BenchmarkState ##
+##########################
+# What the operations need to know about the database they run against
+class BenchmarkState:
+    def __init__(self, store, rng, workDir):
+        self.store = store
+        self.rng = rng
+        self.workDir = workDir
+        self.stockIds = list(store.stock_names())
+        self.lastBatchId = store.conn.execute("SELECT MAX(id) FROM batches").fetchone()[0]
+        self.removals = store.count_transactions(transactionType="removal")
+
+    def stockName(self):
+        return self.store.stock_names()[self.rng.choice(self.stockIds)]
+
+    def dateRange(self, days):
+        """A random date range, days long, starting within the generated deliveries"""
+        start = LAST_DELIVERY_DAY - self.rng.randrange(DELIVERY_HISTORY_DAYS)
+        return fromDayNumber(start), fromDayNumber(start + days)
+
+
+# Each operation does what a page does when its form is submitted: check the
+# entered values, then run the query or change
+
+def benchAdd(state):
+    name = state.stockName()
+    deliveredAt = fromDayNumber(LAST_DELIVERY_DAY)
+    checkAddition(state.store, name, 10, deliveredAt, "2099-01-01")
+    state.store.add_batch(state.store.resolve_stock_id(name), 10, deliveredAt, "2099-01-01")
+
+
+def benchRemove(state):
+    batchId = state.rng.randint(1, state.lastBatchId)
+    removalDate = fromDayNumber(LAST_DELIVERY_DAY + 1)
+    dataValid = checkRemoval(state.store, batchId, 1, removalDate, "used")
+    if all(dataValid.values()):
+        state.store.remove_from_batch(batchId, 1, removalDate, "used")
+
+
+def benchRemoveStock(state):
+    stockId = state.rng.choice(state.stockIds)
+    try:
+        state.store.remove_stock(stockId, 5, fromDayNumber(LAST_DELIVERY_DAY + 1), "used")
+    except ValueError:
+        pass
+
+
+def showResults(store, source):
+    # The first block of rows, then the count if the first block is not the
+    # last, as the results grid reads them
+    source.addBlocks(source.loadJob([0])(store))
+    if source.rowCount is None:
+        source.rowCount = source.countJob()(store)
+
+
+def benchBatchSearch(state):
+    filters = {"stockId": state.store.resolve_stock_id(state.stockName()), "deliveredAt": state.dateRange(90)}
+    showResults(state.store, SearchRowSource(BATCHES, filters))
+
+
+def benchTransactionSearch(state):
+    filters = {"occuredAt": state.dateRange(30), "removalReason": state.rng.choice(REMOVAL_REASONS)}
+    showResults(state.store, SearchRowSource(TRANSACTIONS, filters))
+
+
+def benchTransactionScroll(state):
+    # Every removal, newest first, scrolled to a block anywhere in them
+    source = SearchRowSource(TRANSACTIONS, {"transactionType": "removal"}, orderBy="occured_at", descending=True)
+    source.addBlocks(source.loadJob([state.rng.randrange(state.removals // source.blockSize + 1)])(state.store))
+
+
+def benchStockTotals(state):
+    state.store.stock_totals()
+
+
+def benchCsvExport(state):
+    # Every transaction of one stock type, streamed from the cursor with the
+    # stock names filled in, as exportToCsv does
+    query = SearchQuery(TRANSACTIONS, {"stockId": state.rng.choice(state.stockIds)})
+    exportSearch(state.store, query, state.workDir / "export.csv", state.store.stock_names(), ["id"])
+
+
+def benchExpiryForecast(state):
+    forecastExpiry(state.store, 28, 7, today=fromDayNumber(LAST_DELIVERY_DAY))
+
+
+def benchStockLevelsAt(state):
+    # The checkpoints are made by the first run, as they are by the first
+    # search of the stock totals page
+    state.store.update_checkpoints()
+    state.store.stock_levels_at(fromDayNumber(LAST_DELIVERY_DAY - state.rng.randrange(365)))
+
+
+def benchUsageByWeek(state):
+    end = LAST_DELIVERY_DAY - state.rng.randrange(365)
+    state.store.usage_by_week(fromDayNumber(end - 91), fromDayNumber(end))
+
+
+def benchLossesByMonth(state):
+    end = LAST_DELIVERY_DAY - state.rng.randrange(365)
+    state.store.losses_by_month(fromDayNumber(end - 365), fromDayNumber(end))
+
+
+BENCHMARKS = {
+    "add": benchAdd,
+    "remove": benchRemove,
+    "remove_stock": benchRemoveStock,
+    "batch_search": benchBatchSearch,
+    "transaction_search": benchTransactionSearch,
+    "transaction_scroll": benchTransactionScroll,
+    "stock_totals": benchStockTotals,
+    "csv_export": benchCsvExport,
+    "expiry_forecast": benchExpiryForecast,
+    "stock_levels_at": benchStockLevelsAt,
+    "usage_by_week": benchUsageByWeek,
+    "losses_by_month": benchLossesByMonth,
+}
+
+
+#######################
+## def percentile () ##
+#######################
+# Nearest rank percentile of a sorted list
+def percentile(sortedValues, p):
+    """Find the value below which p percent of the values fall
+
+    Args:
+        sortedValues (list): the values in ascending order
+        p (float): the percentile, from 0 to 100
+
+    Returns:
+        float: the smallest value with at least p percent of the values at or
+            below it
+    """
+    rank = max(1, -(-len(sortedValues) * p // 100))
+    return sortedValues[int(rank) - 1]
+
+
+#########################
+## def runBenchmark () ##
+#########################
+# Time an operation, then measure its peak memory
+def runBenchmark(operation, state, iterations):
+    """Run an operation iterations times, and then MEMORY_RUNS more times
+    with tracemalloc on. tracemalloc slows the operation down, so the two are
+    measured separately.
+
+    Args:
+        operation (function): the operation, called with state
+        state (BenchmarkState): the store and random numbers to use
+        iterations (int): the number of timed runs
+
+    Returns:
+        dict: the runs, the p50, p95, p99 and max latency in milliseconds, and
+            the peak Python memory allocated by a run in KiB
+    """
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter_ns()
+        operation(state)
+        timings.append((time.perf_counter_ns() - start) / 1e6)
+    timings.sort()
+
+    peak = 0
+    tracemalloc.start()
+    for _ in range(MEMORY_RUNS):
+        tracemalloc.reset_peak()
+        operation(state)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+    tracemalloc.stop()
+
+    return {
+        "runs": iterations,
+        "p50_ms": percentile(timings, 50),
+        "p95_ms": percentile(timings, 95),
+        "p99_ms": percentile(timings, 99),
+        "max_ms": timings[-1],
+        "peak_kib": peak / 1024,
+    }
+
+
+def generatedDatabase(dataDir, scale, seed):
+    """Find the generated database for a scale, generating it the first time"""
+    path = Path(dataDir) / f"bench_{scale}_{seed}.db"
+    if not path.exists():
+        stockTypes, batches, transactions = SCALES[scale]
+        print(f"Generating the {scale} database in {path}...", file=sys.stderr)
+        partial = path.with_suffix(".partial")
+        partial.unlink(missing_ok=True)
+        generateDatabase(partial, stockTypes, batches, transactions, seed)
+        partial.rename(path)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the queries of the app against a generated database")
+    parser.add_argument("--scale", choices=SCALES, default="10k", help="size of the generated database")
+    parser.add_argument("--iterations", type=int, default=200, help="timed runs of each operation")
+    parser.add_argument("--only", help="comma separated operations to run, from: " + ", ".join(BENCHMARKS))
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help="seed for the data and the operations")
+    parser.add_argument("--data-dir", default=Path(tempfile.gettempdir()) / "A1_inventory_management_bench",
+                        help="where generated databases are kept between runs")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    names = args.only.split(",") if args.only else list(BENCHMARKS)
+    unknown = [n for n in names if n not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown operation(s): {', '.join(unknown)}")
+
+    Path(args.data_dir).mkdir(parents=True, exist_ok=True)
+    source = generatedDatabase(args.data_dir, args.scale, args.seed)
+
+    results = {}
+    print(f"{'operation':20} {'runs':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9} {'peak KiB':>10}")
+    with tempfile.TemporaryDirectory() as workDir:
+        workDir = Path(workDir)
+        for name in names:
+            # Each operation runs against a fresh copy, so that the changes
+            # made by one do not affect the next
+            dbPath = workDir / "stock_database.db"
+            shutil.copyfile(source, dbPath)
+            # Bring a database generated by an earlier version up to date
+            initialiseDb(dbPath)
+            store = InventoryStore(dbPath)
+            try:
+                state = BenchmarkState(store, random.Random(args.seed), workDir)
+                result = runBenchmark(BENCHMARKS[name], state, args.iterations)
+            finally:
+                store.close()
+            results[name] = result
+            print(f"{name:20} {result['runs']:6} {result['p50_ms']:9.3f} {result['p95_ms']:9.3f} "
+                  f"{result['p99_ms']:9.3f} {result['max_ms']:9.3f} {result['peak_kib']:10.1f}")
+
+    if resource is not None:
+        # ru_maxrss is in KiB on linux and bytes on macOS
+        maxRss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        print(f"Peak memory of the process: {maxRss / (1024 * 1024 if sys.platform == 'darwin' else 1024):.1f} MiB")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"scale": args.scale, "seed": args.seed, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
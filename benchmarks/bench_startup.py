@@ -0,0 +1,70 @@
+# Measures how long each module of the app takes to import in a fresh
+# interpreter, and which heavy modules each one pulls in.
+#
+# Run with: python -m benchmarks.bench_startup [--repeat N]
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+MODULES = [
+    "A1_inventory_management.database_init",
+    "A1_inventory_management.inventory_store",
+    "A1_inventory_management.validation",
+    "A1_inventory_management.bulk_import",
+    "A1_inventory_management.core",
+]
+
+# Modules that should only be imported once they are needed
+HEAVY_MODULES = ["tkinter", "pandas", "pandastable"]
+
+# Run in the child interpreter: import the module, then report which heavy
+# modules were imported along with it
+CHILD_SCRIPT = """
+import sys
+import {module}
+print(",".join(m for m in {heavy!r} if m in sys.modules))
+"""
+
+
+#######################
+## def timeImport () ##
+#######################
+# Import a module in a new interpreter and time it
+def timeImport(module):
+    """Import module in a fresh interpreter
+
+    Args:
+        module (string): dotted name of the module to import
+
+    Returns:
+        tuple: (seconds taken including interpreter start up, list of the
+            HEAVY_MODULES that were imported)
+    """
+    script = CHILD_SCRIPT.format(module=module, heavy=HEAVY_MODULES)
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True).stdout
+    elapsed = time.perf_counter() - start
+    return elapsed, [m for m in output.strip().split(",") if m]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the import of each module of the app")
+    parser.add_argument("--repeat", type=int, default=5, help="number of imports to time for each module")
+    args = parser.parse_args()
+
+    # Time a bare interpreter so that it can be taken off each import
+    baseline = statistics.median(timeImport("sys")[0] for _ in range(args.repeat))
+    print(f"{'module':45} {'median ms':>10} {'min ms':>8}  heavy modules imported")
+    for module in MODULES:
+        times = []
+        heavy = []
+        for _ in range(args.repeat):
+            elapsed, heavy = timeImport(module)
+            times.append((elapsed - baseline) * 1000)
+        print(f"{module:45} {statistics.median(times):10.1f} {min(times):8.1f}  {', '.join(heavy) or '-'}")
+
+
+if __name__ == "__main__":
+    main()
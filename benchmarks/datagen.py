@@ -0,0 +1,155 @@
+# Generates a stock database of a chosen size for the benchmarks. The same
+# sizes and seed always give the same database.
+#
+# Run with: python -m benchmarks.datagen PATH [--scale 10k|1m|10m] [--seed N]
+import argparse
+import random
+import sqlite3 as sql
+import time
+from datetime import date
+from itertools import accumulate
+
+from A1_inventory_management.database_init import initialiseDb
+from A1_inventory_management.inventory_store import TRANSACTION_TYPE_ADDITION_STRING, TRANSACTION_TYPE_REMOVAL_STRING
+from A1_inventory_management.utils.datetime_helpers import EPOCH_DATE
+
+# (stock types, batches, transactions) for each named scale. The scale is the
+# total number of rows in batches and transactions
+SCALES = {
+    "10k": (50, 2_000, 8_000),
+    "1m": (500, 200_000, 800_000),
+    "10m": (2_000, 2_000_000, 8_000_000),
+}
+
+DEFAULT_SEED = 20251018
+
+# Removals that were not made because the batch went out of date, and how
+# often each reason is given
+REMOVAL_REASONS = ["used", "returned", "lost", "destroyed"]
+REMOVAL_REASON_WEIGHTS = [85, 7, 5, 3]
+
+# Deliveries are spread over the two years up to this day
+LAST_DELIVERY_DAY = (date(2025, 10, 1) - EPOCH_DATE).days
+DELIVERY_HISTORY_DAYS = 730
+
+INSERT_CHUNK_SIZE = 50_000
+
+
+#############################
+## def generateDatabase () ##
+#############################
+# Create a database filled with made up stock
+def generateDatabase(dbPath, stockTypes, batches, transactions, seed=DEFAULT_SEED):
+    """Create a new stock database filled with generated data
+
+    Each stock type is given a shelf life, and its batches are delivered at
+    random over the two years up to LAST_DELIVERY_DAY. Lower stock ids are
+    delivered more often, in proportion to 1 / id. Every batch has an
+    addition transaction, and the rest of the transactions are removals
+    spread at random over the batches. A removal made after a batch's use by
+    date is recorded as out_of_date, and the others are given a reason from
+    REMOVAL_REASONS.
+
+    Args:
+        dbPath (string or Path): where to create the database. It must not
+            already exist
+        stockTypes (int): the number of stock types
+        batches (int): the number of batches
+        transactions (int): the number of transactions, at least batches
+        seed (int): seed for the random numbers
+
+    Returns:
+        float: the seconds taken to generate the database
+    """
+    if transactions < batches:
+        raise ValueError("Every batch needs an addition, so transactions must be at least batches")
+    start = time.perf_counter()
+    rng = random.Random(seed)
+
+    initialiseDb(dbPath)
+    conn = sql.connect(dbPath, isolation_level=None)
+    # The database is thrown away if generation fails, so it is written
+    # without a journal. The WAL mode set by initialiseDb is put back after
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("BEGIN")
+
+    # initialiseDb adds a few stock types of its own
+    existing = conn.execute("SELECT COUNT(*) FROM stock_names").fetchone()[0]
+    conn.executemany(
+        "INSERT INTO stock_names (name) VALUES (?)",
+        ((f"stock type {n}",) for n in range(existing + 1, stockTypes + 1))
+    )
+    stockIds = [r[0] for r in conn.execute("SELECT id FROM stock_names ORDER BY id")]
+    shelfLife = {stockId: rng.choice((14, 30, 90, 180, 365, 730)) for stockId in stockIds}
+    # A few stock types are delivered far more often than the rest
+    popularity = list(accumulate(1 / rank for rank in range(1, len(stockIds) + 1)))
+
+    # Pick the batch of every removal up front, so that there are exactly
+    # the number of transactions asked for
+    removals = [0] * batches
+    for _ in range(transactions - batches):
+        removals[rng.randrange(batches)] += 1
+
+    batchRows = []
+    transactionRows = []
+    for batchId in range(1, batches + 1):
+        stockId = rng.choices(stockIds, cum_weights=popularity)[0]
+        quantity = rng.randint(1, 500)
+        deliveredDay = LAST_DELIVERY_DAY - rng.randrange(DELIVERY_HISTORY_DAYS)
+        useByDay = deliveredDay + shelfLife[stockId]
+        recordedAt = deliveredDay * 86400 + rng.randrange(8 * 3600, 18 * 3600)
+        transactionRows.append((TRANSACTION_TYPE_ADDITION_STRING, batchId, stockId, quantity, "N/A", deliveredDay, recordedAt))
+
+        # Removals take a random share of what is left, on days after the
+        # delivery and in order
+        current = quantity
+        removalDay = deliveredDay
+        for _ in range(removals[batchId - 1]):
+            removalDay += rng.randint(0, max(1, shelfLife[stockId] // 4))
+            taken = rng.randint(0, current) if current else 0
+            current -= taken
+            reason = "out_of_date" if removalDay > useByDay else rng.choices(REMOVAL_REASONS, REMOVAL_REASON_WEIGHTS)[0]
+            transactionRows.append((TRANSACTION_TYPE_REMOVAL_STRING, batchId, stockId, taken, reason, removalDay, removalDay * 86400 + 43200))
+        batchRows.append((batchId, stockId, quantity, current, deliveredDay, useByDay, recordedAt))
+
+        if len(batchRows) >= INSERT_CHUNK_SIZE:
+            _insertRows(conn, batchRows, transactionRows)
+            batchRows = []
+            transactionRows = []
+    _insertRows(conn, batchRows, transactionRows)
+
+    conn.execute("COMMIT")
+    conn.execute("ANALYZE")
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.close()
+    return time.perf_counter() - start
+
+
+def _insertRows(conn, batchRows, transactionRows):
+    conn.executemany(
+        "INSERT INTO batches (id, stock_id, quantity_initial, quantity_current, delivered_day, use_by_day, recorded_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        batchRows
+    )
+    conn.executemany(
+        "INSERT INTO transactions (transaction_type, batch_id, stock_id, quantity, removal_reason, occured_day, recorded_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        transactionRows
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a stock database for the benchmarks")
+    parser.add_argument("path", help="where to create the database")
+    parser.add_argument("--scale", choices=SCALES, default="10k", help="number of rows to generate")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help="seed for the random numbers")
+    args = parser.parse_args()
+
+    stockTypes, batches, transactions = SCALES[args.scale]
+    elapsed = generateDatabase(args.path, stockTypes, batches, transactions, args.seed)
+    print(f"Generated {stockTypes} stock types, {batches} batches and {transactions} transactions in {elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
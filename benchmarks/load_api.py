@@ -0,0 +1,202 @@
+# Load tests the HTTP API as a number of scanner stations making requests at
+# once, then reports the throughput and latency of each kind of request. By
+# default it serves a new database from another process on localhost, so
+# nothing else needs to be running.
+#
+# Run with: python -m benchmarks.load_api [--clients N] [--requests N]
+#     [--batch-size N] [--threads N] [--url http://HOST:PORT]
+import argparse
+import http.client
+import json
+import multiprocessing
+import random
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from A1_inventory_management.api_server import DEFAULT_THREADS, InventoryServer
+from A1_inventory_management.database_init import initialiseDb
+from benchmarks.bench_queries import percentile
+
+# How often each request is made, out of the total
+REQUEST_MIX = {
+    "add": 40,
+    "remove_stock": 20,
+    "movements": 10,
+    "batch_search": 20,
+    "stock_totals": 10,
+}
+
+
+#####################
+## def serveApi () ##
+#####################
+# Serve a database until told to stop, from a process of its own
+def serveApi(dbPath, threads, addresses, stop):
+    """Run an InventoryServer on a free port of localhost
+
+    Args:
+        dbPath (string or Path): the database to serve
+        threads (int): the requests the server handles at once
+        addresses (multiprocessing.Queue): the (host, port) listened on is
+            put here once the server is ready
+        stop (multiprocessing.Event): set to stop the server
+    """
+    server = InventoryServer(("127.0.0.1", 0), dbPath, threads)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    addresses.put(server.server_address)
+    stop.wait()
+    server.shutdown()
+    server.server_close()
+
+
+#########################
+## class ScannerClient ##
+#########################
+# One station making requests over a single kept-open connection
+class ScannerClient:
+    def __init__(self, address, stockIds, batchSize, seed):
+        self.conn = http.client.HTTPConnection(*address, timeout=30)
+        self.stockIds = stockIds
+        self.batchSize = batchSize
+        self.rng = random.Random(seed)
+        self.today = date.today().isoformat()
+        self.useBy = (date.today() + timedelta(days=365)).isoformat()
+        # Latency in milliseconds of each request, and the statuses returned,
+        # by kind of request
+        self.timings = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    def run(self, requests):
+        kinds = self.rng.choices(list(REQUEST_MIX), weights=list(REQUEST_MIX.values()), k=requests)
+        try:
+            for kind in kinds:
+                method, path, body = getattr(self, kind)()
+                start = time.perf_counter_ns()
+                self.conn.request(method, path, json.dumps(body) if body is not None else None,
+                                  {"Content-Type": "application/json"})
+                response = self.conn.getresponse()
+                response.read()
+                self.timings[kind].append((time.perf_counter_ns() - start) / 1e6)
+                self.statuses[kind][response.status] += 1
+        finally:
+            self.conn.close()
+
+    def addition(self):
+        return {"stock": self.rng.choice(self.stockIds), "quantity": self.rng.randint(1, 50),
+                "delivered_at": self.today, "use_by": self.useBy}
+
+    def add(self):
+        return "POST", "/api/add", self.addition()
+
+    def remove_stock(self):
+        # Some are turned down for want of stock, as on a real pick station
+        return "POST", "/api/remove_stock", {"stock": self.rng.choice(self.stockIds), "quantity": self.rng.randint(1, 10),
+                                             "date": self.today, "reason": "used"}
+
+    def movements(self):
+        return "POST", "/api/movements", {"movements": [dict(self.addition(), action="add") for _ in range(self.batchSize)]}
+
+    def batch_search(self):
+        return "GET", f"/api/batches?stock={self.rng.choice(self.stockIds)}&limit=100", None
+
+    def stock_totals(self):
+        return "GET", "/api/stock_totals", None
+
+
+####################
+## def runLoad () ##
+####################
+# Run every client at once against the server
+def runLoad(address, clients, requests, batchSize=20, seed=0):
+    """Make requests from several clients at the same time
+
+    Args:
+        address (tuple): the (host, port) of the server
+        clients (int): the number of clients making requests at once
+        requests (int): the requests made by each client
+        batchSize (int): the movements sent in each movements request
+        seed (int): seed for the random numbers
+
+    Returns:
+        tuple: (dict of the latencies in milliseconds of each kind of request,
+            dict of the count of each status returned for each kind, seconds
+            taken)
+    """
+    conn = http.client.HTTPConnection(*address, timeout=30)
+    conn.request("GET", "/api/stock_totals")
+    stockIds = [row[0] for row in json.loads(conn.getresponse().read())["rows"]]
+    conn.close()
+
+    scanners = [ScannerClient(address, stockIds, batchSize, seed + n) for n in range(clients)]
+    threads = [threading.Thread(target=scanner.run, args=(requests,)) for scanner in scanners]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    timings = defaultdict(list)
+    statuses = defaultdict(lambda: defaultdict(int))
+    for scanner in scanners:
+        for kind, values in scanner.timings.items():
+            timings[kind].extend(values)
+        for kind, counts in scanner.statuses.items():
+            for status, count in counts.items():
+                statuses[kind][status] += count
+    return timings, statuses, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the HTTP API with several scanner stations at once")
+    parser.add_argument("--clients", type=int, default=8, help="scanner stations making requests at once")
+    parser.add_argument("--requests", type=int, default=500, help="requests made by each station")
+    parser.add_argument("--batch-size", type=int, default=20, help="movements in each movements request")
+    parser.add_argument("--threads", type=int, default=DEFAULT_THREADS, help="requests the local server handles at once")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the random numbers")
+    parser.add_argument("--url", help="server to test, rather than serving a new database on localhost")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workDir:
+        serverProcess = None
+        if args.url:
+            url = urlsplit(args.url)
+            address = (url.hostname, url.port or 80)
+        else:
+            dbPath = Path(workDir) / "stock_database.db"
+            initialiseDb(dbPath)
+            # The server runs in its own process so that the clients do not
+            # share its interpreter lock
+            context = multiprocessing.get_context("spawn")
+            addresses = context.Queue()
+            stop = context.Event()
+            serverProcess = context.Process(target=serveApi, args=(dbPath, args.threads, addresses, stop))
+            serverProcess.start()
+            address = addresses.get(timeout=30)
+        try:
+            timings, statuses, elapsed = runLoad(address, args.clients, args.requests, args.batch_size, args.seed)
+        finally:
+            if serverProcess is not None:
+                stop.set()
+                serverProcess.join()
+
+    total = sum(len(values) for values in timings.values())
+    print(f"{total} requests from {args.clients} clients in {elapsed:.2f}s ({total / elapsed:.0f} per second)")
+    print(f"{'request':14} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}  statuses")
+    for kind in REQUEST_MIX:
+        values = sorted(timings[kind])
+        if not values:
+            continue
+        counts = ", ".join(f"{status}: {count}" for status, count in sorted(statuses[kind].items()))
+        print(f"{kind:14} {len(values):7} {percentile(values, 50):9.3f} {percentile(values, 95):9.3f} "
+              f"{percentile(values, 99):9.3f} {values[-1]:9.3f}  {counts}")
+
+
+if __name__ == "__main__":
+    main()
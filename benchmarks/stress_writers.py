@@ -0,0 +1,180 @@
+# Runs several stations writing to one database at the same time, as the
+# receiving dock and pick stations do, then checks that the ledger still adds
+# up.
+#
+# Run with: python -m benchmarks.stress_writers [--pickers N]
+#     [--operations N] [--busy-timeout SECONDS] [--rollback-journal]
+import argparse
+import multiprocessing
+import random
+import sqlite3 as sql
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import date, timedelta
+from pathlib import Path
+
+from A1_inventory_management.database_init import initialiseDb
+from A1_inventory_management.inventory_store import DEFAULT_BUSY_TIMEOUT, DatabaseBusyError, InventoryStore
+
+
+####################
+## def station () ##
+####################
+# Make a station's writes, counting how each one turned out
+def station(dbPath, role, stockIds, operations, seed, busyTimeout):
+    """Make writes to the database as one station
+
+    Args:
+        dbPath (string or Path): the shared database
+        role (string): 'dock' adds batches. 'picker' removes stock, either by
+            stock type or from a single batch
+        stockIds (list): ids of the stock types to add and remove
+        operations (int): the number of writes to make
+        seed (int): seed for the random numbers
+        busyTimeout (float): seconds to wait for another station's write
+
+    Returns:
+        Counter: the number of writes that were made, that were turned down
+            because there was not enough stock, and that gave up because the
+            database was busy
+    """
+    store = InventoryStore(dbPath, busyTimeout=busyTimeout)
+    rng = random.Random(seed)
+    today = date.today().isoformat()
+    useBy = (date.today() + timedelta(days=365)).isoformat()
+    outcomes = Counter()
+    try:
+        for _ in range(operations):
+            try:
+                if role == "dock":
+                    store.add_batch(rng.choice(stockIds), rng.randint(1, 50), today, useBy)
+                elif rng.random() < 0.5:
+                    store.remove_stock(rng.choice(stockIds), rng.randint(1, 10), today, "used")
+                else:
+                    # The quantity is checked before the transaction, as the
+                    # RemovePage does, so another station may take it first
+                    lastBatchId = store.conn.execute("SELECT MAX(id) FROM batches").fetchone()[0]
+                    batch = store.get_batch(rng.randint(1, lastBatchId)) if lastBatchId else None
+                    if batch is None or batch[2] == 0:
+                        outcomes["not enough stock"] += 1
+                        continue
+                    store.remove_from_batch(batch[0], rng.randint(1, batch[2]), today, "used")
+                outcomes["written"] += 1
+            except DatabaseBusyError:
+                outcomes["busy"] += 1
+            except sql.OperationalError as e:
+                # Reads are not retried. With the rollback journal, they can
+                # be locked out while another station commits
+                if (e.sqlite_errorcode or 0) & 0xFF != sql.SQLITE_BUSY:
+                    raise
+                outcomes["busy reading"] += 1
+            except (ValueError, sql.IntegrityError):
+                outcomes["not enough stock"] += 1
+    finally:
+        store.close()
+    return outcomes
+
+
+########################
+## def checkLedger () ##
+########################
+# Find every way in which the batches, transactions and totals disagree
+def checkLedger(store):
+    """Check that the stock held agrees with the transactions that made it
+
+    Args:
+        store (InventoryStore): the store to check
+
+    Returns:
+        list: a description of each problem found. Empty if there are none
+    """
+    problems = []
+    for batchId, initial, current, removed in store.conn.execute(
+        "SELECT * FROM ("
+        "  SELECT b.id, b.quantity_initial AS initial, b.quantity_current AS current,"
+        "    (SELECT COALESCE(SUM(quantity), 0) FROM transactions t WHERE t.batch_id = b.id AND t.transaction_type = 'removal') AS removed"
+        "  FROM batches b"
+        ") WHERE initial - removed <> current"
+    ):
+        problems.append(f"batch {batchId}: {initial} added and {removed} removed, but {current} held")
+    for batchId, additions in store.conn.execute(
+        "SELECT b.id, COUNT(t.id) FROM batches b "
+        "LEFT JOIN transactions t ON t.batch_id = b.id AND t.transaction_type = 'addition' AND t.quantity = b.quantity_initial "
+        "GROUP BY b.id HAVING COUNT(t.id) <> 1"
+    ):
+        problems.append(f"batch {batchId}: {additions} matching addition transactions")
+
+    recorded = store.stock_totals().rows
+    store.rebuild_stock_totals()
+    for before, after in zip(recorded, store.stock_totals().rows):
+        if before != after:
+            problems.append(f"stock totals {before} should be {after}")
+
+    recorded = store.conn.execute("SELECT * FROM transaction_daily ORDER BY 1, 2, 3, 4").fetchall()
+    store.rebuild_transaction_daily()
+    if recorded != store.conn.execute("SELECT * FROM transaction_daily ORDER BY 1, 2, 3, 4").fetchall():
+        problems.append("daily transaction totals disagree with the transactions")
+    return problems
+
+
+######################
+## def runStress () ##
+######################
+# Run a dock and several pickers against one database at once
+def runStress(dbPath, pickers=2, operations=200, busyTimeout=DEFAULT_BUSY_TIMEOUT, seed=0):
+    """Run a dock station and `pickers` pick stations in separate processes,
+    all writing to dbPath at the same time
+
+    Args:
+        dbPath (string or Path): the shared database
+        pickers (int): the number of pick stations
+        operations (int): the number of writes made by each station
+        busyTimeout (float): seconds each station waits for another's write
+        seed (int): seed for the random numbers. Each station adds its
+            number to it, so that they make different writes
+
+    Returns:
+        tuple: (Counter of the outcomes of every station's writes, seconds
+            taken)
+    """
+    roles = ["dock"] + ["picker"] * pickers
+    store = InventoryStore(dbPath)
+    stockIds = list(store.stock_names())
+    store.close()
+    context = multiprocessing.get_context("spawn")
+    start = time.perf_counter()
+    with context.Pool(len(roles)) as pool:
+        results = pool.starmap(station, [(dbPath, role, stockIds, operations, seed + n, busyTimeout) for n, role in enumerate(roles)])
+    return sum(results, Counter()), time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the ledger after several stations write to one database at once")
+    parser.add_argument("--pickers", type=int, default=2, help="number of pick stations")
+    parser.add_argument("--operations", type=int, default=500, help="writes made by each station")
+    parser.add_argument("--busy-timeout", type=float, default=DEFAULT_BUSY_TIMEOUT, help="seconds to wait for another station")
+    parser.add_argument("--rollback-journal", action="store_true", help="use the rollback journal rather than WAL")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workDir:
+        dbPath = Path(workDir) / "stock_database.db"
+        initialiseDb(dbPath, walMode=not args.rollback_journal)
+        outcomes, elapsed = runStress(dbPath, args.pickers, args.operations, args.busy_timeout)
+        store = InventoryStore(dbPath)
+        problems = checkLedger(store)
+        store.close()
+
+    total = sum(outcomes.values())
+    print(f"{total} writes from {args.pickers + 1} stations in {elapsed:.2f}s ({total / elapsed:.0f} per second)")
+    for outcome, count in sorted(outcomes.items()):
+        print(f"  {outcome}: {count}")
+    for problem in problems:
+        print(problem)
+    print("Ledger is consistent" if not problems else f"{len(problems)} ledger problems found")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
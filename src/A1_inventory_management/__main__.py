@@ -1,7 +1,9 @@
 import A1_inventory_management.core as qc
 from A1_inventory_management.database_init import initialiseDb
+from A1_inventory_management.instrumentation import enableFromEnvironment
 
 if __name__ == "__main__":
+    enableFromEnvironment()
     initialiseDb()
     app = qc.App()
     app.mainloop()
\ No newline at end of file
@@ -0,0 +1,506 @@
+# This file defines a local HTTP service through which scanner stations add
+# and remove stock without the app. It takes and returns JSON and needs only
+# the standard library. Searches are answered by a pool of threads, each with
+# its own connection to the database. Every change is handed to one writer
+# thread, which commits all of the changes that arrived while it was busy in
+# a single transaction.
+#
+# Run with: python -m A1_inventory_management.api_server [--host HOST]
+#     [--port PORT] [--threads N]
+#
+# Endpoints:
+#   POST /api/add           {"stock", "quantity", "delivered_at", "use_by"}
+#   POST /api/remove        {"batch_id", "quantity", "date", "reason"}
+#   POST /api/remove_stock  {"stock", "quantity", "date", "reason"}
+#   POST /api/add_stock_type
+#                           {"name"}
+#   POST /api/rename_stock_type
+#                           {"stock", "name"}
+#   POST /api/retire_stock_type
+#                           {"stock"}, so that no more batches can be added
+#   POST /api/restore_stock_type
+#                           {"stock"}
+#   POST /api/movements     {"movements": [...]}, each with an "action" of
+#                           one of the above and that action's fields,
+#                           applied together or not at all
+#   GET  /api/batches       ?batch_id, stock, delivered_from, delivered_to,
+#                           use_by_from, use_by_to, after_id, limit
+#   GET  /api/transactions  ?stock, transaction_type, removal_reason,
+#                           occured_from, occured_to, after_id, limit
+#   GET  /api/stock_totals  ?stock
+#   GET  /api/stock_types   ?prefix, include_retired, limit
+#   GET  /metrics           the metrics recorded by the instrumentation, in
+#                           the Prometheus text format
+import argparse
+import json
+import queue
+import sqlite3 as sql
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from A1_inventory_management.database_init import G_DB_PATH, initialiseDb
+from A1_inventory_management.instrumentation import METRICS, enableFromEnvironment, isEnabled, timed, timer, writeMetrics
+from A1_inventory_management.inventory_store import REMOVAL_REASONS, DatabaseBusyError, InventoryStore
+from A1_inventory_management.query_builder import BATCHES, TRANSACTIONS, SearchQuery
+from A1_inventory_management.utils.datetime_helpers import isDate
+from A1_inventory_management.validation import checkAddition, checkRemoval, checkStockRemoval
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8080
+
+# Requests handled at once. Each keeps its connection open between requests
+# until the client closes it or it is idle for REQUEST_TIMEOUT seconds
+DEFAULT_THREADS = 8
+REQUEST_TIMEOUT = 5
+
+# The most movements requests committed together by the writer
+MAX_GROUP = 64
+
+# The most rows a search returns, and the most movements in one request
+MAX_LIMIT = 1000
+MAX_MOVEMENTS = 1000
+
+# Searches answered by GET, each timed under its own name
+SEARCH_PATHS = ("/api/batches", "/api/transactions", "/api/stock_totals", "/api/stock_types")
+
+# The fields of each action, and the type each must be given as
+ACTION_FIELDS = {
+    "add": {"stock": (str, int), "quantity": int, "delivered_at": str, "use_by": str},
+    "remove": {"batch_id": int, "quantity": int, "date": str, "reason": str},
+    "remove_stock": {"stock": (str, int), "quantity": int, "date": str, "reason": str},
+    "add_stock_type": {"name": str},
+    "rename_stock_type": {"stock": (str, int), "name": str},
+    "retire_stock_type": {"stock": (str, int)},
+    "restore_stock_type": {"stock": (str, int)},
+}
+
+# Actions that change the catalog of stock types rather than the stock held
+CATALOG_ACTIONS = ("add_stock_type", "rename_stock_type", "retire_stock_type", "restore_stock_type")
+
+
+class MovementError(ValueError):
+    """Raised for a movement that is not valid. fields lists the fields that
+    failed their checks, and index is the position of the movement in its
+    request"""
+    def __init__(self, message, fields=(), index=None):
+        super().__init__(message)
+        self.fields = list(fields)
+        self.index = index
+
+
+##########################
+## def applyMovement () ##
+##########################
+# Check and make a single addition or removal
+def applyMovement(store, movement):
+    """Check a movement as the pages do, and then make it
+
+    Args:
+        store (InventoryStore): the store to change
+        movement (dict): the "action" and the fields it takes, as listed in
+            ACTION_FIELDS
+
+    Raises:
+        MovementError: if the action is not known, or a field is missing or
+            fails its check. The database is not altered.
+        ValueError: if there is not enough stock to remove, or a stock type
+            cannot be given a name
+
+    Returns:
+        dict: for add, the batch_id of the new batch. For remove, the
+            stock_id of the batch. For remove_stock, the batches removed from
+            as [batch id, quantity taken] pairs. For the catalog actions, the
+            stock_id of the stock type
+    """
+    action = movement.get("action") if isinstance(movement, dict) else None
+    if action not in ACTION_FIELDS:
+        raise MovementError(f"Unknown action {action!r}", ["action"])
+    wrongType = [
+        name for name, kind in ACTION_FIELDS[action].items()
+        if not isinstance(movement.get(name), kind) or isinstance(movement.get(name), bool)
+    ]
+    if wrongType:
+        raise MovementError(f"Missing or invalid fields: {', '.join(wrongType)}", wrongType)
+
+    if action in CATALOG_ACTIONS:
+        return _applyCatalogChange(store, action, movement)
+    if action == "add":
+        stock = str(movement["stock"])
+        checks = checkAddition(store, stock, movement["quantity"], movement["delivered_at"], movement["use_by"])
+    elif action == "remove":
+        checks = checkRemoval(store, movement["batch_id"], movement["quantity"], movement["date"], movement["reason"])
+    else:
+        stock = str(movement["stock"])
+        checks = checkStockRemoval(store, stock, movement["quantity"], movement["date"], movement["reason"])
+    if "removalReason" in checks:
+        checks["removalReason"] = movement["reason"] in REMOVAL_REASONS
+    failed = [name for name, passed in checks.items() if passed is False]
+    if failed:
+        raise MovementError(f"Fields failed their checks: {', '.join(failed)}", failed)
+
+    if action == "add":
+        stockId = store.resolve_stock_id(stock)
+        return {"batch_id": store.add_batch(stockId, movement["quantity"], movement["delivered_at"], movement["use_by"])}
+    if action == "remove":
+        return {"stock_id": store.remove_from_batch(movement["batch_id"], movement["quantity"], movement["date"], movement["reason"])}
+    stockId = store.resolve_stock_id(stock)
+    allocation = store.remove_stock(stockId, movement["quantity"], movement["date"], movement["reason"])
+    return {"batches": [list(pair) for pair in allocation]}
+
+
+def _applyCatalogChange(store, action, movement):
+    if action == "add_stock_type":
+        return {"stock_id": store.add_stock_type(movement["name"])}
+    stockId = store.resolve_stock_id(str(movement["stock"]))
+    if stockId is None:
+        raise MovementError(f"No stock type {movement['stock']}", ["stock"])
+    if action == "rename_stock_type":
+        store.rename_stock_type(stockId, movement["name"])
+    elif action == "retire_stock_type":
+        store.retire_stock_type(stockId)
+    else:
+        store.restore_stock_type(stockId)
+    return {"stock_id": stockId}
+
+
+##########################
+## class MovementWriter ##
+##########################
+# Thread that makes every change, committing those that arrive together at once
+class MovementWriter:
+    """
+    Applies lists of movements on a thread with its own InventoryStore, so
+    that changes from every request are made one at a time. Lists that are
+    waiting when the thread is ready are applied together in one transaction
+    and committed once, up to maxGroup of them. Each list is applied in a
+    savepoint of its own, so a list that fails is undone without undoing the
+    others.
+    """
+    def __init__(self, dbPath=G_DB_PATH, maxGroup=MAX_GROUP, **storeOptions):
+        self.maxGroup = maxGroup
+        self._requests = queue.Queue()
+        self._opened = threading.Event()
+        self._openError = None
+        self._thread = threading.Thread(target=self._run, args=(dbPath, storeOptions), name="MovementWriter", daemon=True)
+        self._thread.start()
+        self._opened.wait()
+        if self._openError is not None:
+            raise self._openError
+
+    def submit(self, movements):
+        """Queue a list of movements to be applied together
+
+        Args:
+            movements (list): the movements, as taken by applyMovement
+
+        Returns:
+            Future: resolves to the list of each movement's result once they
+                are committed, or raises the error of the first that failed
+                with its index recorded
+        """
+        future = Future()
+        self._requests.put((movements, future))
+        return future
+
+    def close(self):
+        """Apply the movements already queued and stop the thread"""
+        self._requests.put(None)
+        self._thread.join()
+
+    def _run(self, dbPath, storeOptions):
+        try:
+            store = InventoryStore(dbPath, **storeOptions)
+        except BaseException as e:
+            self._openError = e
+            return
+        finally:
+            self._opened.set()
+
+        try:
+            stopping = False
+            while not stopping:
+                group = [self._requests.get()]
+                while len(group) < self.maxGroup:
+                    try:
+                        group.append(self._requests.get_nowait())
+                    except queue.Empty:
+                        break
+                if None in group:
+                    stopping = True
+                    group = [request for request in group if request is not None]
+                if group:
+                    self._applyGroup(store, group)
+        finally:
+            store.close()
+
+    @timed()
+    def _applyGroup(self, store, group):
+        outcomes = []
+        try:
+            with store.transaction():
+                for movements, future in group:
+                    try:
+                        with store.transaction():
+                            outcomes.append((future, self._applyAll(store, movements), None))
+                    except Exception as e:
+                        outcomes.append((future, None, e))
+        except Exception as e:
+            # The group could not be committed, so none of it was made
+            for movements, future in group:
+                future.set_exception(e)
+            return
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+    def _applyAll(self, store, movements):
+        results = []
+        for index, movement in enumerate(movements):
+            try:
+                results.append(applyMovement(store, movement))
+            except MovementError as e:
+                e.index = index
+                raise
+            except ValueError as e:
+                raise MovementError(str(e), index=index) from e
+        return results
+
+
+###########################
+## class InventoryServer ##
+###########################
+# HTTP server that answers requests on a pool of threads
+class InventoryServer(ThreadingHTTPServer):
+    """
+    Serves the API on address, a (host, port) pair. Port 0 picks a free
+    port, which can then be read from server_address. Requests are handled by
+    a pool of threads rather than a new thread for each, and every change is
+    made by a MovementWriter.
+
+    Args:
+        address (tuple): the (host, port) to listen on
+        dbPath (string or Path): the stock database
+        threads (int): the number of requests handled at once
+        logRequests (bool): whether to print a line for each request
+    """
+    daemon_threads = True
+
+    def __init__(self, address, dbPath=G_DB_PATH, threads=DEFAULT_THREADS, logRequests=False, **storeOptions):
+        self.dbPath = dbPath
+        self.logRequests = logRequests
+        self.storeOptions = storeOptions
+        self.writer = MovementWriter(dbPath, **storeOptions)
+        self._pool = ThreadPoolExecutor(threads, thread_name_prefix="InventoryRequest")
+        self._local = threading.local()
+        self._stores = []
+        self._storesLock = threading.Lock()
+        super().__init__(address, ApiRequestHandler)
+
+    def process_request(self, request, clientAddress):
+        self._pool.submit(self.process_request_thread, request, clientAddress)
+
+    def readStore(self):
+        """Get the InventoryStore of the calling thread, opening it the first
+        time the thread asks"""
+        store = getattr(self._local, "store", None)
+        if store is None:
+            store = InventoryStore(self.dbPath, **self.storeOptions)
+            self._local.store = store
+            with self._storesLock:
+                self._stores.append(store)
+        return store
+
+    def server_close(self):
+        super().server_close()
+        self._pool.shutdown(wait=True)
+        self.writer.close()
+        with self._storesLock:
+            for store in self._stores:
+                store.close()
+            self._stores = []
+
+
+#############################
+## class ApiRequestHandler ##
+#############################
+# Turns each HTTP request into a search or movements for the writer
+class ApiRequestHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 keeps the connection open, so a scanner making many requests
+    # does not connect again for each
+    protocol_version = "HTTP/1.1"
+    timeout = REQUEST_TIMEOUT
+    # The headers and body of a response are written separately. Without
+    # this, the body waits for the client to acknowledge the headers, which
+    # it delays by up to 40ms on a kept-open connection
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == "/metrics":
+            self._sendText(200, METRICS.prometheusText(), "text/plain; version=0.0.4")
+            return
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        store = self.server.readStore()
+        with timer(f"GET {url.path}" if url.path in SEARCH_PATHS else "GET other"):
+            self._answerSearch(store, url.path, params)
+
+    def _answerSearch(self, store, path, params):
+        try:
+            if path == "/api/batches":
+                self._sendSearch(store, BATCHES, params, {
+                    "batchId": _intParam(params, "batch_id"),
+                    "stockId": _stockParam(store, params),
+                    "deliveredAt": _rangeParam(params, "delivered"),
+                    "useBy": _rangeParam(params, "use_by"),
+                })
+            elif path == "/api/transactions":
+                self._sendSearch(store, TRANSACTIONS, params, {
+                    "stockId": _stockParam(store, params),
+                    "transactionType": params.get("transaction_type"),
+                    "removalReason": params.get("removal_reason"),
+                    "occuredAt": _rangeParam(params, "occured"),
+                })
+            elif path == "/api/stock_totals":
+                columns, rows = store.stock_totals(_stockParam(store, params))
+                self._sendJson(200, {"columns": columns, "rows": rows})
+            elif path == "/api/stock_types":
+                columns, rows = store.find_stock_types(
+                    params.get("prefix", ""), params.get("include_retired", "1") != "0", _limitParam(params)
+                )
+                self._sendJson(200, {"columns": columns, "rows": rows})
+            else:
+                self._sendJson(404, {"error": f"No such endpoint {path}"})
+        except MovementError as e:
+            self._sendJson(400, {"error": str(e), "fields": e.fields})
+        except DatabaseBusyError as e:
+            self._sendJson(503, {"error": str(e)})
+
+    def do_POST(self):
+        path = urlsplit(self.path).path
+        try:
+            body = self._readJson()
+        except MovementError as e:
+            self._sendJson(400, {"error": str(e)})
+            return
+        action = path.removeprefix("/api/")
+        if path == "/api/movements":
+            movements = body.get("movements") if isinstance(body, dict) else None
+            if not isinstance(movements, list) or not 0 < len(movements) <= MAX_MOVEMENTS:
+                self._sendJson(400, {"error": f"movements must be a list of 1 to {MAX_MOVEMENTS} movements"})
+                return
+        elif path.startswith("/api/") and action in ACTION_FIELDS:
+            if not isinstance(body, dict):
+                self._sendJson(400, {"error": "The body must be a JSON object"})
+                return
+            movements = [dict(body, action=action)]
+        else:
+            self._sendJson(404, {"error": f"No such endpoint {path}"})
+            return
+
+        try:
+            with timer(f"POST {path}"):
+                results = self.server.writer.submit(movements).result()
+        except MovementError as e:
+            self._sendJson(400 if e.fields else 409, {"error": str(e), "fields": e.fields, "index": e.index})
+        except DatabaseBusyError as e:
+            self._sendJson(503, {"error": str(e)})
+        except sql.Error:
+            self._sendJson(500, {"error": "The database could not be altered"})
+        else:
+            if path == "/api/movements":
+                self._sendJson(200, {"results": results})
+            else:
+                self._sendJson(201 if action in ("add", "add_stock_type") else 200, results[0])
+
+    def log_message(self, format, *args):
+        if self.server.logRequests:
+            super().log_message(format, *args)
+
+    def _sendSearch(self, store, table, params, filters):
+        query = SearchQuery(table, filters, afterId=_intParam(params, "after_id"), limit=_limitParam(params))
+        columns, rows = store.search(query)
+        self._sendJson(200, {"columns": columns, "rows": rows})
+
+    def _sendText(self, status, text, contentType):
+        data = text.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", contentType)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _readJson(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            return json.loads(self.rfile.read(length))
+        except (ValueError, UnicodeDecodeError) as e:
+            raise MovementError(f"The body is not valid JSON: {e}") from e
+
+    def _sendJson(self, status, body):
+        self._sendText(status, json.dumps(body), "application/json")
+
+
+def _intParam(params, name):
+    value = params.get(name)
+    if value is None:
+        return None
+    if not value.isdigit():
+        raise MovementError(f"{name} must be a whole number", [name])
+    return int(value)
+
+
+def _limitParam(params):
+    limit = _intParam(params, "limit")
+    if limit is None or not 0 < limit <= MAX_LIMIT:
+        return MAX_LIMIT
+    return limit
+
+
+def _stockParam(store, params):
+    if "stock" not in params:
+        return None
+    stockId = store.resolve_stock_id(params["stock"])
+    if stockId is None:
+        raise MovementError(f"No stock type {params['stock']}", ["stock"])
+    return stockId
+
+
+def _rangeParam(params, prefix):
+    # A range needs both ends, as the check pages do
+    start = params.get(f"{prefix}_from")
+    end = params.get(f"{prefix}_to")
+    if start is None and end is None:
+        return None
+    if not (start and end and isDate(start) and isDate(end)):
+        raise MovementError(f"{prefix}_from and {prefix}_to must both be dates", [f"{prefix}_from", f"{prefix}_to"])
+    return (start, end)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the stock database to scanner stations over HTTP")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="address to listen on")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="port to listen on")
+    parser.add_argument("--threads", type=int, default=DEFAULT_THREADS, help="requests handled at once")
+    parser.add_argument("--db", default=G_DB_PATH, help="path of the stock database")
+    args = parser.parse_args()
+
+    enableFromEnvironment()
+    initialiseDb(args.db)
+    server = InventoryServer((args.host, args.port), args.db, args.threads, logRequests=True)
+    print(f"Serving {args.db} on http://{server.server_address[0]}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if isEnabled():
+            writeMetrics()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+# This file moves closed years of the transactions ledger out of the stock
+# database into an archive file for each year, so that the stock database
+# holds only recent stock and stays small. Each archive is named after the
+# stock database and the year, such as stock_database_2023.db, and kept in
+# the same folder. InventoryStore attaches an archive when a search reaches
+# into its year, so that archived history can still be searched.
+#
+# Run with: python -m A1_inventory_management.archive [--before YEAR]
+#     [--vacuum] [--db PATH]
+import argparse
+import sqlite3 as sql
+from datetime import date
+from pathlib import Path
+
+from A1_inventory_management.database_init import G_DB_PATH, initialiseDb
+from A1_inventory_management.inventory_store import InventoryStore
+from A1_inventory_management.utils.datetime_helpers import fromDayNumber, toDayNumber
+
+ARCHIVE_SCHEMA_PATH = Path(__file__).parent / "dbs/db_archive_code.sql"
+
+# Columns copied to the archive. The generated date columns are made again
+# from them
+BATCH_COLUMNS = "id, stock_id, quantity_initial, quantity_current, delivered_day, recorded_at, use_by_day"
+TRANSACTION_COLUMNS = "id, transaction_type, batch_id, stock_id, quantity, removal_reason, occured_day, recorded_at"
+
+
+########################
+## def archivePath () ##
+########################
+# Find where the archive of a year is kept
+def archivePath(dbPath, year):
+    """The path of the archive file of a year
+
+    Args:
+        dbPath (string or Path): the stock database
+        year (int): the year archived
+
+    Returns:
+        Path: the archive file, beside the stock database
+    """
+    dbPath = Path(dbPath)
+    return dbPath.with_name(f"{dbPath.stem}_{year}.db")
+
+
+########################
+## def archiveYear () ##
+########################
+# Move a year of transactions, and the batches emptied in it, to its archive
+def archiveYear(store, year, today=None):
+    """Move the transactions dated in a year, and the batches emptied in
+    that year, from the stock database into the year's archive.
+
+    Years are archived in order, so every earlier year must already be
+    archived. The end of each month of the year is checkpointed first, and
+    the daily totals and checkpoints are kept, so stock levels and reports
+    of recent dates do not read the archive.
+
+    The rows are copied to the archive and committed, and then deleted from
+    the stock database along with recording the archive in archived_years.
+    If archiving is stopped between the two, archiving the year again
+    finishes it, as rows already in the archive are left as they are.
+
+    Args:
+        store (InventoryStore): the store to archive from
+        year (int): the year to archive
+        today (string): the current date, YYYY-MM-DD. If None, today's date
+
+    Raises:
+        ValueError: if the year has not ended, or an earlier year still has
+            transactions in the stock database
+
+    Returns:
+        dict: the number of transactions and batches moved
+    """
+    firstDay = toDayNumber(f"{year}-01-01")
+    lastDay = toDayNumber(f"{year}-12-31")
+    if lastDay >= toDayNumber(today if today is not None else date.today().isoformat()):
+        raise ValueError(f"{year} has not ended, so it cannot be archived")
+    # Deleting a batch deletes its transactions, so every transaction of an
+    # archived batch must already have been moved
+    if store.conn.execute("SELECT 1 FROM transactions WHERE occured_day < ? LIMIT 1", (firstDay,)).fetchone():
+        raise ValueError(f"The years before {year} must be archived first")
+
+    store.update_checkpoints(through=f"{year + 1}-01-01")
+
+    path = archivePath(store.dbPath, year)
+    with open(ARCHIVE_SCHEMA_PATH) as f:
+        archiveSchema = f.read()
+    archive = sql.connect(path)
+    archive.executescript(archiveSchema)
+    archive.close()
+
+    conn = store.conn
+    conn.execute("ATTACH DATABASE ? AS archive_target", (str(path),))
+    try:
+        # Only the archive is written, so the stock database is not locked
+        # while the rows are copied
+        conn.execute("BEGIN")
+        try:
+            conn.execute(
+                f"INSERT OR IGNORE INTO archive_target.batches ({BATCH_COLUMNS}) "
+                f"SELECT {BATCH_COLUMNS} FROM main.batches b "
+                "WHERE b.quantity_current = 0 AND b.delivered_day <= ? AND NOT EXISTS ("
+                "  SELECT 1 FROM main.transactions t WHERE t.batch_id = b.id AND (t.occured_day IS NULL OR t.occured_day > ?)"
+                ")",
+                (lastDay, lastDay)
+            )
+            conn.execute(
+                f"INSERT OR IGNORE INTO archive_target.transactions ({TRANSACTION_COLUMNS}) "
+                f"SELECT {TRANSACTION_COLUMNS} FROM main.transactions WHERE occured_day BETWEEN ? AND ?",
+                (firstDay, lastDay)
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+        with store.transaction() as cur:
+            cur.execute("INSERT INTO archiving (year) VALUES (?)", (year,))
+            movedTransactions = cur.execute(
+                "DELETE FROM main.transactions WHERE id IN (SELECT id FROM archive_target.transactions)"
+            ).rowcount
+            movedBatches = cur.execute(
+                "DELETE FROM main.batches WHERE id IN (SELECT id FROM archive_target.batches)"
+            ).rowcount
+            cur.execute("DELETE FROM archiving")
+            cur.execute(
+                "INSERT OR REPLACE INTO archived_years (year, file_name, transaction_count, batch_count) "
+                "VALUES (?, ?, (SELECT COUNT(*) FROM archive_target.transactions), (SELECT COUNT(*) FROM archive_target.batches))",
+                (year, path.name)
+            )
+    finally:
+        conn.execute("DETACH DATABASE archive_target")
+    store.invalidate_archives()
+    return {"transactions": movedTransactions, "batches": movedBatches}
+
+
+###############################
+## def archiveClosedYears () ##
+###############################
+# Archive every year with transactions that ended before a year
+def archiveClosedYears(store, before=None, today=None):
+    """Archive each year, in order, from the first with transactions in the
+    stock database up to the year before before. Years without any
+    transactions are skipped
+
+    Args:
+        store (InventoryStore): the store to archive from
+        before (int): archive the years before this one. If None, every year
+            that has ended
+        today (string): the current date, YYYY-MM-DD. If None, today's date
+
+    Returns:
+        dict: the number of transactions and batches moved for each year
+    """
+    currentYear = int((today if today is not None else date.today().isoformat())[:4])
+    before = currentYear if before is None else min(before, currentYear)
+    first = store.conn.execute("SELECT MIN(occured_day) FROM transactions").fetchone()[0]
+    if first is None:
+        return {}
+    moved = {}
+    for year in range(int(fromDayNumber(first)[:4]), before):
+        if store.conn.execute(
+            "SELECT 1 FROM transactions WHERE occured_day BETWEEN ? AND ? LIMIT 1",
+            (toDayNumber(f"{year}-01-01"), toDayNumber(f"{year}-12-31"))
+        ).fetchone():
+            moved[year] = archiveYear(store, year, today)
+    return moved
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move closed years of transactions out of the stock database into archive files")
+    parser.add_argument("--before", type=int, help="archive the years before this one. Every year that has ended by default")
+    parser.add_argument("--vacuum", action="store_true", help="shrink the stock database file afterwards")
+    parser.add_argument("--db", default=G_DB_PATH, help="path of the stock database")
+    args = parser.parse_args()
+
+    initialiseDb(args.db)
+    store = InventoryStore(args.db)
+    try:
+        moved = archiveClosedYears(store, args.before)
+        for year, counts in moved.items():
+            print(f"{year}: moved {counts['transactions']} transactions and {counts['batches']} batches to {archivePath(args.db, year)}")
+        if not moved:
+            print("There are no closed years to archive")
+        if args.vacuum:
+            # The space freed by the moved rows is only given back to the
+            # file system by VACUUM, which rewrites the whole file
+            store.conn.execute("VACUUM")
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+# This file defines the bulk import of supplier delivery manifests. A manifest
+# is read a chunk at a time, each row is checked with the same rules as the
+# AddPage form, and the valid rows are written to the batches and transactions
+# tables in a single transaction.
+import csv
+from collections import namedtuple
+from datetime import date, datetime
+from itertools import islice
+from pathlib import Path
+
+from A1_inventory_management.inventory_store import TRANSACTION_TYPE_ADDITION_STRING
+from A1_inventory_management.utils.datetime_helpers import EPOCH_DATE
+
+# Columns a manifest must contain. They match the fields of the AddPage form
+MANIFEST_COLUMNS = ["name", "quantity", "delivered_at", "use_by"]
+
+DEFAULT_CHUNK_SIZE = 1000
+
+# Outcome of an import. errors is a list of (row number, message) tuples, where
+# row 1 is the header row of the manifest
+ImportReport = namedtuple("ImportReport", ["imported", "errors"])
+
+
+class ManifestError(ValueError):
+    """Raised when a manifest cannot be read at all, such as when it is missing
+    one of the MANIFEST_COLUMNS"""
+
+
+#############################
+## def importDeliveries () ##
+#############################
+# Validate a delivery manifest and add every valid row as a new batch
+def importDeliveries(store, path, chunkSize=DEFAULT_CHUNK_SIZE, dryRun=False):
+    """Import a supplier delivery manifest as new batches.
+
+    Rows are validated against the same rules as the AddPage form. Valid rows
+    are inserted with executemany a chunk at a time, and the whole import is
+    committed as one transaction. Invalid rows are skipped and listed in the
+    returned report.
+
+    Args:
+        store (InventoryStore): the store to import into
+        path (string or Path): a .csv, .xlsx or .xls manifest with the columns
+            name, quantity, delivered_at and use_by
+        chunkSize (int): the number of rows validated and inserted at a time
+        dryRun (bool): if True, validate the manifest without writing to
+            the database
+
+    Returns:
+        ImportReport: the number of batches imported (or that would be
+            imported on a dry run) and the errors found
+    """
+    # Take the index of the stock names once so that each row is checked
+    # without a query
+    validator = _RowValidator(store.stock_name_index())
+    imported = 0
+    errors = []
+    rows = readManifest(path)
+
+    if dryRun:
+        for chunk in _chunks(rows, chunkSize):
+            valid, chunkErrors = validator.validate(chunk)
+            imported += len(valid)
+            errors.extend(chunkErrors)
+        return ImportReport(imported, errors)
+
+    with store.transaction() as cur:
+        for chunk in _chunks(rows, chunkSize):
+            valid, chunkErrors = validator.validate(chunk)
+            errors.extend(chunkErrors)
+            if not valid:
+                continue
+            # New batches are given ids above the current highest, so the
+            # matching transactions can be written with one set-based insert
+            lastId = cur.execute("SELECT COALESCE(MAX(id), 0) FROM batches").fetchone()[0]
+            cur.executemany(
+                "INSERT INTO batches (stock_id, quantity_initial, quantity_current, delivered_day, use_by_day) VALUES (?, ?, ?, ?, ?)",
+                valid
+            )
+            cur.execute(
+                "INSERT INTO transactions (transaction_type, batch_id, stock_id, quantity, occured_day) "
+                "SELECT ?, id, stock_id, quantity_initial, delivered_day FROM batches WHERE id > ? ORDER BY id",
+                (TRANSACTION_TYPE_ADDITION_STRING, lastId)
+            )
+            imported += len(valid)
+    return ImportReport(imported, errors)
+
+
+#########################
+## def readManifest () ##
+#########################
+# Stream the rows of a manifest as (row number, dict) pairs
+def readManifest(path, columns=MANIFEST_COLUMNS, optionalColumns=()):
+    """Read the rows of a delivery manifest, or another file with a header
+    row, one at a time
+
+    Args:
+        path (string or Path): a .csv, .xlsx or .xls file
+        columns (list): the columns the file must have
+        optionalColumns (list): columns read if the file has them
+
+    Raises:
+        ManifestError: if the file is empty or is missing one of columns
+
+    Yields:
+        tuple: (row number, dict of the columns, and of the optionalColumns
+            the file has, for that row)
+    """
+    path = Path(path)
+    if path.suffix.lower() in (".xlsx", ".xlsm", ".xls"):
+        rows = _readSpreadsheetRows(path)
+    else:
+        rows = _readCsvRows(path)
+
+    header = next(rows, None)
+    if header is None:
+        raise ManifestError(f"{path.name} is empty")
+    header = [str(h).strip().lower() if h is not None else "" for h in header]
+    missing = [c for c in columns if c not in header]
+    if missing:
+        raise ManifestError(f"{path.name} is missing the column(s): {', '.join(missing)}")
+    columns = list(columns) + [c for c in optionalColumns if c in header]
+    positions = [header.index(c) for c in columns]
+
+    for rowNumber, row in enumerate(rows, start=2):
+        # Skip blank lines
+        if not any(v not in (None, "") for v in row):
+            continue
+        yield rowNumber, {c: (row[p] if p < len(row) else None) for c, p in zip(columns, positions)}
+
+
+def _readCsvRows(path):
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        yield from csv.reader(f)
+
+
+def _readSpreadsheetRows(path):
+    # python-calamine is the faster reader, so openpyxl is only used if it is
+    # not installed
+    try:
+        from python_calamine import CalamineWorkbook
+    except ImportError:
+        from openpyxl import load_workbook
+        workbook = load_workbook(path, read_only=True, data_only=True)
+        try:
+            yield from workbook.worksheets[0].iter_rows(values_only=True)
+        finally:
+            workbook.close()
+        return
+    workbook = CalamineWorkbook.from_path(str(path))
+    yield from workbook.get_sheet_by_index(0).iter_rows()
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+#########################
+## class _RowValidator ##
+#########################
+# Checks manifest rows against the AddPage rules, caching the dates it has seen
+class _RowValidator:
+    def __init__(self, stockIndex):
+        self.stockIndex = stockIndex
+        self.today = datetime.now().date()
+        # Deliveries share a small number of dates, so each distinct value is
+        # only parsed once
+        self.dates = {}
+
+    def validate(self, chunk):
+        """Check a chunk of manifest rows
+
+        Args:
+            chunk (list): (row number, row dict) pairs from readManifest
+
+        Returns:
+            tuple: a list of parameter tuples ready to insert into batches, and
+                a list of (row number, message) errors
+        """
+        valid = []
+        errors = []
+        for rowNumber, row in chunk:
+            problems = []
+
+            name = "" if row["name"] is None else str(row["name"]).strip()
+            if isinstance(row["name"], float) and row["name"].is_integer():
+                name = str(int(row["name"]))
+            stockId = self.stockIndex.resolve(name)
+            if stockId is None:
+                problems.append(f"name/id number '{name}' was not found in database")
+            elif self.stockIndex.isRetired(stockId):
+                problems.append(f"stock type '{name}' has been retired")
+
+            quantity = self._parseQuantity(row["quantity"])
+            if quantity is None:
+                problems.append("quantity must be a positive whole number")
+
+            deliveredAt = self._parseDate(row["delivered_at"])
+            if deliveredAt is None or deliveredAt > self.today:
+                problems.append("delivery date must be in the form YYYY-MM-DD and not in the future")
+
+            useBy = self._parseDate(row["use_by"])
+            if useBy is None or useBy <= self.today:
+                problems.append("use by date must be in the form YYYY-MM-DD and in the future")
+
+            if problems:
+                errors.append((rowNumber, "; ".join(problems)))
+            else:
+                valid.append((stockId, quantity, quantity, (deliveredAt - EPOCH_DATE).days, (useBy - EPOCH_DATE).days))
+        return valid, errors
+
+    def _parseQuantity(self, value):
+        if isinstance(value, bool):
+            return None
+        if isinstance(value, float):
+            value = int(value) if value.is_integer() else None
+        elif isinstance(value, str):
+            value = int(value.strip()) if value.strip().isdigit() else None
+        if isinstance(value, int) and value > 0:
+            return value
+        return None
+
+    def _parseDate(self, value):
+        # Spreadsheet readers may already have turned the cell into a date
+        if isinstance(value, datetime):
+            return value.date()
+        if isinstance(value, date):
+            return value
+        if value is None:
+            return None
+        value = str(value).strip()
+        if value not in self.dates:
+            try:
+                self.dates[value] = datetime.strptime(value, "%Y-%m-%d").date()
+            except ValueError:
+                self.dates[value] = None
+        return self.dates[value]
@@ -0,0 +1,176 @@
+# This file loads a product master, the list of the stock types the company
+# holds, into stock_names. A name that is not in the catalog is added as a new
+# stock type, and one that is has its case and whether it is retired updated
+# from the file. Stock types missing from the file are left as they are. The
+# rows are read into a temporary table, and the catalog is then changed by one
+# UPDATE and one INSERT in a single transaction, so a file of tens of
+# thousands of stock types loads in about the time of one.
+#
+# Run with: python -m A1_inventory_management.catalog FILE [--dry-run]
+#     [--db PATH]
+import argparse
+from collections import namedtuple
+from datetime import date
+
+from A1_inventory_management.bulk_import import ManifestError, readManifest
+from A1_inventory_management.database_init import G_DB_PATH, initialiseDb
+from A1_inventory_management.inventory_store import InventoryStore
+from A1_inventory_management.utils.datetime_helpers import toDayNumber
+from A1_inventory_management.validation import checkStockName
+
+# Columns a product master must contain
+CATALOG_COLUMNS = ["name"]
+
+# Column read if the file has it. Without it, the stock types already in the
+# catalog keep whether they are retired, and new ones are in use
+RETIRED_COLUMN = "retired"
+
+# Values of the retired column, and whether each retires the stock type. A
+# blank cell puts it in use
+RETIRED_VALUES = {"yes": 1, "true": 1, "1": 1, "no": 0, "false": 0, "0": 0, "": 0}
+
+# Outcome of a load. errors is a list of (row number, message) tuples, where
+# row 1 is the header row of the file
+CatalogReport = namedtuple("CatalogReport", ["added", "updated", "unchanged", "errors"])
+
+# A row of the file whose stock type is already in the catalog, and differs
+# from it in the case of its name or in whether it is retired
+_CHANGED = (
+    "stock_names.name = c.name COLLATE NOCASE AND (stock_names.name IS NOT c.name "
+    "OR (c.retired IS NOT NULL AND c.retired <> (stock_names.retired_day IS NOT NULL)))"
+)
+
+# A row of the file whose name is not in the catalog
+_NEW = "NOT EXISTS (SELECT 1 FROM main.stock_names s WHERE s.name = c.name COLLATE NOCASE)"
+
+
+########################
+## def loadCatalog () ##
+########################
+# Add or update a stock type for every valid row of a product master
+def loadCatalog(store, path, dryRun=False, today=None):
+    """Load a product master into the catalog of stock types.
+
+    Each row gives the name of a stock type, and may say whether it is
+    retired. Names are matched to the catalog in any case. Rows that are not
+    valid, or that repeat a name already given in the file, are skipped and
+    listed in the returned report.
+
+    Every valid row is written to a temporary table first. The stock types
+    whose name is already in the catalog are then updated with one UPDATE,
+    and the rest added with one INSERT, in a single transaction. They are
+    added in the order of the file, so their ids follow that order.
+
+    Args:
+        store (InventoryStore): the store to load into
+        path (string or Path): a .csv, .xlsx or .xls file with a name column,
+            and optionally a retired column
+        dryRun (bool): if True, count what would change without changing
+            the catalog
+        today (string): the date stock types are retired on, YYYY-MM-DD. If
+            None, today's date
+
+    Raises:
+        ManifestError: if the file cannot be read, or has no name column
+
+    Returns:
+        CatalogReport: the number of stock types added and updated (or that
+            would be, on a dry run), the number already as the file gives
+            them, and the errors found
+    """
+    retiredDay = toDayNumber(today if today is not None else date.today().isoformat())
+    errors = []
+    conn = store.conn
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS catalog_rows (row_number INTEGER PRIMARY KEY, name TEXT NOT NULL, retired INTEGER)")
+    try:
+        conn.execute("DELETE FROM temp.catalog_rows")
+        conn.executemany(
+            "INSERT INTO temp.catalog_rows (row_number, name, retired) VALUES (?, ?, ?)",
+            _validRows(readManifest(path, CATALOG_COLUMNS, [RETIRED_COLUMN]), errors)
+        )
+        valid = conn.execute("SELECT COUNT(*) FROM temp.catalog_rows").fetchone()[0]
+
+        if dryRun:
+            updated = conn.execute(f"SELECT COUNT(*) FROM temp.catalog_rows c JOIN main.stock_names ON {_CHANGED}").fetchone()[0]
+            added = conn.execute(f"SELECT COUNT(*) FROM temp.catalog_rows c WHERE {_NEW}").fetchone()[0]
+            return CatalogReport(added, updated, valid - added - updated, errors)
+
+        with store.transaction() as cur:
+            # Rows already in the catalog are updated before the new ones are
+            # added, rather than with INSERT ... ON CONFLICT, as an insert
+            # takes an id for each row even when it becomes an update. The
+            # unique index on names still refuses a name added meanwhile
+            updated = cur.execute(
+                "UPDATE main.stock_names SET name = c.name, retired_day = CASE "
+                "WHEN c.retired IS NULL THEN stock_names.retired_day WHEN c.retired THEN COALESCE(stock_names.retired_day, ?) END "
+                f"FROM temp.catalog_rows c WHERE {_CHANGED}",
+                (retiredDay,)
+            ).rowcount
+            added = cur.execute(
+                "INSERT INTO main.stock_names (name, retired_day) "
+                f"SELECT c.name, CASE WHEN c.retired THEN ? END FROM temp.catalog_rows c WHERE {_NEW} ORDER BY c.row_number",
+                (retiredDay,)
+            ).rowcount
+    finally:
+        conn.execute("DELETE FROM temp.catalog_rows")
+    store.invalidate_stock_names()
+    return CatalogReport(added, updated, valid - added - updated, errors)
+
+
+def _validRows(rows, errors):
+    # Yields (row number, name, retired) for each valid row, adding the
+    # problems of the others to errors. retired is None if the file has no
+    # retired column
+    seen = {}
+    for rowNumber, row in rows:
+        name = row["name"]
+        if isinstance(name, float) and name.is_integer():
+            name = int(name)
+        name = "" if name is None else str(name).strip()
+        problems = []
+        problem = checkStockName(name)
+        if problem is not None:
+            problems.append(problem)
+        elif name.casefold() in seen:
+            problems.append(f"'{name}' repeats the name on row {seen[name.casefold()]}")
+
+        retired = None
+        if RETIRED_COLUMN in row:
+            value = row[RETIRED_COLUMN]
+            if isinstance(value, bool) or (isinstance(value, float) and value.is_integer()):
+                value = int(value)
+            retired = RETIRED_VALUES.get("" if value is None else str(value).strip().lower())
+            if retired is None:
+                problems.append(f"retired must be one of {', '.join(v for v in RETIRED_VALUES if v)} or blank")
+
+        if problems:
+            errors.append((rowNumber, "; ".join(problems)))
+            continue
+        seen[name.casefold()] = rowNumber
+        yield rowNumber, name, retired
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Add or update the stock types listed in a product master")
+    parser.add_argument("file", help="a .csv, .xlsx or .xls file with a name column, and optionally a retired column")
+    parser.add_argument("--dry-run", action="store_true", help="check the file and count the changes without making them")
+    parser.add_argument("--db", default=G_DB_PATH, help="path of the stock database")
+    args = parser.parse_args()
+
+    initialiseDb(args.db)
+    store = InventoryStore(args.db)
+    try:
+        report = loadCatalog(store, args.file, dryRun=args.dry_run)
+    except (ManifestError, OSError) as e:
+        parser.exit(1, f"{args.file} could not be read: {e}\n")
+    finally:
+        store.close()
+    for rowNumber, message in report.errors:
+        print(f"row {rowNumber}: {message}")
+    verb = "would be" if args.dry_run else "were"
+    print(f"{report.added} stock types {verb} added and {report.updated} updated. "
+          f"{report.unchanged} were already in the catalog and {len(report.errors)} rows were skipped")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,21 +5,22 @@
 import tkinter as tk
 from tkinter import ttk
 from tkinter import filedialog as fd
+from tkinter import font as tkfont
 from tkinter.messagebox import showerror, showinfo, askyesno
-root = tk.Tk()
-tk.Label(root, text="Loading modules... please wait").pack()
-root.update()
+import csv
 import sqlite3 as sql
-import pandas as pd
-from pandastable import Table
-
-root.destroy()
-
-from A1_inventory_management.utils.datetime_helpers import isDate, dateInFuture, addLeadingZeroes, dateLessThan
-from A1_inventory_management.database_init import G_DB_PATH
-
-TRANSACTION_TYPE_ADDITION_STRING = 'addition'
-TRANSACTION_TYPE_REMOVAL_STRING = 'removal'
+import threading
+
+from A1_inventory_management.utils.datetime_helpers import addLeadingZeroes, isDate
+from A1_inventory_management.validation import checkAddition, checkRemoval, checkStockRemoval
+from A1_inventory_management.inventory_store import BatchNotFoundError, DatabaseBusyError, InventoryStore, TRANSACTION_TYPE_ADDITION_STRING, TRANSACTION_TYPE_REMOVAL_STRING
+from A1_inventory_management.query_builder import BATCHES, TRANSACTIONS
+from A1_inventory_management.bulk_import import importDeliveries, ManifestError
+from A1_inventory_management.catalog import loadCatalog
+from A1_inventory_management.csv_export import exportSearch
+from A1_inventory_management.db_worker import DatabaseWorker
+from A1_inventory_management.row_source import SORTABLE_COLUMNS, SearchRowSource
+from A1_inventory_management.instrumentation import isEnabled, timed, writeMetrics
 
 FAILURE_STRING_G = "failed"
 SUCCESS_STRING_G = "succeeded"
@@ -27,14 +28,46 @@ SUCCESS_STRING_G = "succeeded"
 TYPE_STRING_ADD = "ADD"
 TYPE_STRING_REMOVE = "remove"
 TYPE_STRING_CHECK = "check"
+TYPE_STRING_CATALOG = "catalog"
 
 OUTCOME_STRINGS = {
     TYPE_STRING_ADD : "added to",
     TYPE_STRING_REMOVE: "removed from",
-    TYPE_STRING_CHECK: "checked in"
+    TYPE_STRING_CHECK: "checked in",
+    TYPE_STRING_CATALOG: "changed in"
 }
 
-MAX_ROWS_TO_DISPLAY = 10
+# Rows of results in view at once in the check pages
+VISIBLE_ROWS = 20
+
+# Milliseconds scrolling must pause for before the rows scrolled to are read
+SCROLL_FETCH_DELAY = 30
+
+# Rows whose values are measured to size the columns of the results, and
+# the pixels added to the widest of them
+ROWS_MEASURED = 50
+COLUMN_PADDING = 20
+
+# Shown in place of a row that is still being read
+LOADING_TEXT = "..."
+
+# Days in each column of the expiry forecast, by the name shown for it
+FORECAST_BUCKETS = {"Day": 1, "Week": 7}
+
+# Days forecast unless another number is entered. Matches
+# DEFAULT_HORIZON_DAYS in expiry_forecast, which is only imported when a
+# forecast is made so that numpy is not loaded at startup
+DEFAULT_FORECAST_DAYS = 28
+
+# Milliseconds between checks for database jobs that have finished
+WORKER_POLL_INTERVAL = 50
+
+# Milliseconds between each export of the metrics, while the
+# instrumentation is on
+METRICS_EXPORT_INTERVAL = 60000
+
+# Shown when another station kept the database locked for too long
+BUSY_MESSAGE = "The database is being updated by another station and could not be altered. Please wait a moment and submit again."
 
 REMOVAL_REASON = {
     # Display text  # Database record
@@ -50,6 +83,33 @@ TRANSACTION_TYPE = [
     TRANSACTION_TYPE_REMOVAL_STRING
 ]
 
+# pandas and pandastable are slow to import and only needed to display
+# results, so they are loaded by loadResultsModules when first needed
+pd = None
+Table = None
+_resultsModulesLock = threading.Lock()
+
+
+###############################
+## def loadResultsModules () ##
+###############################
+# Import the modules used to display results tables
+def loadResultsModules():
+    """Import pandas and pandastable if they have not been imported yet. App
+    starts this in the background, so it has usually finished by the time a
+    results table is needed.
+
+    Returns:
+        tuple: (pandas, pandastable.Table)
+    """
+    global pd, Table
+    with _resultsModulesLock:
+        if pd is None:
+            import pandas
+            from pandastable import Table as PandasTable
+            pd, Table = pandas, PandasTable
+    return pd, Table
+
 
 ###############
 ## class App ##
@@ -79,6 +139,30 @@ class App(tk.Tk):
         self.container = ttk.Frame(self)
         self.container.pack(fill="both", expand="true")
 
+        # Connection to the database used by the pages to check entries.
+        # Searches and changes are made by the worker on its own connection,
+        # so that the window keeps responding while they run
+        self.store = InventoryStore()
+        self.worker = DatabaseWorker()
+        # (job, cancellable) for each job that has not finished
+        self.backgroundJobs = []
+
+        # Shown while a database job runs, with a button to cancel it
+        self.busyFrame = ttk.Frame(self)
+        self.busyLabel = ttk.Label(self.busyFrame, text="")
+        self.busyBar = ttk.Progressbar(self.busyFrame, mode="indeterminate", length=100)
+        self.cancelButton = ttk.Button(self.busyFrame, text="Cancel", command=self.cancelBackgroundJobs)
+        for widget in [self.busyLabel, self.busyBar, self.cancelButton]:
+            widget.pack(side="left", padx=5, pady=5)
+
+        # Label shown while the modules for results tables load in the
+        # background, so that the window can be used straight away
+        self.loadingLabel = ttk.Label(self, text="Loading modules... please wait")
+        self.loadingLabel.pack(side="bottom")
+        self.moduleLoader = threading.Thread(target=loadResultsModules, daemon=True)
+        self.moduleLoader.start()
+        self.after(100, self.checkModulesLoaded)
+
         # Datafield to contain the fulfilled, returned query
         self.queryData = {
             "type" : "Not started",
@@ -89,6 +173,84 @@ class App(tk.Tk):
 
         self.showFrame(MainPage)
 
+        if isEnabled():
+            self.after(METRICS_EXPORT_INTERVAL, self.exportMetrics)
+
+    def checkModulesLoaded(self):
+        """Poll the background import, removing the loading label once it
+        has finished"""
+        if self.moduleLoader.is_alive():
+            self.after(100, self.checkModulesLoaded)
+        else:
+            self.loadingLabel.pack_forget()
+
+    def runInBackground(self, work, onDone=None, onError=None, message="Working...", cancellable=True, label=None):
+        """Run a database job on the worker thread, showing that it is busy
+        until the job finishes. onDone or onError is called from the Tk
+        event loop once the job finishes.
+
+        Args:
+            work (function): called on the worker thread with its
+                InventoryStore. Its return value is passed to onDone
+            onDone (function): called with the result of work
+            onError (function): called with the exception raised by work
+            message (string): shown next to the busy indicator
+            cancellable (bool): whether the cancel button can stop the job.
+                Changes to the database should not be cancellable, so that
+                the user is always told whether they were made
+            label (string): the name the job is timed under, such as
+                "checkBatch.search"
+
+        Returns:
+            Job: the submitted job
+        """
+        job = self.worker.submit(work, onDone, onError, label)
+        if not self.backgroundJobs:
+            self.after(WORKER_POLL_INTERVAL, self.pollWorker)
+            self.busyFrame.pack(side="bottom")
+            self.busyBar.start()
+        self.backgroundJobs.append((job, cancellable))
+        self.busyLabel["text"] = message
+        self.cancelButton["state"] = "normal" if cancellable else "disabled"
+        return job
+
+    def pollWorker(self):
+        """Deliver the outcome of finished database jobs, and hide the busy
+        indicator once none are left"""
+        self.worker.poll()
+        self.backgroundJobs = [(job, cancellable) for job, cancellable in self.backgroundJobs if not job.finished]
+        if self.backgroundJobs:
+            # Show the progress of the job that reported it most recently
+            for job, cancellable in reversed(self.backgroundJobs):
+                if job.progress is not None:
+                    self.busyLabel["text"] = job.progress
+                    break
+            self.after(WORKER_POLL_INTERVAL, self.pollWorker)
+        else:
+            self.busyBar.stop()
+            self.busyFrame.pack_forget()
+
+    def cancelBackgroundJobs(self):
+        """Cancel every database job that can be cancelled"""
+        for job, cancellable in self.backgroundJobs:
+            if cancellable:
+                self.worker.cancel(job)
+
+    def exportMetrics(self):
+        """Write the metrics recorded so far, and again after
+        METRICS_EXPORT_INTERVAL"""
+        writeMetrics()
+        self.after(METRICS_EXPORT_INTERVAL, self.exportMetrics)
+
+    def destroy(self):
+        """Close the database connections along with the window"""
+        self.cancelBackgroundJobs()
+        self.worker.close()
+        self.store.close()
+        if isEnabled():
+            writeMetrics()
+        super().destroy()
+
     # Method to display a new frame of a set class
     def showFrame(self, frameClass):
         """Remove a prior frame and display a new one of the class frameClass
@@ -97,6 +259,8 @@ class App(tk.Tk):
             frameClass (class <ttk.Frame>): the name of the class of the frame
               to be instantiated
         """        
+        # Searches of the frame being left would have nowhere to be shown
+        self.cancelBackgroundJobs()
         # Reset the container to the default size
         self.centreWindow()
         # Clear the current frame from the container
@@ -139,13 +303,69 @@ class MainPage(ttk.Frame):
     
         self.addStockButton = ttk.Button(self, text=f"Add Stock", command=lambda: self.controller.showFrame(AddPage)).pack()
         self.removeStockButton = ttk.Button(self, text=f"Remove Stock", command=lambda: self.controller.showFrame(RemovePage)).pack()
+        self.removeStockTypeButton = ttk.Button(self, text=f"Remove Stock by Type", command=lambda: self.controller.showFrame(RemoveStockPage)).pack()
     
         self.checkStockButton = ttk.Button(self, text=f"Check Batches", command=lambda: self.controller.showFrame(CheckBatchPage)).pack()
         self.checkStockButton = ttk.Button(self, text=f"Check Transactions", command=lambda: self.controller.showFrame(CheckTransactionPage)).pack()
         self.checkStockButton = ttk.Button(self, text=f"Check Total Stock", command=lambda: self.controller.showFrame(CheckStockPage)).pack()
+        self.forecastButton = ttk.Button(self, text="Forecast Expiry", command=lambda: self.controller.showFrame(ExpiryForecastPage)).pack()
+        self.catalogButton = ttk.Button(self, text="Manage Stock Types", command=lambda: self.controller.showFrame(CatalogPage)).pack()
         # Exit button
         self.exitButton = ttk.Button(self, text="exit", command=self.controller.destroy).pack()
 
+#############################
+## def saveImportErrors () ##
+#############################
+# Offer to save a report of the rows of a file that could not be imported
+def saveImportErrors(errors):
+    """Offer to save the rows of an imported file that were not valid to a csv
+
+    Args:
+        errors (list): (row number, message) tuples from importDeliveries or
+            loadCatalog
+    """
+    if not errors:
+        return
+    if not askyesno(title="Rows skipped", message=f"{len(errors)} rows were not valid. Would you like to save a report of them?"):
+        return
+    fileName = fd.asksaveasfilename(
+        defaultextension=".csv",
+        filetypes=[("CSV files", "*.csv"), ("All files", "*.*")],
+        title="Save import report"
+    )
+    if fileName:
+        with open(fileName, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["row", "error"])
+            writer.writerows(errors)
+
+#####################
+## class NameEntry ##
+#####################
+# Entry for a stock name that suggests the names starting with what is typed
+class NameEntry(ttk.Combobox):
+    """
+    Entry for the name or id number of a stock type. As each key is pressed,
+    the names that start with what has been typed, in any case, are listed
+    in its drop down, which the down arrow key opens. They are found in the
+    store's index of stock names, so typing does not wait on the database.
+
+    Args:
+        parent (widget): the widget the entry is placed in
+        controller (App): the app, whose store holds the names
+        textvariable (tk.StringVar): holds what has been entered
+        includeRetired (bool): whether to suggest retired stock types
+    """
+    def __init__(self, parent, controller, textvariable, includeRetired=True):
+        super().__init__(parent, textvariable=textvariable, postcommand=self.suggest)
+        self.controller = controller
+        self.includeRetired = includeRetired
+        self.bind("<KeyRelease>", self.suggest)
+
+    def suggest(self, event=None):
+        """List the names that start with what has been typed"""
+        self["values"] = self.controller.store.suggest_stock_names(self.get(), includeRetired=self.includeRetired)
+
 ###################
 ## class AddPage ##
 ###################
@@ -184,7 +404,7 @@ class AddPage(ttk.Frame):
         }
         # store for entries for each member of self.data
         self.entries = {
-            "name": ttk.Entry(self.labels["name"], textvariable=parameters["name"]),
+            "name": NameEntry(self.labels["name"], self.controller, parameters["name"], includeRetired=False),
             "quantity": ttk.Entry(self.labels["quantity"], textvariable=parameters["quantity"]),
             "delivered_at": ttk.Entry(self.labels["delivered_at"], textvariable=parameters["delivered_at"]),
             "use_by": ttk.Entry(self.labels["use_by"], textvariable=parameters["use_by"])
@@ -210,11 +430,15 @@ class AddPage(ttk.Frame):
 
         ttk.Button(self, text="Submit details", command=self.checkValid).pack()
 
+        # Button to add many batches at once from a delivery manifest
+        ttk.Button(self, text="Import deliveries from file", command=self.importFromFile).pack()
+
         # Button to return to main page
         self.backButton = ttk.Button(self, text="Back", command=lambda: self.controller.showFrame(MainPage))
 
         self.backButton.pack()
 
+    @timed()
     def checkValid(self):
         """
         Check each value in self.data in turn to ensure that it conforms to the
@@ -224,51 +448,15 @@ class AddPage(ttk.Frame):
         """        
         #region checkValid
         parameters = self.controller.queryData["parameters"]
-        # use flag to see if any data are incorrectly formatted
-        allValid = True
-        # check name is valid by running a quick sqlite query
-        conn = sql.connect(G_DB_PATH)
-        cur = conn.cursor()
-
-        #Check to see if a stock number was entered instead of a name
-        # If it was, search for the id, not the name
-        if parameters["name"].get().isnumeric():
-            cur.execute('SELECT id FROM stock_names WHERE id = ?', (parameters["name"].get(),))
-        else:
-            cur.execute('SELECT name FROM stock_names WHERE name = ?', (parameters["name"].get().lower(),))
-        if len(cur.fetchall()) > 0:
-            self.dataValid["name"] = True
-        else:
-            self.dataValid["name"] = False
-            allValid = False
-        conn.close()
-        
-        # Ensure that quantity is an integer and is greater than 0
-        # IntVar objects reset their value to 0 if a non-integer is entered, 
-        # so this test checks both parameters
-        if parameters["quantity"].get() > 0:
-            self.dataValid["quantity"] = True
-        else:
-            self.dataValid["quantity"] = False
-            allValid = False
-
-        # Ensure that the delivery date is formatted correctly (yyyy-mm-dd), 
-        # that all parts are possible (eg, no 13th month), and that it is not in 
-        # the future
-        if isDate(parameters["delivered_at"].get()) and not dateInFuture(parameters["delivered_at"].get()):
-            self.dataValid["delivered_at"] = True
-        else:
-            self.dataValid["delivered_at"] = False
-            allValid = False
-
-        # Ensure that the use by date is formatted correctly (yyyy-mm-dd),
-        # that all parts are possible (eg, no 13th month), and that it is in 
-        # the future
-        if isDate(parameters["use_by"].get()) and dateInFuture(parameters["use_by"].get()):
-            self.dataValid["use_by"] = True
-        else:
-            self.dataValid["use_by"] = False
-            allValid = False
+        # check each field, recording if it is valid
+        self.dataValid = checkAddition(
+            self.controller.store,
+            parameters["name"].get(),
+            parameters["quantity"].get(),
+            parameters["delivered_at"].get(),
+            parameters["use_by"].get()
+        )
+        allValid = all(self.dataValid.values())
 
         # If all data is valid, get user to confirm details then submit
         # If some data is invalid, identify the invalid data and highlight 
@@ -301,7 +489,7 @@ class AddPage(ttk.Frame):
         """
         #region dI        S
         if not self.dataValid["name"]:
-            self.entriesInvalid["name"]["text"] = "Name/id number was not found in database. Please check spelling"
+            self.entriesInvalid["name"]["text"] = "Name/id number was not found in database, or has been retired. Please check spelling"
         else:
             self.entriesInvalid["name"]["text"] = ""
 
@@ -321,6 +509,7 @@ class AddPage(ttk.Frame):
             self.entriesInvalid["use_by"]["text"] = ""
         #endregion
 
+    @timed()
     def submitQuery(self):
         """
         First add a record to the batches database, then add a record to the
@@ -332,70 +521,93 @@ class AddPage(ttk.Frame):
         the controller, and then going to the results page.
         """        
         #region sQ
-        parameters = self.controller.queryData["parameters"]
-
+        # Take the values now, as the page may have been left by the time the
+        # batch has been added
+        values = {k: v.get() for k, v in self.controller.queryData["parameters"].items()}
 
         # Remove leading zeroes from dates
-        delivered_at = addLeadingZeroes(parameters["delivered_at"].get())
-        use_by = addLeadingZeroes(parameters["use_by"].get())
-
-        conn = sql.connect(G_DB_PATH)
-        cur = conn.cursor()
-        cur.execute("PRAGMA foreign_keys = ON")
-
-        stockId = parameters["name"].get()
-        try:
-            # if a name has been used, get the id
-            if not parameters["name"].get().isnumeric():
-                cur.execute("SELECT id FROM stock_names WHERE name = ?",(parameters["name"].get().lower(),))
-                stockId = cur.fetchone()[0]
-
-            # Add the new batch of stock to the batches table
-            cur.execute(
-                "INSERT INTO batches (stock_id, quantity_initial, quantity_current, delivered_at, use_by) VALUES (?, ?, ?, ?, ?)", 
-                (stockId, 
-                parameters["quantity"].get(), 
-                parameters["quantity"].get(), 
-                delivered_at, 
-                use_by)
-            )
-        except sql.Error:
-            conn.close()
-            showerror(title="Failed to add to batches", message="Query failed to add to batches. The database has not been altered. Please contact your system administrator")
+        delivered_at = addLeadingZeroes(values["delivered_at"])
+        use_by = addLeadingZeroes(values["use_by"])
+        stockId = self.controller.store.resolve_stock_id(values["name"])
+
+        def added(batchId):
+            infoString = "An entry was added to the batches database with the following parameters: \n"
+            for k, v in values.items():
+                infoString = infoString + f"{k} : {v}\n"
+            infoString = infoString + f"\nIt was assigned the batch id {batchId}."
+            showinfo(title="Add Successful", message=infoString)
+            self.controller.queryData["outcome"] = SUCCESS_STRING_G
+
+        def failed(error):
+            if isinstance(error, DatabaseBusyError):
+                showerror(title="Database busy", message=BUSY_MESSAGE)
+            elif isinstance(error, sql.Error):
+                showerror(title="Failed to add to batches", message="Query failed to add to batches. The database has not been altered. Please contact your system administrator")
+            else:
+                # Shown rather than raised, as this is called from the Tk
+                # event loop
+                showerror(title="Failed to add to batches", message=f"The batch could not be added: {error}. The database has not been altered. Please contact your system administrator")
             # Save details of the error to the controller
             self.controller.queryData["outcome"] = FAILURE_STRING_G
+
+        # Add the new batch of stock to the batches table and record the
+        # addition in the transactions table in a single transaction
+        self.controller.runInBackground(
+            lambda store: store.add_batch(stockId, values["quantity"], delivered_at, use_by),
+            added, failed, message="Adding batch...", cancellable=False, label="add.addBatch"
+        )
+        #endregion
+
+    def importFromFile(self):
+        """
+        Add every batch in a supplier delivery manifest (.csv or .xlsx). The
+        manifest is checked first, and the user is shown how many rows are
+        valid before anything is added to the database. Rows that are not
+        valid are skipped, and can be saved to a report.
+        """
+        #region iFF
+        fileName = fd.askopenfilename(
+            filetypes=[("Delivery manifests", "*.csv *.xlsx *.xls"), ("All files", "*.*")],
+            title="Choose delivery manifest"
+        )
+        if not fileName:
             return
-        
-        # record the batchId outside of the try except loop to allow the 
-        # prior transaction to be undone.
-        batchId = cur.lastrowid
-        try:
-            # Record the addition in the transactions table
-            cur.execute(
-                "INSERT INTO transactions (transaction_type, batch_id, stock_id, quantity, occured_at) VALUES (?, ?, ?, ?, ?)",
-                (                TRANSACTION_TYPE_ADDITION_STRING,
-                batchId,
-                stockId,
-                parameters["quantity"].get(),
-                delivered_at)
+
+        def checked(report):
+            infoString = f"{report.imported} batches are ready to be added, and {len(report.errors)} rows are not valid and will be skipped.\n\nAre you sure?"
+            if report.imported == 0 or not askyesno(title="Confirm import", message=infoString):
+                saveImportErrors(report.errors)
+                return
+            self.controller.runInBackground(
+                lambda store: importDeliveries(store, fileName),
+                imported, failed, message="Importing deliveries...", cancellable=False, label="add.importDeliveries"
             )
-        except sql.Error:
-            conn.close()
-            showerror(title="Failed to add to transactions", message="Query failed to add to transactions. The database has not been altered. Please contact your system administrator")
 
-            # Save details of the failure to the controller
+        def imported(report):
+            showinfo(title="Import Successful", message=f"{report.imported} batches were added to the database.")
+            self.controller.queryData["outcome"] = SUCCESS_STRING_G
+            saveImportErrors(report.errors)
+
+        def failed(error):
+            if isinstance(error, (ManifestError, OSError)):
+                showerror(title="Import failed", message=f"The manifest could not be read: {error}")
+                return
+            if isinstance(error, DatabaseBusyError):
+                showerror(title="Database busy", message=BUSY_MESSAGE)
+            elif isinstance(error, sql.Error):
+                showerror(title="Import failed", message="Query failed to add to batches. The database has not been altered. Please contact your system administrator")
+            else:
+                # Shown rather than raised, as this is called from the Tk
+                # event loop
+                showerror(title="Import failed", message=f"The manifest could not be imported: {error}. The database has not been altered. Please contact your system administrator")
             self.controller.queryData["outcome"] = FAILURE_STRING_G
 
-            # exit the function
-            return
-        conn.commit()
-        conn.close()
-        infoString = "An entry was added to the batches database with the following parameters: \n"
-        for k, v in parameters.items():
-            infoString = infoString + f"{k} : {v.get()}\n"
-        infoString = infoString + f"\nIt was assigned the batch id {batchId}."
-        showinfo(title="Add Successful", message=infoString)
-        self.controller.queryData["outcome"] = SUCCESS_STRING_G
+        # The manifest is checked without altering the database before the
+        # user is asked to confirm the import
+        self.controller.runInBackground(
+            lambda store: importDeliveries(store, fileName, dryRun=True),
+            checked, failed, message="Checking manifest...", label="add.checkManifest"
+        )
         #endregion
 
 ######################
@@ -477,6 +689,7 @@ class RemovePage(ttk.Frame):
 
 
     # make sure that values entered are all valid
+    @timed()
     def checkValid(self):
         """
         Check each value in self.data in turn to ensure that it conforms to the
@@ -485,57 +698,16 @@ class RemovePage(ttk.Frame):
         invalid fields are flagged and the user is asked to re-enter that data.
         """        
         parameters = self.controller.queryData["parameters"]
-        # use flag to see if any data are incorrectly formatted
-        allValid = True
-
-        #Connect to the database
-        conn = sql.connect(G_DB_PATH)
-        cur = conn.cursor() 
-
-        batchId = parameters["batchId"].get()
-        # check batchId exists in batches
-        cur.execute('SELECT id FROM batches WHERE id = ?', (batchId,))
-        if len(cur.fetchall()) > 0:
-            self.dataValid["batchId"] = True
-        else:
-            self.dataValid["batchId"] = False
-            # If batch number is not valid, none of the other checks will return 
-            # valid.
-            self.displayInvalid()
-            return
-
-        
-        # Ensure that quantity is an integer is greater than 0, and is not more
-        # than the quantity_current in the chosen batch
-        # IntVar objects reset their value to 0 if a non-integer is entered, 
-        # so this test checks the first two parameters
-        cur.execute('SELECT quantity_current FROM batches WHERE id = ?', (batchId,))
-        quantity = parameters["quantity"].get()
-        if quantity > 0 and int(cur.fetchone()[0]) >= quantity:
-            self.dataValid["quantity"] = True
-        else:
-            self.dataValid["quantity"] = False
-            allValid = False
-
-        # Ensure that the removal date is formatted correctly (yyyy-mm-dd), 
-        # that all parts are possible (eg, no 13th month), and that it is later than the delivery date on the batch
-        cur.execute('SELECT delivered_at FROM batches WHERE id = ?', (batchId,))
-
-        delivered_at = cur.fetchone()[0]
-        removalDate = parameters["removalDate"].get()
-
-        if isDate(removalDate) and not dateInFuture(removalDate) and not dateLessThan(removalDate, delivered_at):
-            self.dataValid["removalDate"] = True
-        else:
-            self.dataValid["removalDate"] = False
-            allValid = False
-        conn.close()
-
-        if parameters["removalReason"].get():
-            self.dataValid["removalReason"] = True
-        else:
-            self.dataValid["removalReason"] = False
-            allValid = False
+        # check each field, recording if it is valid. If the batch number is
+        # not valid, none of the other checks are made
+        self.dataValid = checkRemoval(
+            self.controller.store,
+            parameters["batchId"].get(),
+            parameters["quantity"].get(),
+            parameters["removalDate"].get(),
+            parameters["removalReason"].get()
+        )
+        allValid = all(self.dataValid.values())
 
         # If all data is valid, display the confirmation screen
         # If some data is invalid, identify the invalid data and highlight 
@@ -587,6 +759,7 @@ class RemovePage(ttk.Frame):
 
 
     # construct and submit a query to the database
+    @timed()
     def submitQuery(self):
         """
         First remove a quantity from the batches database, then add a record to the
@@ -598,71 +771,555 @@ class RemovePage(ttk.Frame):
         the controller, and then going to the results page.
         """        
         parameters = self.controller.queryData["parameters"]
+        batchId = parameters["batchId"].get()
+        quantity = parameters["quantity"].get()
+        removalReason = parameters["removalReason"].get()
 
         # Remove leading zeroes from dates
         removalDate = addLeadingZeroes(parameters["removalDate"].get())
 
-        # Connect to database
-        conn = sql.connect(G_DB_PATH)
-        cur = conn.cursor()
-        cur.execute("PRAGMA foreign_keys = ON")
+        def removed(stockId):
+            self.controller.queryData["outcome"] = SUCCESS_STRING_G
+
+        def failed(error):
+            if isinstance(error, DatabaseBusyError):
+                showerror(title="Database busy", message=BUSY_MESSAGE)
+            elif isinstance(error, BatchNotFoundError):
+                showerror(title="Batch not found", message=f"{error}. Please check the batch number. The database has not been altered.")
+            elif isinstance(error, ValueError):
+                # Another station may have removed stock from the batch since
+                # it was checked
+                showerror(title="Not enough stock", message=f"{error}. The database has not been altered.")
+            elif isinstance(error, sql.Error):
+                showerror(title="Failed to update batches", message="Query failed to update batches. The database has not been altered. Please contact your system administrator")
+            else:
+                showerror(title="Failed to update batches", message=f"The stock could not be removed: {error}. The database has not been altered. Please contact your system administrator")
+            # Save details of the error to the controller
+            self.controller.queryData["outcome"] = FAILURE_STRING_G
 
-        batchId = parameters["batchId"].get()
-        try:
-            # Get the current quantity of the desired batch
-            cur.execute("SELECT quantity_current FROM batches WHERE id = ?", (batchId,))
+        # Update the desired batch and record the removal in the
+        # transactions table in a single transaction
+        self.controller.runInBackground(
+            lambda store: store.remove_from_batch(batchId, quantity, removalDate, removalReason),
+            removed, failed, message="Removing stock...", cancellable=False, label="remove.removeFromBatch"
+        )
 
-            # Calculate the new quantity
-            currentQuantity = cur.fetchone()[0]
-            newQuantity = currentQuantity - parameters["quantity"].get()
-            
-            # Update the desired batch
-            cur.execute("UPDATE batches SET quantity_current = ? WHERE id = ?", (newQuantity, batchId))
+###########################
+## class RemoveStockPage ##
+###########################
+# Frame to remove a quantity of a stock type, taken from its batches in first
+# expiry first out order
+class RemoveStockPage(ttk.Frame):
+    """
+    Frame to remove a quantity of a stock type without choosing the batches
+    """    
+    def __init__(self, parent, controller):
+        super().__init__(parent)
+        self.controller = controller
+        # Datafields to store information for the sqlite query
+        self.controller.queryData["type"] = TYPE_STRING_REMOVE
+        self.controller.queryData["parameters"] = {
+            "name" : tk.StringVar(),
+            "quantity" : tk.IntVar(),
+            "removalDate" : tk.StringVar(),
+            "removalReason" : tk.StringVar()
+        }
+        # assign this variable to shorten the path
+        parameters = self.controller.queryData["parameters"]
+        # datafields to record if the respective variable field is valid
+        self.dataValid = {
+            "name" : None,
+            "quantity" : None,
+            "removalDate" : None,
+            "removalReason" : None,
+        }
 
-        except sql.Error:
-            conn.close()
-            showerror(title="Failed to update batches", message="Query failed to update batches. The database has not been altered. Please contact your system administrator")
+        # Store for labels for each member of self.data
+        self.labels = {
+            "name" : ttk.Label(self, text="Name/Id Number of Good"),
+            "quantity": ttk.Label(self, text="Quantity removed"),
+            "removalDate": ttk.Label(self, text="Date of removal (YYYY-MM-DD)"),
+            "removalReason": ttk.Label(self, text="Reason for removal")
+        }
+        # store for entries for each member of self.data
+        self.entries = {
+            "name" : NameEntry(self, self.controller, parameters["name"]),
+            "quantity": ttk.Entry(self, textvariable=parameters["quantity"]),
+            "removalDate": ttk.Entry(self, textvariable=parameters["removalDate"]),
+            "removalReason": [
+                ttk.Radiobutton(self, text=f"{k}", value=f"{v}", variable=parameters["removalReason"]) for k, v in REMOVAL_REASON.items()
+            ]
+        }
+        # store for input error warnings for each member of self.data
+        # These will be modified to display text if any fields are found to 
+        # contain invalid data
+        self.entriesInvalid = {
+            "name" : ttk.Label(self, text=""),
+            "quantity": ttk.Label(self, text=""),
+            "removalDate": ttk.Label(self, text=""),
+            "removalReason": ttk.Label(self, text="")
+        }
 
-            # Save details of the error to the controller
+        for dataField in self.labels:
+            self.labels[dataField].pack()
+            entry = self.entries[dataField]
+            if isinstance(entry, list):
+                for item in entry:
+                    item.pack()
+            else:
+                entry.pack()
+            self.entriesInvalid[dataField].pack()
+
+        ttk.Button(self, text="Submit details", command=self.checkValid).pack()
+
+        # Button to return to main page
+        self.backButton = ttk.Button(self, text="Back", command=lambda: self.controller.showFrame(MainPage))
+
+        self.backButton.pack()
+
+    @timed()
+    def checkValid(self):
+        """
+        Check each value in self.data in turn to ensure that it conforms to the
+        syntax of the sql database, and mark it as invalid if it does not. If
+        all values are valid, then the query is submitted; otherwise, the 
+        invalid fields are flagged and the user is asked to re-enter that data.
+        """        
+        parameters = self.controller.queryData["parameters"]
+        # check each field, recording if it is valid. The quantity is checked
+        # against the total held of the stock type
+        self.dataValid = checkStockRemoval(
+            self.controller.store,
+            parameters["name"].get(),
+            parameters["quantity"].get(),
+            parameters["removalDate"].get(),
+            parameters["removalReason"].get()
+        )
+        allValid = all(self.dataValid.values())
+
+        if allValid:
+            self.confirmSubmitQuery()
+        else:
+            self.displayInvalid()
+
+    def confirmSubmitQuery(self):
+        """Give the user an opportunity to check the data they are about to alter in the database
+        """        
+        parameters = self.controller.queryData["parameters"]
+
+        infoString = f"You want to remove {parameters["quantity"].get()} units of {parameters["name"].get()}, taken from the batches with the earliest use by dates, with the following parameters: \n"
+        for k, v in parameters.items():
+            if k in ("name", "quantity"):
+                continue
+            infoString = infoString + f"{k} : {v.get()}\n"
+        infoString = infoString + "\nAre you sure?"
+        confirm = askyesno(title="Confirm query submission", message=infoString)
+        if confirm:
+            self.submitQuery()
+
+    def displayInvalid(self):
+        """ 
+        Check each datafield in turn, and if it has been flagged as invalid,
+        display an error message. Otherwise, remove existing error messages.
+        """        
+        if not self.dataValid["name"]:
+            self.entriesInvalid["name"]["text"] = "Name/id number was not found in database. Please check spelling"
+        else:
+            self.entriesInvalid["name"]["text"] = ""
+
+        if not self.dataValid["quantity"]:
+            self.entriesInvalid["quantity"]["text"]= "Quantity must be a positive whole number, no more than the stock held"
+        else:
+            self.entriesInvalid["quantity"]["text"] = ""
+
+        if not self.dataValid["removalDate"]:
+            self.entriesInvalid["removalDate"]["text"] = "Removal date must be in the form YYYY-MM-DD"
+        else:
+            self.entriesInvalid["removalDate"]["text"] = ""
+        
+        if not self.dataValid["removalReason"]:
+            self.entriesInvalid["removalReason"]["text"] = "Please choose a removal reason"
+        else:
+            self.entriesInvalid["removalReason"]["text"] = ""
+
+    @timed()
+    def submitQuery(self):
+        """
+        Remove the quantity from the batches of the stock type with the
+        earliest use by dates, recording a transaction for each batch, then
+        show which batches were used.
+
+        The database updates are transactional. Failure will result in
+        successful updates being undone and details of the failure being saved
+        to the controller.
+        """        
+        parameters = self.controller.queryData["parameters"]
+        stockId = self.controller.store.resolve_stock_id(parameters["name"].get())
+        quantity = parameters["quantity"].get()
+        removalDate = addLeadingZeroes(parameters["removalDate"].get())
+        removalReason = parameters["removalReason"].get()
+
+        def removed(allocation):
+            infoString = "Stock was removed from the following batches: \n"
+            for batchId, taken in allocation:
+                infoString = infoString + f"batch {batchId} : {taken}\n"
+            showinfo(title="Remove Successful", message=infoString)
+            self.controller.queryData["outcome"] = SUCCESS_STRING_G
+
+        def failed(error):
+            if isinstance(error, DatabaseBusyError):
+                showerror(title="Database busy", message=BUSY_MESSAGE)
+            elif isinstance(error, ValueError):
+                showerror(title="Not enough stock", message=f"{error} on or before the removal date. The database has not been altered.")
+            elif isinstance(error, sql.Error):
+                showerror(title="Failed to update batches", message="Query failed to update batches. The database has not been altered. Please contact your system administrator")
+            else:
+                showerror(title="Failed to update batches", message=f"The stock could not be removed: {error}. The database has not been altered. Please contact your system administrator")
             self.controller.queryData["outcome"] = FAILURE_STRING_G
-            # exit the function
+
+        self.controller.runInBackground(
+            lambda store: store.remove_stock(stockId, quantity, removalDate, removalReason),
+            removed, failed, message="Removing stock...", cancellable=False, label="removeStock.removeStock"
+        )
+
+#######################
+## class ResultsGrid ##
+#######################
+# Table that only holds the rows in view, reading more as it is scrolled
+class ResultsGrid(ttk.Frame):
+    """
+    Shows the rows of a SearchRowSource in a ttk.Treeview that holds only
+    the VISIBLE_ROWS rows in view. Scrolling changes the values of those rows
+    rather than adding more, and the rows scrolled to are read once
+    scrolling pauses, so a search of any size is shown in the same time.
+
+    Clicking the heading of a column the source can be sorted by sorts the
+    rows by it, and clicking it again reverses them. The rows are then read
+    again in the new order from the database.
+
+    Args:
+        parent (ttk.Frame): the frame the grid is placed in
+        columns (list): the columns of the source that are shown
+        headings (list): the heading shown for each column
+        formatRow (function): turns a row of the source into the values
+            shown for columns
+        loadRows (function): called with a job and a function to call with
+            its result, to run the job on the DatabaseWorker. Returns the Job
+    """
+    def __init__(self, parent, columns, headings, formatRow, loadRows):
+        super().__init__(parent)
+        self.columns = columns
+        self.headings = headings
+        self.formatRow = formatRow
+        self.loadRows = loadRows
+        self.source = None
+        # Position of the first row in view
+        self.top = 0
+        # Job reading each block that has been asked for, so that it is not
+        # asked for again while it is read
+        self.loading = {}
+        self.counting = None
+        self.fetchTimer = None
+        self.sized = False
+
+        self.tree = ttk.Treeview(self, columns=columns, show="headings", height=VISIBLE_ROWS, selectmode="browse")
+        self.scrollbar = ttk.Scrollbar(self, orient="vertical", command=self.onScrollbar)
+        self.statusLabel = ttk.Label(self, text="")
+        self.tree.grid(column=0, row=0, sticky="nsew")
+        self.scrollbar.grid(column=1, row=0, sticky="ns")
+        self.statusLabel.grid(column=0, row=1, sticky="w", pady=5)
+        self.columnconfigure(0, weight=1)
+        self.rowconfigure(0, weight=1)
+        # The rows in view are made once, and only their values change
+        for i in range(VISIBLE_ROWS):
+            self.tree.insert("", "end", iid=str(i), values=())
+
+        for sequence, rows in [("<Up>", -1), ("<Down>", 1), ("<Prior>", -VISIBLE_ROWS), ("<Next>", VISIBLE_ROWS)]:
+            self.tree.bind(sequence, lambda event, rows=rows: self.scrollBy(rows))
+        self.tree.bind("<Home>", lambda event: self.scrollTo(0))
+        self.tree.bind("<End>", lambda event: self.scrollTo(self.rowCount()))
+        self.tree.bind("<MouseWheel>", lambda event: self.scrollBy(-3 if event.delta > 0 else 3))
+        self.tree.bind("<Button-4>", lambda event: self.scrollBy(-3))
+        self.tree.bind("<Button-5>", lambda event: self.scrollBy(3))
+
+    def show(self, source):
+        """Show the rows of a source from the first
+
+        Args:
+            source (SearchRowSource): the rows to show
+        """
+        self.source = source
+        self.top = 0
+        self.loading = {}
+        self.counting = None
+        for column, heading in zip(self.columns, self.headings):
+            if column in SORTABLE_COLUMNS[source.table.name]:
+                arrow = (" ▼" if source.descending else " ▲") if column == source.orderBy else ""
+                self.tree.heading(column, text=heading + arrow, command=lambda column=column: self.sortBy(column))
+            else:
+                self.tree.heading(column, text=heading)
+        self.sizeColumns(source.rows(0, ROWS_MEASURED))
+        self.redraw()
+
+    def sortBy(self, column):
+        """Sort the rows by a column, reversing them if they are already
+        sorted by it"""
+        descending = column == self.source.orderBy and not self.source.descending
+        self.show(self.source.sortedBy(column, descending))
+
+    def rowCount(self):
+        """The rows that can be scrolled through"""
+        return self.source.rowsKnown() if self.source is not None else 0
+
+    def scrollTo(self, top):
+        """Scroll so that the row at position top is the first in view"""
+        self.top = max(0, min(top, self.rowCount() - VISIBLE_ROWS))
+        self.redraw()
+
+    def scrollBy(self, rows):
+        """Scroll by a number of rows, up if it is negative"""
+        self.scrollTo(self.top + rows)
+        # Stop the Treeview from moving its selection as well
+        return "break"
+
+    def onScrollbar(self, action, amount, unit=None):
+        """Scroll as the scrollbar is dragged or clicked"""
+        if action == "moveto":
+            self.scrollTo(int(float(amount) * self.rowCount()))
+        elif unit == "pages":
+            self.scrollBy(int(amount) * VISIBLE_ROWS)
+        else:
+            self.scrollBy(int(amount))
+
+    @timed()
+    def redraw(self):
+        """Show the rows in view, and read those that have not been read
+        once scrolling pauses"""
+        rows = self.source.rows(self.top, self.top + VISIBLE_ROWS)
+        for i in range(VISIBLE_ROWS):
+            if i >= len(rows):
+                values = ()
+            elif rows[i] is None:
+                values = (LOADING_TEXT,)
+            else:
+                values = ["" if value is None else value for value in self.formatRow(rows[i])]
+            self.tree.item(str(i), values=values)
+
+        total = self.rowCount()
+        if total:
+            self.scrollbar.set(self.top / total, min(1, (self.top + VISIBLE_ROWS) / total))
+            last = min(total, self.top + VISIBLE_ROWS)
+            counted = f"{total:,}" if self.source.rowCount is not None else f"at least {total:,}"
+            self.statusLabel["text"] = f"Rows {self.top + 1:,} to {last:,} of {counted}"
+        else:
+            self.scrollbar.set(0, 1)
+            self.statusLabel["text"] = "Reading rows..."
+
+        if self.fetchTimer is not None:
+            self.after_cancel(self.fetchTimer)
+        self.fetchTimer = self.after(SCROLL_FETCH_DELAY, self.fetchRows)
+
+    def fetchRows(self):
+        """Read the blocks of rows in view that have not been read, and
+        count the rows if they have not been counted"""
+        self.fetchTimer = None
+        source = self.source
+        # A block whose job was cancelled is asked for again
+        missing = [block for block in source.missingBlocks(self.top, self.top + VISIBLE_ROWS)
+                   if block not in self.loading or self.loading[block].cancelled]
+        if missing:
+            job = self.loadRows(source.loadJob(missing), lambda loaded: self.rowsLoaded(source, loaded))
+            for block in missing:
+                self.loading[block] = job
+        if source.rowCount is None and source.rowsKnown() and (self.counting is None or self.counting.cancelled):
+            self.counting = self.loadRows(source.countJob(), lambda total: self.rowsCounted(source, total))
+
+    def rowsLoaded(self, source, loaded):
+        """Keep blocks read for source, and show them if they are in view"""
+        # Rows read before the grid was sorted again are not needed
+        if source is not self.source:
             return
-        
-        # Get stockId needed to add to transaction table
-        cur.execute("SELECT stock_id FROM batches WHERE id = ?", (batchId,))
-        stockId = cur.fetchone()[0]
+        for block, rows in loaded:
+            self.loading.pop(block, None)
+        source.addBlocks(loaded)
+        if not self.sized:
+            self.sizeColumns(source.rows(0, ROWS_MEASURED))
+        self.redraw()
+
+    def rowsCounted(self, source, total):
+        """Record the number of rows of source once counted"""
+        if source is self.source:
+            source.rowCount = total
+            self.redraw()
+
+    def sizeColumns(self, rows):
+        """Fit each column to its heading and the values of the rows given,
+        rather than to every row"""
+        font = tkfont.nametofont("TkDefaultFont")
+        shown = [self.formatRow(row) for row in rows if row is not None]
+        for i, (column, heading) in enumerate(zip(self.columns, self.headings)):
+            width = max([font.measure(heading + " ▲")] + [font.measure(str(values[i])) for values in shown])
+            self.tree.column(column, width=width + COLUMN_PADDING, minwidth=COLUMN_PADDING)
+        self.sized = bool(shown)
+
+
+#######################
+## class ResultsView ##
+#######################
+# Shared by the check pages whose searches can match more rows than should be
+# loaded at once
+class ResultsView:
+    """
+    Shows the results of a search in a ResultsGrid, which reads only the
+    rows that are scrolled to, so only a few blocks of rows are held in
+    memory however many match.
+
+    Pages using this set table to the TableSpec they search, hiddenColumns
+    to the columns of it that are not shown or exported, and jobLabel to
+    the name their searches are timed under, and call setupResults from their __init__. The searches run on the App's
+    DatabaseWorker, so they are given its store rather than using the
+    controller's.
+    """
+    def setupResults(self):
+        """Set up the details of the results, which are shown once a search
+        is submitted"""
+        # Filters of the last submitted search
+        self.filters = None
+        # Name of each stock id, read with the first rows of a search
+        self.stockNames = {}
+        self.resultsGrid = None
+        self.shownColumns = [c for c in self.table.columns if c not in self.hiddenColumns]
+
+    def runSearch(self, work, onDone, message="Searching...", label="search"):
+        """Run work on the DatabaseWorker, showing an error if it fails
 
-        try:
-            # Record the removal in the transactions table
-            cur.execute(
-                "INSERT INTO transactions (batch_id, stock_id,transaction_type, quantity, occured_at, removal_reason) VALUES (?, ?, ?, ?, ?, ?)",
-                (batchId,
-                stockId,
-                TRANSACTION_TYPE_REMOVAL_STRING,
-                parameters["quantity"].get(),
-                removalDate,
-                parameters["removalReason"].get())
+        Args:
+            work (function): called with the worker's store
+            onDone (function): called with the result of work
+            message (string): shown while work runs
+            label (string): what work does. It is timed under this, after
+                the jobLabel of the page
+
+        Returns:
+            Job: the submitted job
+        """
+        def failed(error):
+            if isinstance(error, DatabaseBusyError):
+                showerror(title="Database busy", message=BUSY_MESSAGE)
+            elif isinstance(error, sql.Error):
+                showerror(title="Check Failed", message="Query failed to read the database. Please contact your system administrator")
+            else:
+                # Reported rather than raised, as this is called from the Tk
+                # event loop and the results grid would be left part filled
+                showerror(title="Check Failed", message=f"The search could not be completed: {error}")
+
+        return self.controller.runInBackground(work, onDone, failed, message=message, label=f"{self.jobLabel}.{label}")
+
+    def showResults(self):
+        """Display the results of the search in self.filters, or an error if
+        the search found no results"""
+        source = SearchRowSource(self.table, self.filters)
+        loadFirst = source.loadJob([0])
+
+        def found(result):
+            loaded, names = result
+            source.addBlocks(loaded)
+            if source.rowCount == 0:
+                showerror(title="Check Failed", message="No data found matching this query")
+                return
+            self.stockNames = names
+            self.displayResults(source)
+
+        self.runSearch(lambda store: (loadFirst(store), store.stock_names()), found)
+
+    @timed()
+    def displayResults(self, source):
+        """Show the rows of a search in the results grid
+
+        Args:
+            source (SearchRowSource): the rows of the search, with the first
+                block read
+        """
+        # show export to csv button
+        self.csvButton.grid(column=1, row=1, padx=10)
+        if self.resultsGrid is None:
+            # Increase size of parent window to display table
+            self.controller.centreWindow(800, 600)
+            self.sectionFrames["results"].pack(fill="both", expand=True)
+            headings = ["name" if c == "stock_id" else c for c in self.shownColumns]
+            self.resultsGrid = ResultsGrid(
+                self.sectionFrames["results"], self.shownColumns, headings, self.formatRow,
+                lambda work, onDone: self.runSearch(work, onDone, message="Reading rows...", label="readRows")
             )
-        except sql.Error:
-            showerror(title="Failed to add to transactions", message="Query failed to add to transactions. The database has not been altered. Please contact your system administrator")
-            # Save details of the failure to the controller
-            self.controller.queryData["outcome"] = FAILURE_STRING_G
-            # exit the function
+            self.resultsGrid.pack(fill="x", padx=10, pady=10)
+        self.resultsGrid.show(source)
+
+    def formatRow(self, row):
+        """Turn a row of the search into the values shown, with the stock
+        name in place of its id and the hidden columns left out"""
+        values = dict(zip(self.table.columns, row))
+        if "stock_id" in values:
+            values["stock_id"] = self.stockNames.get(values["stock_id"], values["stock_id"])
+        return [values[c] for c in self.shownColumns]
+
+    def exportToCsv(self):
+        """
+        Saves every result of the search to a csv at a user-defined location,
+        in the order they are shown. The search is run again on the
+        DatabaseWorker and its rows are streamed from the cursor into the
+        file, so no more than a batch of them is held in memory. A file name
+        ending in .gz is compressed.
+        """
+        #region eTC
+        # open window to choose folder location
+        fileName = fd.asksaveasfilename(
+            defaultextension=".csv",
+            filetypes=[("CSV files", "*.csv"), ("Compressed CSV files", "*.csv.gz"), ("All files", "*.*")],
+            title="Save exported query"
+        )
+        if not fileName:
             return
-        
-        conn.commit()
-        conn.close()
+
+        query = self.resultsGrid.source.query()
+        worker = self.controller.worker
+
+        def export(store):
+            return exportSearch(
+                store, query, fileName, store.stock_names(), self.hiddenColumns,
+                progress=lambda written: worker.reportProgress(f"Exported {written:,} rows..."),
+                checkCancelled=worker.checkCancelled
+            )
+
+        def exported(written):
+            showinfo(title="Export complete", message=f"{written} query results exported to {fileName}.")
+
+        def failed(error):
+            if isinstance(error, OSError):
+                showerror(title="Export failed", message=f"Could not write {fileName}: {error}")
+            elif isinstance(error, DatabaseBusyError):
+                showerror(title="Database busy", message=BUSY_MESSAGE)
+            elif isinstance(error, sql.Error):
+                showerror(title="Export failed", message="Query failed to read the database. Please contact your system administrator")
+            else:
+                showerror(title="Export failed", message=f"The results could not be exported: {error}")
+
+        self.controller.runInBackground(export, exported, failed, message="Exporting results...", label=f"{self.jobLabel}.exportToCsv")
+        #endregion
 
 ##########################
 ## class CheckbatchPage ##
 ##########################
 # Frame to display data to construct a query to retrieve data from the batch
-class CheckBatchPage(ttk.Frame):
+class CheckBatchPage(ResultsView, ttk.Frame):
     """
     Page frame used to construct a query to get information from the
     batches table
 
     """    
+    table = BATCHES
+    jobLabel = "checkBatch"
+    hiddenColumns = ()
+
     def __init__(self, parent, controller):
         super().__init__(parent)
         self.controller = controller
@@ -770,7 +1427,7 @@ class CheckBatchPage(ttk.Frame):
         # Entries for each field, bound to the requisite LabelFrame. The three date ranges have attached labels showig if they are to or from
         self.entries = {
             "batchId": ttk.Entry(self.labels["batchId"], textvariable=parameters["batchId"]),
-            "name": ttk.Entry(self.labels["name"], textvariable=parameters["name"]),
+            "name": NameEntry(self.labels["name"], self.controller, parameters["name"]),
             "delivered_at": [
                 ttk.Entry(self.labels["delivered_at"], textvariable=parameters["delivered_at"][0]),
                 ttk.Entry(self.labels["delivered_at"], textvariable=parameters["delivered_at"][1])
@@ -825,17 +1482,15 @@ class CheckBatchPage(ttk.Frame):
         self.csvButton = ttk.Button(self.sectionFrames["main"], text="Export results to .csv", command= self.exportToCsv)
 
         # Button to return to main page
-        self.backButton = ttk.Button(self.sectionFrames["main"], text="Back", command=lambda: self.controller.showFrame(MainPage))
-        self.backButton.grid(column=1, row=2, padx=10)
-
-        # Frame to hold the results of the last submitted query
-        self.resultsFrame = ttk.Frame(self)
+        self.backButton = ttk.Button(self.sectionFrames["main"], text="Back", command=lambda: self.controller.showFrame(MainPage))
+        self.backButton.grid(column=1, row=2, padx=10)
 
-        # Datafield that will hold the pandastable to show the results when/if it is generated
-        self.resultsTable = None
+        # Set up the results grid, which is shown when/if there are results
+        self.setupResults()
 
 
     # construct and submit a query to the database
+    @timed()
     def submitQuery(self):
         """
         Constructs a SELECT query based on the data entered and chosen. If no
@@ -858,93 +1513,34 @@ class CheckBatchPage(ttk.Frame):
         
         parameters = self.controller.queryData["parameters"]
 
-        conn = sql.connect(G_DB_PATH)
-        cur = conn.cursor()
-        cur.execute("PRAGMA foreign_keys = ON")
+        store = self.controller.store
 
-        # Builds a sql SELECT string a bit at a time, then a tuple to insert
-        # the relevant values
-        queryString = "SELECT * FROM batches WHERE ("
-        queryParameters = []
-        # if batchId is used, then that is the only parameter needed for the query
-        # Otherwise, construct the query from the selected parameters
+        # Collect the filters that are used. If batchId is used, then that is
+        # the only parameter needed for the query
+        filters = {}
         if self.dataUsed["batchId"].get():
-            queryString = queryString + "id = ?"
-            queryParameters.append(parameters["batchId"].get())
+            filters["batchId"] = parameters["batchId"].get()
         else:
-            # Use the addAnd flag to add an AND to the start of every
-            # additional prompt except the first
-            addAnd = ""
-
             # if name is used, add to query
             if self.dataUsed["name"].get():
-                stockId = parameters["name"].get()
-                if not stockId.isnumeric():
-                    cur.execute("SELECT id FROM stock_names WHERE name = ?", (parameters["name"].get(),))
-                    stockId = cur.fetchone()[0]
-                queryString = queryString +"stock_id = ?"
-                queryParameters.append(stockId)
-                addAnd = " AND "
-            
-            # Create a subdictionary of ranges to iterate over
-            dateRangesToExtract = ["delivered_at", "recorded_in_database", "use_by"]
-            dateRanges = {key: self.dataUsed[key] for key in dateRangesToExtract if key in self.dataUsed}
-
-            # Iterate over the dateranges, adding them if they are used
-            for r in dateRanges:
-                if dateRanges[r].get():
-                    queryString = queryString + f"{addAnd}{r} >= ? AND {r} <= ?"
-                    queryParameters.append(addLeadingZeroes(parameters[r][0].get()))
-                    queryParameters.append(addLeadingZeroes(parameters[r][1].get()))
-                    addAnd = " AND "
-        #Close off the queryString
-        queryString = queryString + ")"
-
-        # Use pandas to read the select query
-        result = pd.read_sql_query(queryString, conn, params=tuple(queryParameters))
-
-        if not result.empty:
-            stock_id = result["stock_id"].tolist()
-            stock_name = pd.read_sql_query("SELECT name FROM stock_names WHERE id = ?", conn, params=(stock_id[0],))
-            result["stock_id"] = stock_name["name"]
-            result.rename(columns={'stock_id':'name'}, inplace=True)
-            parameters["result"] = result
-            # show export to csv button
-            self.csvButton.grid(column=0, row=1, padx=10)
-
-            # Increase size of parent window to display table
-            self.controller.centreWindow(800, 600)
-            self.csvButton.grid(column=1, row=1, padx=10)
-            # show the results frame
-            self.sectionFrames["results"].pack(fill="both", expand=True)
-            # Turn result pandas dataframe into a pandastable
-            self.resultsTable = Table(self.sectionFrames["results"], dataframe=parameters["result"], editable=False, showstatusbar=True)
-            # Ensure that the table has completed all setup before displaying
-            self.resultsTable.update_idletasks()
-            self.resultsTable.show()
-            self.resultsTable.redraw()
-            self.resultsTable.autoResizeColumns()
-        else:
-            showerror(title="Check Failed", message="No data found matching this query")
-        conn.close()
-        #endregion
-
-    def exportToCsv(self):
-        """
-        Saves the data currently displayed to a csv at a user-defined location.
-        """
-        #region eTC
-        # open window to choose folder location
-        fileName = fd.asksaveasfilename(
-            defaultextension=".csv",
-            filetypes=[("CSV files", "*.csv"), ("All files", "*.*")],
-            title="Save exported query"
-        )
-
-        if fileName:
-            # save file with set name
-            self.resultsTable.model.df.to_csv(fileName, index=False)
-            showinfo(title="Export complete", message=f"Query results exported to {fileName}.")
+                filters["stockId"] = store.resolve_stock_id(parameters["name"].get())
+                if filters["stockId"] is None:
+                    showerror(title="Check Failed", message="Name/id number was not found in database. Please check spelling")
+                    return
+
+            # Add each date range that is used
+            dateRanges = {"delivered_at": "deliveredAt", "recorded_in_database": "recordedInDatabase", "use_by": "useBy"}
+            for r, filterName in dateRanges.items():
+                if self.dataUsed[r].get():
+                    dates = [d.get() for d in parameters[r]]
+                    if not all(isDate(d) for d in dates):
+                        showerror(title="Check Failed", message="Date must be in the form YYYY-MM-DD")
+                        return
+                    filters[filterName] = tuple(addLeadingZeroes(d) for d in dates)
+
+        # Display the results
+        self.filters = filters
+        self.showResults()
         #endregion
 
     def toggleBatchSearch(self):
@@ -991,12 +1587,16 @@ class CheckBatchPage(ttk.Frame):
 ## class CheckTransactionPage ##
 ################################
 # Frame to display data to construct a query to remove data from a sqlite database
-class CheckTransactionPage(ttk.Frame):
+class CheckTransactionPage(ResultsView, ttk.Frame):
     """
     Page frame used to construct a query to get information from the
     transactions table
 
     """    
+    table = TRANSACTIONS
+    hiddenColumns = ("id",)
+    jobLabel = "checkTransaction"
+
     def __init__(self, parent, controller):
         super().__init__(parent)
         self.controller = controller
@@ -1101,7 +1701,7 @@ class CheckTransactionPage(ttk.Frame):
                 ttk.Radiobutton(self.labels["transaction_type"], text=f"{v}", value=f"{v}", variable=parameters["transaction_type"])
                 for v in TRANSACTION_TYPE
             ],
-            "stock_id": ttk.Entry(self.labels["stock_id"], textvariable=parameters["stock_id"]),
+            "stock_id": NameEntry(self.labels["stock_id"], self.controller, parameters["stock_id"]),
             "occured_at": [
                 ttk.Entry(self.labels["occured_at"], textvariable=parameters["occured_at"][0]),
                 ttk.Entry(self.labels["occured_at"], textvariable=parameters["occured_at"][1])
@@ -1163,14 +1763,12 @@ class CheckTransactionPage(ttk.Frame):
         self.backButton = ttk.Button(self.sectionFrames["main"], text="Back", command=lambda: self.controller.showFrame(MainPage))
         self.backButton.grid(column=1, row=2, padx=10)
 
-        # Frame to hold the results of the last submitted query
-        self.resultsFrame = ttk.Frame(self)
-
-        # Datafield that will hold the pandastable to show the results when/if it is generated
-        self.resultsTable = None
+        # Set up the results grid, which is shown when/if there are results
+        self.setupResults()
 
 
     # construct and submit a query to the database
+    @timed()
     def submitQuery(self):
         """
         Constructs a SELECT query based on the data entered and chosen. If no
@@ -1194,105 +1792,41 @@ class CheckTransactionPage(ttk.Frame):
         
         parameters = self.controller.queryData["parameters"]
 
-        conn = sql.connect(G_DB_PATH)
-        cur = conn.cursor()
-        cur.execute("PRAGMA foreign_keys = ON")
-
-        # Builds a sql SELECT string a bit at a time, then a tuple to insert
-        # the relevant values
-        queryString = "SELECT * FROM transactions WHERE ("
-        queryParameters = []
-
-        # Use the addAnd flag to add an AND to the start of every
-        # additional prompt except the first
-        addAnd = ""
+        store = self.controller.store
 
+        # Collect the filters that are used
+        filters = {}
 
         # if transaction_type is used, add to query
         if self.dataUsed["transaction_type"].get():
-            queryString = queryString +f"{addAnd}transaction_type = ?"
-            queryParameters.append(parameters["transaction_type"].get())
-            addAnd = " AND "
-        
+            filters["transactionType"] = parameters["transaction_type"].get()
+
         # if stock_id is used, add to query
         if self.dataUsed["stock_id"].get():
-            stockId = parameters["stock_id"].get()
-            if not stockId.isnumeric():
-                cur.execute("SELECT id FROM stock_names WHERE name = ?", (parameters["stock_id"].get(),))
-                stockId = cur.fetchone()[0]
-            queryString = queryString +f"{addAnd}stock_id = ?"
-            queryParameters.append(stockId)
-            addAnd = " AND "
-        
-        # Create a subdictionary of ranges to iterate over
-        dateRangesToExtract = ["delivered_at", "occured_at"]
-        dateRanges = {key: self.dataUsed[key] for key in dateRangesToExtract if key in self.dataUsed}
-
-        # Iterate over the dateranges, adding them if they are used
-        for r in dateRanges:
-            if dateRanges[r].get():
-                queryString = queryString + f"{addAnd}{r} >= ? AND {r} <= ?"
-                queryParameters.append(addLeadingZeroes(parameters[r][0].get()))
-                queryParameters.append(addLeadingZeroes(parameters[r][1].get()))
-                addAnd = " AND "
-                
+            filters["stockId"] = store.resolve_stock_id(parameters["stock_id"].get())
+            if filters["stockId"] is None:
+                showerror(title="Check Failed", message="Name/id number was not found in database. Please check spelling")
+                return
+
+        # Add each date range that is used
+        dateRanges = {"occured_at": "occuredAt", "recorded_in_database": "recordedInDatabase"}
+        for r, filterName in dateRanges.items():
+            if self.dataUsed[r].get():
+                dates = [d.get() for d in parameters[r]]
+                if not all(isDate(d) for d in dates):
+                    showerror(title="Check Failed", message="Date must be in the form YYYY-MM-DD")
+                    return
+                filters[filterName] = tuple(addLeadingZeroes(d) for d in dates)
+
         # If removal_reason has been used, add it to the query
         if self.dataUsed["removal_reason"].get():
-            queryString = queryString +f"{addAnd}removal_reason = ?"
-            queryParameters.append(parameters["removal_reason"].get())
-            addAnd = " AND "
-
-        #Close off the queryString
-        queryString = queryString + ")"
-
-        # Use pandas to read the select query
-        result = pd.read_sql_query(queryString, conn, params=tuple(queryParameters))
-        if not result.empty:
-            stock_id = result["stock_id"].tolist()
-            stock_name = pd.read_sql_query("SELECT name FROM stock_names WHERE id = ?", conn, params=(stock_id[0],))
-            result["stock_id"] = stock_name["name"]
-            result.rename(columns={'stock_id':'name'}, inplace=True)
-            result.drop('id', axis=1, inplace=True)
-            parameters["result"] = result
-            # show export to csv button
-            self.csvButton.grid(column=0, row=1, padx=10)
-
-            # Increase size of parent window to display table
-            self.controller.centreWindow(800, 600)
-            self.csvButton.grid(column=1, row=1, padx=10)
-            # show the results frame
-            self.sectionFrames["results"].pack(fill="both", expand=True)
-            # Turn result pandas dataframe into a pandastable
-            self.resultsTable = Table(self.sectionFrames["results"], dataframe=parameters["result"], editable=False, showstatusbar=True)
-            # Ensure that the table has completed all setup before displaying
-            self.resultsTable.update_idletasks()
-            self.resultsTable.show()
-            self.resultsTable.redraw()
-            self.resultsTable.autoResizeColumns()
-        else:
-            showerror(title="Check Failed", message="No data found matching this query")
-        conn.close()
-        #endregion
-
-    def exportToCsv(self):
-        """
-        Saves the data currently displayed to a csv at a user-defined location.
-        """
-        #region eTC
-        # open window to choose folder location
-        fileName = fd.asksaveasfilename(
-            defaultextension=".csv",
-            filetypes=[("CSV files", "*.csv"), ("All files", "*.*")],
-            title="Save exported query"
-        )
+            filters["removalReason"] = parameters["removal_reason"].get()
 
-        if fileName:
-            # save file with set name
-            self.resultsTable.model.df.to_csv(fileName, index=False)
-            showinfo(title="Export complete", message=f"Query results exported to {fileName}.")
+        # Display the results
+        self.filters = filters
+        self.showResults()
         #endregion
 
-
     def toggleVar(self, varName, makeVisible = None):
         """Toggle visibility of a varName on or off
 
@@ -1332,6 +1866,7 @@ class CheckStockPage(ttk.Frame):
         self.controller.queryData["type"] = TYPE_STRING_CHECK
         self.controller.queryData["parameters"] = {
             "stock_id" : tk.StringVar(),
+            "as_of" : tk.StringVar(),
         }
         # assign this variable to shorten the path
         parameters = self.controller.queryData["parameters"]
@@ -1341,6 +1876,7 @@ class CheckStockPage(ttk.Frame):
         self.dataUsed = {
             "full_inventory" : tk.BooleanVar(value=True),
             "stock_id" : tk.BooleanVar(),
+            "as_of" : tk.BooleanVar(),
         }
 
         '''Setup and place primary widgets'''
@@ -1377,6 +1913,7 @@ class CheckStockPage(ttk.Frame):
         # subframes to seperate the different query fields.
         self.subFrames = {
             "stock_id" : ttk.Frame(self.mainFrames["other"]),
+            "as_of" : ttk.Frame(self.mainFrames["other"]),
         }
 
 
@@ -1391,15 +1928,22 @@ class CheckStockPage(ttk.Frame):
                 text="Search by Stock Name", 
                 command=lambda: self.toggleVar("stock_id"), 
                 variable=self.dataUsed["stock_id"]),
+            "as_of" : ttk.Checkbutton(
+                self.subFrames["as_of"],
+                text="Stock Held on a Past Date",
+                command=lambda: self.toggleVar("as_of"),
+                variable=self.dataUsed["as_of"]),
         }
        # Labelframes for each field
         self.labels = {
             "stock_id": ttk.LabelFrame(self.subFrames["stock_id"], text="Name/Id Number of Good"),
+            "as_of": ttk.LabelFrame(self.subFrames["as_of"], text="Date (YYYY-MM-DD)"),
         }
 
         # Entries for each field, bound to the requisite LabelFrame. The three date ranges have attached labels showig if they are to or from
         self.entries = {
-            "stock_id": ttk.Entry(self.labels["stock_id"], textvariable=parameters["stock_id"]),
+            "stock_id": NameEntry(self.labels["stock_id"], self.controller, parameters["stock_id"]),
+            "as_of": ttk.Entry(self.labels["as_of"], textvariable=parameters["as_of"]),
         }
 
         '''
@@ -1441,6 +1985,7 @@ class CheckStockPage(ttk.Frame):
 
 
     # construct and submit a query to the database
+    @timed()
     def submitQuery(self):
         """
         Constructs a SELECT query based on the data entered and chosen. If no
@@ -1462,41 +2007,60 @@ class CheckStockPage(ttk.Frame):
         
         parameters = self.controller.queryData["parameters"]
 
-        conn = sql.connect(G_DB_PATH)
-        cur = conn.cursor()
-        cur.execute("PRAGMA foreign_keys = ON")
+        store = self.controller.store
 
-        queryString = "SELECT * FROM stock_names"
-        # If the search is of one specific stock, add that stock onto the end 
-        # of this query and execute. 
-        # Otherwise, select the whole table
-        query = None
+        # If the search is of one specific stock, total only that stock.
+        # Otherwise, total the whole table
+        stockId = None
         if self.dataUsed["stock_id"].get():
-            stockId = parameters["stock_id"].get()
-            if not stockId.isnumeric():
-                cur.execute("SELECT id FROM stock_names WHERE name = ?", (parameters["stock_id"].get(),))
-                stockId = cur.fetchone()[0]
-            queryString = queryString +" WHERE (id = ?)"
-            query = pd.read_sql_query(queryString, conn, params=(stockId,))
-        else:
-            query = pd.read_sql_query(queryString, conn)
-        
-        quantities = []
-
-        # Iterate over the list of stock. Get the name, use it to run a search 
-        # of batches of that stock. Tally up the total quantity_current, and
-        # append that to quantities.
-        for row in query.itertuples(index=False):
-            batches = pd.read_sql_query("SELECT quantity_current FROM batches WHERE stock_id = ?", conn, params=(row.id,))
-            quantity = 0
-            # Get current stock remaining in batches
-            for q in batches.itertuples(index=False):
-                print(f"{q}")
-                quantity = quantity + int(q.quantity_current)
-            quantities.append(quantity)
-        
-        query["quantity"] = quantities
-        parameters["result"] = query
+            stockId = store.resolve_stock_id(parameters["stock_id"].get())
+            if stockId is None:
+                showerror(title="Check Failed", message="Name/id number was not found in database. Please check spelling")
+                return
+
+        # A past date is found from the ledger rather than the running totals
+        asOf = None
+        if self.dataUsed["as_of"].get():
+            asOf = parameters["as_of"].get()
+            if not isDate(asOf):
+                showerror(title="Check Failed", message="Date must be in the form YYYY-MM-DD")
+                return
+            asOf = addLeadingZeroes(asOf)
+
+        def search(store):
+            if asOf is None:
+                # Read the running totals kept in the stock_totals table
+                return store.stock_totals(stockId)
+            try:
+                # Checkpoint any month ended since the last search, so that
+                # as little of the ledger as possible is read
+                store.update_checkpoints()
+            except DatabaseBusyError:
+                # The checkpoints already made are enough to find the levels
+                pass
+            return store.stock_levels_at(asOf, stockId)
+
+        def found(totals):
+            columns, rows = totals
+            pd, Table = loadResultsModules()
+            parameters["result"] = pd.DataFrame.from_records(rows, columns=columns)
+            self.displayTotals()
+
+        def failed(error):
+            if isinstance(error, DatabaseBusyError):
+                showerror(title="Database busy", message=BUSY_MESSAGE)
+            elif isinstance(error, sql.Error):
+                showerror(title="Check Failed", message="Query failed to read the database. Please contact your system administrator")
+            else:
+                showerror(title="Check Failed", message=f"The search could not be completed: {error}")
+
+        self.controller.runInBackground(search, found, failed, message="Searching...", label="checkStock.search")
+
+    @timed()
+    def displayTotals(self):
+        """Display the stock totals found by submitQuery"""
+        parameters = self.controller.queryData["parameters"]
+        pd, Table = loadResultsModules()
 
         # If the query was successful, construct the table
         if not parameters["result"].empty:
@@ -1517,7 +2081,6 @@ class CheckStockPage(ttk.Frame):
             self.resultsTable.autoResizeColumns()
         else:
             showerror(title="Check Failed", message="No data found matching this query")
-        conn.close()
 
     def exportToCsv(self):
         # open window to choose folder location
@@ -1550,4 +2113,365 @@ class CheckStockPage(ttk.Frame):
             self.labels[varName].pack(anchor=tk.W)
         else:
             self.labels[varName].pack_forget()
-    
\ No newline at end of file
+    
+##############################
+## class ExpiryForecastPage ##
+##############################
+# Frame to forecast how much stock will reach its use by date
+class ExpiryForecastPage(ttk.Frame):
+    """
+    Page frame used to forecast the quantity of each stock type that will
+    expire on each day or week ahead, along with the quantity that has
+    already expired but is still held
+
+    """    
+    def __init__(self, parent, controller):
+        super().__init__(parent)
+        self.controller = controller
+        self.controller.centreWindow(400, 400)
+        '''Setup datafields for query'''
+        # Datafields to store information for the forecast
+        self.controller.queryData["type"] = TYPE_STRING_CHECK
+        self.controller.queryData["parameters"] = {
+            "stock_id" : tk.StringVar(),
+            "horizon" : tk.IntVar(value=DEFAULT_FORECAST_DAYS),
+            "bucket" : tk.StringVar(value="Day"),
+        }
+        # assign this variable to shorten the path
+        parameters = self.controller.queryData["parameters"]
+
+        # datafields to record if the respective variable field is used
+        self.dataUsed = {
+            "stock_id" : tk.BooleanVar(),
+        }
+
+        '''Setup and place primary widgets'''
+        # Frames to divide the screen between fields/buttons and the results table
+        self.sectionFrames = {
+            "main" : ttk.Frame(self),
+            "results" : ttk.Frame(self)
+        }
+        self.sectionFrames["main"].columnconfigure(index=0, weight=4)
+        self.sectionFrames["main"].columnconfigure(index=1, weight=1)
+        for row in range(3):
+            self.sectionFrames["main"].rowconfigure(index=row, weight=1)
+
+        # Create large container frame for datafields
+        self.dataFieldFrame = ttk.Frame(self.sectionFrames["main"])
+        for d in self.sectionFrames.values():
+            d.pack(fill="both", expand=True)
+        self.dataFieldFrame.grid(column=0, row=0, rowspan=3)
+
+        '''Setup widgets'''
+        self.checkBoxes = {
+            "stock_id" : ttk.Checkbutton(
+                self.dataFieldFrame,
+                text="Forecast one Stock Type",
+                command=lambda: self.toggleVar("stock_id"),
+                variable=self.dataUsed["stock_id"]),
+        }
+        # Labelframes for each field
+        self.labels = {
+            "stock_id": ttk.LabelFrame(self.dataFieldFrame, text="Name/Id Number of Good"),
+            "horizon": ttk.LabelFrame(self.dataFieldFrame, text="Days Ahead to Forecast"),
+            "bucket": ttk.LabelFrame(self.dataFieldFrame, text="Total Each"),
+        }
+        self.entries = {
+            "stock_id": NameEntry(self.labels["stock_id"], self.controller, parameters["stock_id"]),
+            "horizon": ttk.Entry(self.labels["horizon"], textvariable=parameters["horizon"]),
+            "bucket": ttk.Combobox(self.labels["bucket"], textvariable=parameters["bucket"], values=list(FORECAST_BUCKETS), state="readonly"),
+        }
+
+        '''Place datafield widgets'''
+        self.checkBoxes["stock_id"].pack(padx=10, anchor=tk.W)
+        for d in self.labels.values():
+            d.pack(padx=10, anchor=tk.W)
+        for d in self.entries.values():
+            d.pack(anchor=tk.W, padx=10, pady=10)
+        # hide unused datafields
+        self.labels["stock_id"].pack_forget()
+
+        '''Place button widgets'''
+        self.submitDetails = ttk.Button(self.sectionFrames["main"], text="Submit details", command=self.submitQuery)
+        self.submitDetails.grid(column=1, row=0, padx=10)
+
+        # Construct but do not place Button to export to csv
+        self.csvButton = ttk.Button(self.sectionFrames["main"], text="Export results to .csv", command= self.exportToCsv)
+
+        # Button to return to main page
+        self.backButton = ttk.Button(self.sectionFrames["main"], text="Back", command=lambda: self.controller.showFrame(MainPage))
+        self.backButton.grid(column=1, row=2, padx=10)
+
+        # Datafield that will hold the pandastable to show the results when/if it is generated
+        self.resultsTable = None
+
+    @timed()
+    def submitQuery(self):
+        """
+        Forecasts the stock expiring over the chosen number of days on the
+        DatabaseWorker, and displays a row for each stock type with stock
+        expired or expiring.
+        """
+        parameters = self.controller.queryData["parameters"]
+
+        stockId = None
+        if self.dataUsed["stock_id"].get():
+            stockId = self.controller.store.resolve_stock_id(parameters["stock_id"].get())
+            if stockId is None:
+                showerror(title="Check Failed", message="Name/id number was not found in database. Please check spelling")
+                return
+        try:
+            horizon = parameters["horizon"].get()
+        except tk.TclError:
+            horizon = 0
+        if horizon < 1:
+            showerror(title="Check Failed", message="The days ahead to forecast must be a whole number of at least 1")
+            return
+        bucketDays = FORECAST_BUCKETS[parameters["bucket"].get()]
+
+        def found(table):
+            columns, rows = table
+            if not rows:
+                showerror(title="Check Failed", message="No stock expires within the days ahead")
+                return
+            pd, Table = loadResultsModules()
+            parameters["result"] = pd.DataFrame.from_records(rows, columns=columns)
+            self.displayForecast()
+
+        def failed(error):
+            if isinstance(error, DatabaseBusyError):
+                showerror(title="Database busy", message=BUSY_MESSAGE)
+            elif isinstance(error, sql.Error):
+                showerror(title="Check Failed", message="Query failed to read the database. Please contact your system administrator")
+            else:
+                showerror(title="Check Failed", message=f"The forecast could not be completed: {error}")
+
+        def forecast(store):
+            from A1_inventory_management.expiry_forecast import forecastExpiry, forecastTable
+            return forecastTable(forecastExpiry(store, horizon, bucketDays, stockId=stockId))
+
+        self.controller.runInBackground(forecast, found, failed, message="Forecasting...", label="expiryForecast.forecast")
+
+    @timed()
+    def displayForecast(self):
+        """Display the forecast found by submitQuery"""
+        result = self.controller.queryData["parameters"]["result"]
+        pd, Table = loadResultsModules()
+        self.csvButton.grid(column=1, row=1, padx=10)
+        if self.resultsTable is None:
+            # Increase size of parent window to display table
+            self.controller.centreWindow(800, 600)
+            self.sectionFrames["results"].pack(fill="both", expand=True)
+            self.resultsTable = Table(self.sectionFrames["results"], dataframe=result, editable=False, showstatusbar=True)
+            # Ensure that the table has completed all setup before displaying
+            self.resultsTable.update_idletasks()
+            self.resultsTable.show()
+        else:
+            self.resultsTable.model.df = result
+        self.resultsTable.redraw()
+        self.resultsTable.autoResizeColumns()
+
+    def exportToCsv(self):
+        # open window to choose folder location
+        fileName = fd.asksaveasfilename(
+            defaultextension=".csv",
+            filetypes=[("CSV files", "*.csv"), ("All files", "*.*")],
+            title="Save exported query"
+        )
+
+        if fileName:
+            # The forecast has a row for each stock type, so the displayed
+            # table is written as it is
+            self.resultsTable.model.df.to_csv(fileName, index=False)
+            showinfo(title="Export complete", message=f"Query results exported to {fileName}.")
+
+    def toggleVar(self, varName, makeVisible = None):
+        """Toggle visibility of a varName on or off
+
+        Args:
+            varName (string): string identifying which varName is to be toggled
+
+            makeVisible(bool): Boolean that on None toggles, on True turns 
+                        varName on, and on False turns varName off
+        """
+        if makeVisible is None:
+            makeVisible = not self.labels[varName].winfo_ismapped()
+
+        if makeVisible:
+            self.labels[varName].pack(anchor=tk.W, after=self.checkBoxes[varName])
+        else:
+            self.labels[varName].pack_forget()
+
+#######################
+## class CatalogPage ##
+#######################
+# Frame to add, rename and retire stock types
+class CatalogPage(ttk.Frame):
+    """
+    Frame to manage the catalog of stock types. A stock type can be added,
+    renamed, retired so that no more batches of it can be added, or put back
+    in use. The catalog can also be loaded from a product master file.
+    """
+    def __init__(self, parent, controller):
+        super().__init__(parent)
+        self.controller = controller
+        self.controller.queryData["type"] = TYPE_STRING_CATALOG
+        self.controller.queryData["parameters"] = {
+            "stock": tk.StringVar(),
+            "name": tk.StringVar(),
+        }
+        parameters = self.controller.queryData["parameters"]
+
+        self.labels = {
+            "stock": ttk.Labelframe(self, text="Name/Id Number of Stock Type"),
+            "name": ttk.Labelframe(self, text="New Name"),
+        }
+        self.entries = {
+            "stock": NameEntry(self.labels["stock"], self.controller, parameters["stock"]),
+            "name": ttk.Entry(self.labels["name"], textvariable=parameters["name"]),
+        }
+        for dataField in self.labels:
+            self.labels[dataField].pack()
+            self.entries[dataField].pack(padx=5, pady=5)
+
+        # Shows the id of the chosen stock type, and whether it is retired.
+        # It is read from the store's index of names, so it is updated as
+        # names are typed without waiting on the database
+        self.stockStatus = ttk.Label(self.labels["stock"], text="")
+        self.stockStatus.pack()
+        parameters["stock"].trace_add("write", lambda *args: self.showStockStatus())
+
+        ttk.Button(self, text="Add new stock type", command=self.addStockType).pack()
+        ttk.Button(self, text="Rename stock type", command=self.renameStockType).pack()
+        ttk.Button(self, text="Retire stock type", command=lambda: self.setRetired(True)).pack()
+        ttk.Button(self, text="Put stock type back in use", command=lambda: self.setRetired(False)).pack()
+        ttk.Button(self, text="Load catalog from file", command=self.loadFromFile).pack()
+
+        self.backButton = ttk.Button(self, text="Back", command=lambda: self.controller.showFrame(MainPage))
+        self.backButton.pack()
+
+    def showStockStatus(self):
+        """Show the id of the stock type entered, and whether it is retired"""
+        # The variable can outlive the page, which is destroyed when another
+        # is shown
+        if not self.winfo_exists():
+            return
+        stockIndex = self.controller.store.stock_name_index()
+        stockId = stockIndex.resolve(self.controller.queryData["parameters"]["stock"].get())
+        if stockId is None:
+            self.stockStatus["text"] = ""
+        else:
+            state = "retired" if stockIndex.isRetired(stockId) else "in use"
+            self.stockStatus["text"] = f"{stockIndex.nameOf(stockId)}: id {stockId}, {state}"
+
+    def chosenStockId(self):
+        """The id of the stock type entered, or None after telling the user
+        that it was not found"""
+        stockId = self.controller.store.resolve_stock_id(self.controller.queryData["parameters"]["stock"].get())
+        if stockId is None:
+            showerror(title="Stock type not found", message="Name/id number was not found in database. Please check spelling")
+        return stockId
+
+    def addStockType(self):
+        """Add a stock type with the new name"""
+        name = self.controller.queryData["parameters"]["name"].get().strip()
+        if askyesno(title="Confirm new stock type", message=f"You want to add the stock type {name}.\n\nAre you sure?"):
+            self.submitChange(lambda store: store.add_stock_type(name), f"{name} was added to the catalog.", "catalog.addStockType")
+
+    def renameStockType(self):
+        """Give the chosen stock type the new name"""
+        stockId = self.chosenStockId()
+        if stockId is None:
+            return
+        oldName = self.controller.store.stock_names()[stockId]
+        name = self.controller.queryData["parameters"]["name"].get().strip()
+        if askyesno(title="Confirm rename", message=f"You want to rename {oldName} to {name}. Its batches and transactions will keep it.\n\nAre you sure?"):
+            self.submitChange(lambda store: store.rename_stock_type(stockId, name), f"{oldName} was renamed to {name}.", "catalog.renameStockType")
+
+    def setRetired(self, retired):
+        """Retire the chosen stock type, or put it back in use
+
+        Args:
+            retired (bool): True to retire it, and False to put it back in use
+        """
+        stockId = self.chosenStockId()
+        if stockId is None:
+            return
+        name = self.controller.store.stock_names()[stockId]
+        if retired:
+            message = f"You want to retire {name}. No more batches of it can be added, but its stock can still be removed.\n\nAre you sure?"
+            if askyesno(title="Confirm retirement", message=message):
+                self.submitChange(lambda store: store.retire_stock_type(stockId), f"{name} was retired.", "catalog.retireStockType")
+        elif askyesno(title="Confirm return to use", message=f"You want to put {name} back in use.\n\nAre you sure?"):
+            self.submitChange(lambda store: store.restore_stock_type(stockId), f"{name} is back in use.", "catalog.restoreStockType")
+
+    @timed()
+    def submitChange(self, work, doneMessage, label):
+        """Make a change to the catalog on the worker, and tell the user how
+        it went
+
+        Args:
+            work (function): makes the change with the worker's store
+            doneMessage (string): shown once the change is made
+            label (string): the name the change is timed under
+        """
+        def changed(result):
+            showinfo(title="Catalog updated", message=doneMessage)
+            self.controller.queryData["outcome"] = SUCCESS_STRING_G
+            self.showStockStatus()
+
+        self.controller.runInBackground(work, changed, self.changeFailed, message="Updating catalog...", cancellable=False, label=label)
+
+    def changeFailed(self, error):
+        """Tell the user why a change to the catalog was not made"""
+        if isinstance(error, (ManifestError, OSError)):
+            showerror(title="Load failed", message=f"The catalog file could not be read: {error}")
+            return
+        if isinstance(error, DatabaseBusyError):
+            showerror(title="Database busy", message=BUSY_MESSAGE)
+        elif isinstance(error, ValueError):
+            showerror(title="Catalog not updated", message=f"{error}. The database has not been altered.")
+        elif isinstance(error, sql.Error):
+            showerror(title="Catalog not updated", message="Query failed to update stock_names. The database has not been altered. Please contact your system administrator")
+        else:
+            # Shown rather than raised, as this is called from the Tk event
+            # loop
+            showerror(title="Catalog not updated", message=f"The catalog could not be updated: {error}. The database has not been altered. Please contact your system administrator")
+        self.controller.queryData["outcome"] = FAILURE_STRING_G
+
+    def loadFromFile(self):
+        """
+        Add or update every stock type in a product master (.csv or .xlsx).
+        The file is checked first, and the user is shown what would change
+        before anything is written. Rows that are not valid are skipped, and
+        can be saved to a report.
+        """
+        fileName = fd.askopenfilename(
+            filetypes=[("Product masters", "*.csv *.xlsx *.xls"), ("All files", "*.*")],
+            title="Choose product master"
+        )
+        if not fileName:
+            return
+
+        def checked(report):
+            infoString = (
+                f"{report.added} stock types will be added and {report.updated} updated. "
+                f"{report.unchanged} are already in the catalog, and {len(report.errors)} rows are not valid and will be skipped.\n\nAre you sure?"
+            )
+            if report.added + report.updated == 0 or not askyesno(title="Confirm catalog load", message=infoString):
+                saveImportErrors(report.errors)
+                return
+            self.controller.runInBackground(
+                lambda store: loadCatalog(store, fileName),
+                loaded, self.changeFailed, message="Loading catalog...", cancellable=False, label="catalog.loadCatalog"
+            )
+
+        def loaded(report):
+            showinfo(title="Catalog loaded", message=f"{report.added} stock types were added and {report.updated} updated.")
+            self.controller.queryData["outcome"] = SUCCESS_STRING_G
+            saveImportErrors(report.errors)
+
+        self.controller.runInBackground(
+            lambda store: loadCatalog(store, fileName, dryRun=True),
+            checked, self.changeFailed, message="Checking catalog...", label="catalog.checkCatalog"
+        )
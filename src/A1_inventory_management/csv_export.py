@@ -0,0 +1,78 @@
+# This file defines the export of search results to csv. The search is run
+# again and its rows are streamed from the cursor a batch at a time, so an
+# export of any size is written without holding its results in memory.
+import csv
+import gzip
+from pathlib import Path
+
+from A1_inventory_management.instrumentation import rowsRead
+
+DEFAULT_FETCH_SIZE = 5000
+
+
+#########################
+## def exportSearch () ##
+#########################
+# Stream every row a search matches into a csv file
+def exportSearch(store, query, path, stockNames=None, skipColumns=(), compress=None,
+                 progress=None, checkCancelled=None, fetchSize=DEFAULT_FETCH_SIZE):
+    """Write every row matched by a search to a csv file.
+
+    The rows are read from the cursor with fetchmany and written as they
+    arrive. If the export fails or is cancelled, the partly written file is
+    deleted.
+
+    Args:
+        store (InventoryStore): the store to search
+        query (SearchQuery): the search to export. Its page and limit are
+            used, so pass a query without them to export every match
+        path (string or Path): the file to write
+        stockNames (dict): name of each stock id. If given, the stock_id
+            column is written as the stock name under the heading name
+        skipColumns (list): columns of the search not to write
+        compress (bool): whether to gzip the file. If None, it is gzipped
+            when path ends in .gz
+        progress (function): called with the number of rows written after
+            each batch
+        checkCancelled (function): called before each batch, and raises to
+            stop the export
+        fetchSize (int): the number of rows read from the cursor at a time
+
+    Returns:
+        int: the number of rows written
+    """
+    path = Path(path)
+    if compress is None:
+        compress = path.suffix.lower() == ".gz"
+    cur = store.search_cursor(query)
+    try:
+        columns = [d[0] for d in cur.description]
+        keep = [i for i, c in enumerate(columns) if c not in skipColumns]
+        stockColumn = columns.index("stock_id") if stockNames is not None else None
+        header = ["name" if i == stockColumn else columns[i] for i in keep]
+
+        written = 0
+        with (gzip.open(path, "wt", newline="") if compress else open(path, "w", newline="")) as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            while True:
+                if checkCancelled is not None:
+                    checkCancelled()
+                rows = rowsRead(cur.fetchmany(fetchSize))
+                if not rows:
+                    break
+                if stockColumn is not None:
+                    rows = [r[:stockColumn] + (stockNames.get(r[stockColumn]),) + r[stockColumn + 1:] for r in rows]
+                if len(keep) < len(columns):
+                    rows = [[r[i] for i in keep] for r in rows]
+                writer.writerows(rows)
+                written += len(rows)
+                if progress is not None:
+                    progress(written)
+    except BaseException:
+        # Do not leave half an export behind
+        path.unlink(missing_ok=True)
+        raise
+    finally:
+        cur.close()
+    return written
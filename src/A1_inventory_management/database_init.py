@@ -2,6 +2,9 @@ from platformdirs import user_data_dir
 import sqlite3 as sql
 from pathlib import Path
 
+from A1_inventory_management.instrumentation import timed
+from A1_inventory_management.utils.datetime_helpers import toDayNumber
+
 # Construct the path to the final location of the database
 G_DATA_DIR = Path(user_data_dir("A1_inventory_management"))
 G_DATA_DIR.mkdir(parents=True, exist_ok=True)
@@ -11,17 +14,124 @@ G_DB_PATH = G_DATA_DIR / "stock_database.db"
 ## def initialiseDb () ##
 #########################
 # If databases don't exist, initialise them from the db_sqlite_code file
-def initialiseDb():
+@timed()
+def initialiseDb(dbPath=G_DB_PATH, walMode=True):
+    # In WAL mode, stations can keep reading while another writes, and
+    # writers do not wait for readers. It needs every station to run on the
+    # computer that holds the database, so walMode should be False for a
+    # database kept on a network share.
+
     # Find the path to the sql code for the database
     path = Path(__file__).parent / "dbs/db_sqlite_code.sql"
 
 
-    conn = sql.connect(G_DB_PATH)
+    conn = sql.connect(dbPath)
+    _migrateTextDates(conn)
+    _migrateStockNames(conn, dbPath)
     sqlScript = ""
     with open(path) as f:
         sqlScript = f.read()
     cursor = conn.cursor()
     cursor.executescript(sqlScript)
     conn.commit()
+    conn.execute(f"PRAGMA journal_mode = {'WAL' if walMode else 'DELETE'}")
     conn.close()
 
+##############################
+## def _migrateTextDates () ##
+##############################
+# Convert a database that stores its dates as TEXT to integer day numbers
+def _migrateTextDates(conn):
+    # table_xinfo marks generated columns as hidden. delivered_at is only a
+    # plain column in a database that still stores its dates as TEXT, and
+    # does not exist at all in a new database
+    hidden = {row[1]: row[6] for row in conn.execute("PRAGMA table_xinfo(batches)")}
+    if hidden.get("delivered_at") != 0:
+        return
+
+    path = Path(__file__).parent / "dbs/migrate_integer_dates.sql"
+    with open(path) as f:
+        sqlScript = f.read()
+    conn.create_function("day_number", 1, _dayNumberOrNone, deterministic=True)
+    conn.execute("PRAGMA foreign_keys = OFF")
+    conn.executescript(sqlScript)
+
+###############################
+## def _migrateStockNames () ##
+###############################
+# Add the columns and unique names that the catalog needs to an older database
+def _migrateStockNames(conn, dbPath):
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(stock_names)")]
+    if not columns:
+        return
+    if "retired_day" not in columns:
+        conn.execute("ALTER TABLE stock_names ADD COLUMN retired_day INTEGER CHECK (typeof(retired_day) IN ('integer', 'null'))")
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'idx_stock_names_name'").fetchone():
+        return
+
+    # Before names had to be unique, the four built in stock types were added
+    # again each time a database was initialised. Each stock type is merged
+    # into the one with the lowest id that has the same name in any case
+    conn.execute("DROP TABLE IF EXISTS temp.merged_names")
+    conn.execute(
+        "CREATE TEMP TABLE merged_names AS "
+        "SELECT s.id AS old_id, (SELECT MIN(k.id) FROM stock_names k WHERE k.name = s.name COLLATE NOCASE) AS new_id "
+        "FROM stock_names s WHERE old_id <> new_id"
+    )
+    if conn.execute("SELECT 1 FROM merged_names").fetchone():
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        # Archives are changed first, each on its own, so that if the merge
+        # is stopped it is made again in full the next time
+        if "archived_years" in tables:
+            for (fileName,) in conn.execute("SELECT file_name FROM archived_years").fetchall():
+                archive = Path(dbPath).parent / fileName
+                if not archive.exists():
+                    continue
+                conn.execute("ATTACH DATABASE ? AS merged_archive", (str(archive),))
+                try:
+                    for table in ("batches", "transactions"):
+                        conn.execute(
+                            f"UPDATE merged_archive.{table} SET stock_id = (SELECT new_id FROM merged_names WHERE old_id = stock_id) "
+                            "WHERE stock_id IN (SELECT old_id FROM merged_names)"
+                        )
+                    conn.commit()
+                finally:
+                    conn.execute("DETACH DATABASE merged_archive")
+
+        with conn:
+            # The triggers move the totals and daily totals of the batches and
+            # transactions in this database, and drop the checkpoints they
+            # were counted in
+            for table in ("batches", "transactions"):
+                conn.execute(
+                    f"UPDATE main.{table} SET stock_id = (SELECT new_id FROM merged_names WHERE old_id = stock_id) "
+                    "WHERE stock_id IN (SELECT old_id FROM merged_names)"
+                )
+            # What is left was counted from archived transactions
+            if "transaction_daily" in tables:
+                conn.execute(
+                    "INSERT INTO transaction_daily (day, stock_id, transaction_type, removal_reason, quantity, transaction_count) "
+                    "SELECT d.day, m.new_id, d.transaction_type, d.removal_reason, d.quantity, d.transaction_count "
+                    "FROM transaction_daily d JOIN merged_names m ON m.old_id = d.stock_id WHERE true "
+                    "ON CONFLICT (day, stock_id, transaction_type, removal_reason) DO UPDATE SET "
+                    "quantity = quantity + excluded.quantity, transaction_count = transaction_count + excluded.transaction_count"
+                )
+                conn.execute("DELETE FROM transaction_daily WHERE stock_id IN (SELECT old_id FROM merged_names)")
+            if "stock_checkpoints" in tables:
+                conn.execute(
+                    "DELETE FROM checkpoint_days WHERE day >= "
+                    "(SELECT MIN(day) FROM stock_checkpoints WHERE stock_id IN (SELECT old_id FROM merged_names))"
+                )
+                conn.execute("DELETE FROM stock_checkpoints WHERE day NOT IN (SELECT day FROM checkpoint_days)")
+            if "stock_totals" in tables:
+                conn.execute("DELETE FROM stock_totals WHERE stock_id IN (SELECT old_id FROM merged_names)")
+            conn.execute("DELETE FROM stock_names WHERE id IN (SELECT old_id FROM merged_names)")
+    conn.execute("DROP TABLE temp.merged_names")
+
+def _dayNumberOrNone(date):
+    # Dates that were saved without leading zeroes are converted as well.
+    # Anything that is not a date at all becomes NULL
+    try:
+        return toDayNumber(date)
+    except (TypeError, ValueError):
+        return None
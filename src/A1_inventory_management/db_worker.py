@@ -0,0 +1,201 @@
+# This file defines the DatabaseWorker, a thread that owns a connection to the
+# stock database and runs queries and changes for the pages in core.py, so
+# that the window keeps responding while they run. Results are handed back to
+# the thread that calls poll(), which the App does from its Tk event loop.
+import queue
+import sqlite3 as sql
+import threading
+
+from A1_inventory_management.database_init import G_DB_PATH
+from A1_inventory_management.instrumentation import timer
+from A1_inventory_management.inventory_store import InventoryStore
+
+
+class JobCancelled(Exception):
+    """Raised inside a job when it has been cancelled"""
+
+
+###############
+## class Job ##
+###############
+# A piece of work given to the worker, and what to do with its outcome
+class Job:
+    def __init__(self, work, onDone, onError, label=None):
+        self.work = work
+        # Name the job is timed under
+        self.label = label if label is not None else work.__qualname__
+        self.onDone = onDone
+        self.onError = onError
+        self.cancelled = False
+        self.finished = False
+        # Latest progress reported by the job while it runs
+        self.progress = None
+
+
+##########################
+## class DatabaseWorker ##
+##########################
+# Thread that runs jobs against its own connection one at a time
+class DatabaseWorker:
+    """
+    Runs jobs against an InventoryStore on a background thread. A job is a
+    function that takes the store and returns a result. Jobs run one at a
+    time in the order they were submitted, and their onDone or onError
+    callback is called from poll() in the thread that polls, never from the
+    worker thread.
+
+    A job can be cancelled before it starts, or while it runs. A running job
+    is stopped by interrupting the statement it is executing, and jobs that
+    loop over many statements should also call checkCancelled() between them.
+    A cancelled job's callbacks are not called.
+    """
+    def __init__(self, dbPath=G_DB_PATH, **storeOptions):
+        self._jobs = queue.Queue()
+        self._finished = queue.Queue()
+        # Guards _current, so that a job cannot finish between cancel()
+        # checking it is running and interrupting it
+        self._lock = threading.Lock()
+        self._current = None
+        self._opened = threading.Event()
+        self._openError = None
+        self.store = None
+        self._thread = threading.Thread(target=self._run, args=(dbPath, storeOptions), name="DatabaseWorker", daemon=True)
+        self._thread.start()
+        # Report a database that cannot be opened straight away rather than
+        # from the first job
+        self._opened.wait()
+        if self._openError is not None:
+            raise self._openError
+
+    def submit(self, work, onDone=None, onError=None, label=None):
+        """Queue a job to run on the worker thread
+
+        Args:
+            work (function): called with the InventoryStore. Its return value
+                is passed to onDone
+            onDone (function): called with the result of work
+            onError (function): called with the exception raised by work
+            label (string): the name the job is timed under, such as
+                "checkBatch.search". If None, the name of work, which does
+                not tell lambdas apart
+
+        Returns:
+            Job: the submitted job, which can be passed to cancel()
+        """
+        job = Job(work, onDone, onError, label)
+        self._jobs.put(job)
+        return job
+
+    def cancel(self, job):
+        """Stop a job. If it has not started it is skipped, and if it is
+        running the statement it is executing is interrupted. Nothing happens
+        if it has already finished.
+
+        Args:
+            job (Job): the job to stop
+        """
+        with self._lock:
+            job.cancelled = True
+            if self._current is job:
+                self.store.conn.interrupt()
+
+    def checkCancelled(self):
+        """Raise JobCancelled if the running job has been cancelled. Called
+        by jobs from the worker thread between the steps of long work"""
+        with self._lock:
+            if self._current is not None and self._current.cancelled:
+                raise JobCancelled()
+
+    def reportProgress(self, progress):
+        """Record how far the running job has got, for the polling thread to
+        show. Called by jobs from the worker thread
+
+        Args:
+            progress: any description of the progress, such as a message
+        """
+        with self._lock:
+            if self._current is not None:
+                self._current.progress = progress
+
+    def busy(self):
+        """Whether any job is waiting, running, or has an outcome that has
+        not yet been delivered by poll()"""
+        return self._jobs.unfinished_tasks > 0 or not self._finished.empty()
+
+    def poll(self):
+        """Call the callbacks of every job that has finished since the last
+        poll
+
+        Returns:
+            int: the number of jobs whose outcome was delivered
+        """
+        delivered = 0
+        while True:
+            try:
+                job, result, error = self._finished.get_nowait()
+            except queue.Empty:
+                return delivered
+            job.finished = True
+            delivered += 1
+            if job.cancelled:
+                continue
+            if error is None:
+                if job.onDone is not None:
+                    job.onDone(result)
+            elif job.onError is not None:
+                job.onError(error)
+            else:
+                raise error
+
+    def close(self):
+        """Finish the current job, drop any that have not started, and close
+        the worker's connection"""
+        while True:
+            try:
+                job = self._jobs.get_nowait()
+            except queue.Empty:
+                break
+            job.cancelled = True
+            self._jobs.task_done()
+        self._jobs.put(None)
+        self._thread.join()
+
+    def _run(self, dbPath, storeOptions):
+        try:
+            self.store = InventoryStore(dbPath, **storeOptions)
+        except BaseException as e:
+            self._openError = e
+            return
+        finally:
+            self._opened.set()
+
+        try:
+            while True:
+                job = self._jobs.get()
+                if job is None:
+                    self._jobs.task_done()
+                    break
+                self._runJob(job)
+                self._jobs.task_done()
+        finally:
+            self.store.close()
+
+    def _runJob(self, job):
+        with self._lock:
+            if job.cancelled:
+                self._finished.put((job, None, JobCancelled()))
+                return
+            self._current = job
+        result = None
+        error = None
+        try:
+            with timer(job.label):
+                result = job.work(self.store)
+        except Exception as e:
+            error = e
+        with self._lock:
+            self._current = None
+            # An interrupted statement raises OperationalError
+            if job.cancelled and isinstance(error, sql.OperationalError):
+                error = JobCancelled()
+        self._finished.put((job, result, error))
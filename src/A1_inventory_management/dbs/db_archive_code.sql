@@ -0,0 +1,44 @@
+-- Tables of an archive file written by archive.py. Each file holds the
+-- transactions of one year and the batches emptied in that year, moved out of
+-- the stock database. The columns match those of the stock database so that
+-- both are searched by the same queries. There are no foreign keys, as the
+-- stock types and batches the rows refer to may still be in the stock
+-- database.
+CREATE TABLE IF NOT EXISTS batches (
+  id INTEGER PRIMARY KEY,
+  stock_id INTEGER NOT NULL,
+  quantity_initial INTEGER NOT NULL CHECK (quantity_initial >= 0),
+  quantity_current INTEGER NOT NULL CHECK (quantity_current >= 0),
+  delivered_day INTEGER CHECK (typeof(delivered_day) IN ('integer', 'null')),
+  recorded_at INTEGER,
+  use_by_day INTEGER CHECK (typeof(use_by_day) IN ('integer', 'null')),
+  delivered_at TEXT GENERATED ALWAYS AS (date(delivered_day * 86400, 'unixepoch')) VIRTUAL,
+  recorded_in_database TEXT GENERATED ALWAYS AS (datetime(recorded_at, 'unixepoch')) VIRTUAL,
+  use_by TEXT GENERATED ALWAYS AS (date(use_by_day * 86400, 'unixepoch')) VIRTUAL
+);
+
+CREATE TABLE IF NOT EXISTS transactions (
+  id INTEGER PRIMARY KEY,
+  transaction_type TEXT NOT NULL CHECK (transaction_type IN ('addition', 'removal')),
+  batch_id INTEGER NOT NULL,
+  stock_id INTEGER NOT NULL,
+  quantity INTEGER NOT NULL CHECK (quantity >= 0),
+  removal_reason TEXT,
+  occured_day INTEGER CHECK (typeof(occured_day) IN ('integer', 'null')),
+  recorded_at INTEGER,
+  occured_at TEXT GENERATED ALWAYS AS (date(occured_day * 86400, 'unixepoch')) VIRTUAL,
+  recorded_in_database TEXT GENERATED ALWAYS AS (datetime(recorded_at, 'unixepoch')) VIRTUAL
+);
+
+-- The same indexes as the stock database, for the same searches
+CREATE INDEX IF NOT EXISTS idx_batches_stock_delivered ON batches (stock_id, delivered_day);
+CREATE INDEX IF NOT EXISTS idx_batches_delivered_at ON batches (delivered_day);
+CREATE INDEX IF NOT EXISTS idx_batches_use_by ON batches (use_by_day);
+CREATE INDEX IF NOT EXISTS idx_batches_recorded ON batches (recorded_at);
+
+CREATE INDEX IF NOT EXISTS idx_transactions_stock_occured ON transactions (stock_id, occured_day);
+CREATE INDEX IF NOT EXISTS idx_transactions_type_occured ON transactions (transaction_type, occured_day);
+CREATE INDEX IF NOT EXISTS idx_transactions_reason_occured ON transactions (removal_reason, occured_day);
+CREATE INDEX IF NOT EXISTS idx_transactions_occured ON transactions (occured_day);
+CREATE INDEX IF NOT EXISTS idx_transactions_recorded ON transactions (recorded_at);
+CREATE INDEX IF NOT EXISTS idx_transactions_batch ON transactions (batch_id);
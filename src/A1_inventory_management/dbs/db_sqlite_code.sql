@@ -1,23 +1,70 @@
+-- A stock type is retired when it is no longer delivered. It keeps its
+-- batches and transactions, and can still be searched and removed from, but
+-- batches can no longer be added. retired_day is the day it was retired, and
+-- NULL for a stock type in use.
 CREATE TABLE IF NOT EXISTS stock_names (
   id INTEGER PRIMARY KEY AUTOINCREMENT,
-  name TEXT NOT NULL CHECK (LENGTH(name) <= 50)
+  name TEXT NOT NULL CHECK (LENGTH(name) <= 50),
+  retired_day INTEGER CHECK (typeof(retired_day) IN ('integer', 'null'))
 );
 
-INSERT OR IGNORE INTO stock_names (name)
-VALUES
-    ('nuts'),
-    ('steel plates'),
-    ('screws'),
-    ('folding chairs');
+-- Names are unique whatever their case, so that a name only ever finds one
+-- stock type. The catalog loader adds or updates the stock type of each name
+-- with an upsert on this index.
+CREATE UNIQUE INDEX IF NOT EXISTS idx_stock_names_name ON stock_names (name COLLATE NOCASE);
 
+-- The built-in stock types are only added to a new database, so that those
+-- that have been renamed are not added again each time it is opened.
+INSERT INTO stock_names (name)
+SELECT column1 FROM (
+    VALUES
+        ('nuts'),
+        ('steel plates'),
+        ('screws'),
+        ('folding chairs')
+)
+WHERE NOT EXISTS (SELECT 1 FROM stock_names);
+
+-- Counts the changes made to stock_names, so that a station holding the
+-- names in memory can tell whether they have changed without reading them
+-- all again. It has a single row.
+CREATE TABLE IF NOT EXISTS stock_names_version (
+  id INTEGER PRIMARY KEY CHECK (id = 1),
+  version INTEGER NOT NULL DEFAULT 0
+);
+
+INSERT OR IGNORE INTO stock_names_version (id) VALUES (1);
+
+CREATE TRIGGER IF NOT EXISTS trg_stock_names_version_insert AFTER INSERT ON stock_names
+BEGIN
+  UPDATE stock_names_version SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_stock_names_version_update AFTER UPDATE OF id, name, retired_day ON stock_names
+BEGIN
+  UPDATE stock_names_version SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_stock_names_version_delete AFTER DELETE ON stock_names
+BEGIN
+  UPDATE stock_names_version SET version = version + 1;
+END;
+
+-- Dates are stored as the number of days since 1970-01-01, and the time a row
+-- was recorded as seconds since 1970-01-01 UTC, so that ranges of them are
+-- compared as integers. The text columns of the same names are generated from
+-- them for display.
 CREATE TABLE IF NOT EXISTS batches (
   id INTEGER PRIMARY KEY AUTOINCREMENT,
   stock_id INTEGER NOT NULL,
   quantity_initial INTEGER NOT NULL CHECK (quantity_initial >= 0),
   quantity_current INTEGER NOT NULL CHECK (quantity_current >= 0),
-  delivered_at TEXT CHECK (delivered_at LIKE '%-%-%'),
-  recorded_in_database TEXT DEFAULT (datetime('now')),
-  use_by TEXT CHECK (use_by LIKE '%-%-%'),
+  delivered_day INTEGER CHECK (typeof(delivered_day) IN ('integer', 'null')),
+  recorded_at INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+  use_by_day INTEGER CHECK (typeof(use_by_day) IN ('integer', 'null')),
+  delivered_at TEXT GENERATED ALWAYS AS (date(delivered_day * 86400, 'unixepoch')) VIRTUAL,
+  recorded_in_database TEXT GENERATED ALWAYS AS (datetime(recorded_at, 'unixepoch')) VIRTUAL,
+  use_by TEXT GENERATED ALWAYS AS (date(use_by_day * 86400, 'unixepoch')) VIRTUAL,
   FOREIGN KEY (stock_id) REFERENCES stock_names(id) ON DELETE CASCADE
 );
 
@@ -34,8 +81,232 @@ CREATE TABLE IF NOT EXISTS transactions (
                                 'returned',
                                 'lost',
                                 'destroyed')) DEFAULT ('N/A'),
-  occured_at TEXT CHECK (occured_at LIKE '%-%-%'),
-  recorded_in_database TEXT DEFAULT (datetime('now')),
+  occured_day INTEGER CHECK (typeof(occured_day) IN ('integer', 'null')),
+  recorded_at INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+  occured_at TEXT GENERATED ALWAYS AS (date(occured_day * 86400, 'unixepoch')) VIRTUAL,
+  recorded_in_database TEXT GENERATED ALWAYS AS (datetime(recorded_at, 'unixepoch')) VIRTUAL,
   FOREIGN KEY (batch_id) REFERENCES batches(id) ON DELETE CASCADE,
   FOREIGN KEY (stock_id) REFERENCES stock_names(id) ON DELETE CASCADE
-);
\ No newline at end of file
+);
+
+-- Running totals of the stock held of each type, kept up to date by the
+-- triggers below so that the stock totals page does not need to add up every
+-- batch. Only batches that still hold stock are counted.
+CREATE TABLE IF NOT EXISTS stock_totals (
+  stock_id INTEGER PRIMARY KEY,
+  quantity INTEGER NOT NULL DEFAULT 0,
+  batch_count INTEGER NOT NULL DEFAULT 0,
+  earliest_use_by_day INTEGER,
+  earliest_use_by TEXT GENERATED ALWAYS AS (date(earliest_use_by_day * 86400, 'unixepoch')) VIRTUAL,
+  FOREIGN KEY (stock_id) REFERENCES stock_names(id) ON DELETE CASCADE
+);
+
+CREATE TRIGGER IF NOT EXISTS trg_stock_totals_stock_insert AFTER INSERT ON stock_names
+BEGIN
+  INSERT OR IGNORE INTO stock_totals (stock_id) VALUES (NEW.id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_stock_totals_batch_insert AFTER INSERT ON batches
+BEGIN
+  INSERT OR IGNORE INTO stock_totals (stock_id) VALUES (NEW.stock_id);
+  UPDATE stock_totals SET
+    quantity = quantity + NEW.quantity_current,
+    batch_count = batch_count + (NEW.quantity_current > 0),
+    earliest_use_by_day = CASE
+      WHEN NEW.quantity_current > 0 AND (earliest_use_by_day IS NULL OR NEW.use_by_day < earliest_use_by_day) THEN NEW.use_by_day
+      ELSE earliest_use_by_day
+    END
+  WHERE stock_id = NEW.stock_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_stock_totals_batch_update AFTER UPDATE OF quantity_current, use_by_day ON batches
+  WHEN NEW.stock_id = OLD.stock_id
+BEGIN
+  UPDATE stock_totals SET
+    quantity = quantity + NEW.quantity_current - OLD.quantity_current,
+    batch_count = batch_count + (NEW.quantity_current > 0) - (OLD.quantity_current > 0),
+    earliest_use_by_day = (SELECT MIN(use_by_day) FROM batches WHERE stock_id = NEW.stock_id AND quantity_current > 0)
+  WHERE stock_id = NEW.stock_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_stock_totals_batch_move AFTER UPDATE OF stock_id ON batches
+  WHEN NEW.stock_id <> OLD.stock_id
+BEGIN
+  UPDATE stock_totals SET
+    quantity = quantity - OLD.quantity_current,
+    batch_count = batch_count - (OLD.quantity_current > 0)
+  WHERE stock_id = OLD.stock_id;
+  INSERT OR IGNORE INTO stock_totals (stock_id) VALUES (NEW.stock_id);
+  UPDATE stock_totals SET
+    quantity = quantity + NEW.quantity_current,
+    batch_count = batch_count + (NEW.quantity_current > 0)
+  WHERE stock_id = NEW.stock_id;
+  UPDATE stock_totals SET
+    earliest_use_by_day = (SELECT MIN(use_by_day) FROM batches WHERE batches.stock_id = stock_totals.stock_id AND quantity_current > 0)
+  WHERE stock_id IN (OLD.stock_id, NEW.stock_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_stock_totals_batch_delete AFTER DELETE ON batches
+BEGIN
+  UPDATE stock_totals SET
+    quantity = quantity - OLD.quantity_current,
+    batch_count = batch_count - (OLD.quantity_current > 0),
+    earliest_use_by_day = (SELECT MIN(use_by_day) FROM batches WHERE stock_id = OLD.stock_id AND quantity_current > 0)
+  WHERE stock_id = OLD.stock_id;
+END;
+
+-- Backfill the totals of any stock type that does not have a row yet, such as
+-- every stock type in a database created before stock_totals existed
+INSERT OR IGNORE INTO stock_totals (stock_id, quantity, batch_count, earliest_use_by_day)
+SELECT s.id, COALESCE(SUM(b.quantity_current), 0), COUNT(b.id), MIN(b.use_by_day)
+FROM stock_names s LEFT JOIN batches b ON b.stock_id = s.id AND b.quantity_current > 0
+GROUP BY s.id;
+
+-- Years of transactions moved out to archive files by archive.py, and the
+-- file each is in, named relative to the folder of this database
+CREATE TABLE IF NOT EXISTS archived_years (
+  year INTEGER PRIMARY KEY,
+  file_name TEXT NOT NULL,
+  transaction_count INTEGER NOT NULL,
+  batch_count INTEGER NOT NULL,
+  archived_at INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER))
+);
+
+-- Holds a row only while archive.py deletes the rows it has moved out. The
+-- delete triggers of transactions check it, so that the moved rows are still
+-- counted in the daily totals and checkpoints
+CREATE TABLE IF NOT EXISTS archiving (
+  year INTEGER PRIMARY KEY
+);
+
+-- Total quantity and number of transactions of each stock type, type and
+-- removal reason on each day, kept up to date by the triggers below so that
+-- reports read a row per day rather than every transaction. A missing
+-- removal reason is totalled as 'N/A'.
+CREATE TABLE IF NOT EXISTS transaction_daily (
+  day INTEGER NOT NULL,
+  stock_id INTEGER NOT NULL,
+  transaction_type TEXT NOT NULL,
+  removal_reason TEXT NOT NULL,
+  quantity INTEGER NOT NULL DEFAULT 0,
+  transaction_count INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY (day, stock_id, transaction_type, removal_reason)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_transaction_daily_stock ON transaction_daily (stock_id, day);
+
+CREATE TRIGGER IF NOT EXISTS trg_transaction_daily_insert AFTER INSERT ON transactions
+  WHEN NEW.occured_day IS NOT NULL
+BEGIN
+  INSERT INTO transaction_daily (day, stock_id, transaction_type, removal_reason, quantity, transaction_count)
+  VALUES (NEW.occured_day, NEW.stock_id, NEW.transaction_type, COALESCE(NEW.removal_reason, 'N/A'), NEW.quantity, 1)
+  ON CONFLICT (day, stock_id, transaction_type, removal_reason) DO UPDATE SET
+    quantity = quantity + excluded.quantity,
+    transaction_count = transaction_count + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_transaction_daily_update AFTER UPDATE OF transaction_type, stock_id, quantity, removal_reason, occured_day ON transactions
+BEGIN
+  UPDATE transaction_daily SET
+    quantity = quantity - OLD.quantity,
+    transaction_count = transaction_count - 1
+  WHERE day = OLD.occured_day AND stock_id = OLD.stock_id AND transaction_type = OLD.transaction_type
+    AND removal_reason = COALESCE(OLD.removal_reason, 'N/A');
+  DELETE FROM transaction_daily
+  WHERE day = OLD.occured_day AND stock_id = OLD.stock_id AND transaction_type = OLD.transaction_type
+    AND removal_reason = COALESCE(OLD.removal_reason, 'N/A') AND transaction_count = 0;
+  INSERT INTO transaction_daily (day, stock_id, transaction_type, removal_reason, quantity, transaction_count)
+  SELECT NEW.occured_day, NEW.stock_id, NEW.transaction_type, COALESCE(NEW.removal_reason, 'N/A'), NEW.quantity, 1
+  WHERE NEW.occured_day IS NOT NULL
+  ON CONFLICT (day, stock_id, transaction_type, removal_reason) DO UPDATE SET
+    quantity = quantity + excluded.quantity,
+    transaction_count = transaction_count + 1;
+END;
+
+-- Made again each time, so that a database from before archiving existed
+-- has its trigger replaced by one that checks it
+DROP TRIGGER IF EXISTS trg_transaction_daily_delete;
+CREATE TRIGGER IF NOT EXISTS trg_transaction_daily_delete AFTER DELETE ON transactions
+  WHEN NOT EXISTS (SELECT 1 FROM archiving)
+BEGIN
+  UPDATE transaction_daily SET
+    quantity = quantity - OLD.quantity,
+    transaction_count = transaction_count - 1
+  WHERE day = OLD.occured_day AND stock_id = OLD.stock_id AND transaction_type = OLD.transaction_type
+    AND removal_reason = COALESCE(OLD.removal_reason, 'N/A');
+  DELETE FROM transaction_daily
+  WHERE day = OLD.occured_day AND stock_id = OLD.stock_id AND transaction_type = OLD.transaction_type
+    AND removal_reason = COALESCE(OLD.removal_reason, 'N/A') AND transaction_count = 0;
+END;
+
+-- Fill the daily totals of a database created before transaction_daily
+-- existed. A database whose table is empty has no transactions to total
+INSERT INTO transaction_daily (day, stock_id, transaction_type, removal_reason, quantity, transaction_count)
+SELECT occured_day, stock_id, transaction_type, COALESCE(removal_reason, 'N/A'), SUM(quantity), COUNT(*)
+FROM transactions
+WHERE occured_day IS NOT NULL AND NOT EXISTS (SELECT 1 FROM transaction_daily)
+GROUP BY occured_day, stock_id, transaction_type, COALESCE(removal_reason, 'N/A');
+
+-- Quantity of each stock type held at the end of each month, from every
+-- transaction up to and including that day. Stock levels at a past date are
+-- found from the checkpoint before it and the transactions since, rather than
+-- from the whole ledger. checkpoint_days lists the days that have been
+-- checkpointed; a stock type with no row for a day held none.
+CREATE TABLE IF NOT EXISTS checkpoint_days (
+  day INTEGER PRIMARY KEY
+);
+
+CREATE TABLE IF NOT EXISTS stock_checkpoints (
+  day INTEGER NOT NULL,
+  stock_id INTEGER NOT NULL,
+  quantity INTEGER NOT NULL,
+  PRIMARY KEY (day, stock_id),
+  FOREIGN KEY (day) REFERENCES checkpoint_days(day) ON DELETE CASCADE,
+  FOREIGN KEY (stock_id) REFERENCES stock_names(id) ON DELETE CASCADE
+) WITHOUT ROWID;
+
+-- A transaction dated on or before a checkpoint makes it wrong, so that
+-- checkpoint and every one after it are dropped, to be made again
+CREATE TRIGGER IF NOT EXISTS trg_checkpoints_transaction_insert AFTER INSERT ON transactions
+  WHEN NEW.occured_day <= (SELECT MAX(day) FROM checkpoint_days)
+BEGIN
+  DELETE FROM stock_checkpoints WHERE day >= NEW.occured_day;
+  DELETE FROM checkpoint_days WHERE day >= NEW.occured_day;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_checkpoints_transaction_update AFTER UPDATE OF transaction_type, stock_id, quantity, occured_day ON transactions
+  WHEN MIN(NEW.occured_day, OLD.occured_day) <= (SELECT MAX(day) FROM checkpoint_days)
+BEGIN
+  DELETE FROM stock_checkpoints WHERE day >= MIN(NEW.occured_day, OLD.occured_day);
+  DELETE FROM checkpoint_days WHERE day >= MIN(NEW.occured_day, OLD.occured_day);
+END;
+
+-- Made again each time, so that a database from before archiving existed
+-- has its trigger replaced by one that checks it
+DROP TRIGGER IF EXISTS trg_checkpoints_transaction_delete;
+CREATE TRIGGER IF NOT EXISTS trg_checkpoints_transaction_delete AFTER DELETE ON transactions
+  WHEN OLD.occured_day <= (SELECT MAX(day) FROM checkpoint_days) AND NOT EXISTS (SELECT 1 FROM archiving)
+BEGIN
+  DELETE FROM stock_checkpoints WHERE day >= OLD.occured_day;
+  DELETE FROM checkpoint_days WHERE day >= OLD.occured_day;
+END;
+
+-- Indexes for the searches made by the check pages. Each date range filter
+-- has its own index, and the stock id filter is paired with the date that is
+-- most often searched alongside it.
+CREATE INDEX IF NOT EXISTS idx_batches_stock_delivered ON batches (stock_id, delivered_day);
+CREATE INDEX IF NOT EXISTS idx_batches_delivered_at ON batches (delivered_day);
+CREATE INDEX IF NOT EXISTS idx_batches_use_by ON batches (use_by_day);
+CREATE INDEX IF NOT EXISTS idx_batches_recorded ON batches (recorded_at);
+
+-- Partial index over batches that still hold stock. It covers the stock
+-- totals and lets expiry ordered searches skip empty batches.
+CREATE INDEX IF NOT EXISTS idx_batches_in_stock ON batches (stock_id, use_by_day, delivered_day, quantity_current)
+  WHERE quantity_current > 0;
+
+CREATE INDEX IF NOT EXISTS idx_transactions_stock_occured ON transactions (stock_id, occured_day);
+CREATE INDEX IF NOT EXISTS idx_transactions_type_occured ON transactions (transaction_type, occured_day);
+CREATE INDEX IF NOT EXISTS idx_transactions_reason_occured ON transactions (removal_reason, occured_day);
+CREATE INDEX IF NOT EXISTS idx_transactions_occured ON transactions (occured_day);
+CREATE INDEX IF NOT EXISTS idx_transactions_recorded ON transactions (recorded_at);
+CREATE INDEX IF NOT EXISTS idx_transactions_batch ON transactions (batch_id);
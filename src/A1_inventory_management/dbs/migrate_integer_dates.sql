@@ -0,0 +1,67 @@
+-- Moves a database created when dates were stored as TEXT over to the integer
+-- day numbers used now. SQLite cannot change the type of a column, so batches
+-- and transactions are copied into new tables and the old ones dropped. Run
+-- by initialiseDb with foreign keys off and the day_number() function
+-- registered, before db_sqlite_code.sql recreates the indexes, triggers and
+-- stock_totals.
+BEGIN;
+
+DROP TRIGGER IF EXISTS trg_stock_totals_stock_insert;
+DROP TABLE IF EXISTS stock_totals;
+
+CREATE TABLE batches_new (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  stock_id INTEGER NOT NULL,
+  quantity_initial INTEGER NOT NULL CHECK (quantity_initial >= 0),
+  quantity_current INTEGER NOT NULL CHECK (quantity_current >= 0),
+  delivered_day INTEGER CHECK (typeof(delivered_day) IN ('integer', 'null')),
+  recorded_at INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+  use_by_day INTEGER CHECK (typeof(use_by_day) IN ('integer', 'null')),
+  delivered_at TEXT GENERATED ALWAYS AS (date(delivered_day * 86400, 'unixepoch')) VIRTUAL,
+  recorded_in_database TEXT GENERATED ALWAYS AS (datetime(recorded_at, 'unixepoch')) VIRTUAL,
+  use_by TEXT GENERATED ALWAYS AS (date(use_by_day * 86400, 'unixepoch')) VIRTUAL,
+  FOREIGN KEY (stock_id) REFERENCES stock_names(id) ON DELETE CASCADE
+);
+
+INSERT INTO batches_new (id, stock_id, quantity_initial, quantity_current, delivered_day, recorded_at, use_by_day)
+SELECT id, stock_id, quantity_initial, quantity_current,
+  day_number(delivered_at), CAST(strftime('%s', recorded_in_database) AS INTEGER), day_number(use_by)
+FROM batches;
+
+CREATE TABLE transactions_new (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  transaction_type TEXT NOT NULL CHECK (transaction_type IN ('addition', 'removal')),
+  batch_id INTEGER NOT NULL,
+  stock_id INTEGER NOT NULL,
+  quantity INTEGER NOT NULL CHECK (quantity >= 0),
+  removal_reason TEXT CHECK (removal_reason IN (
+                                'N/A',
+                                'used',
+                                'out_of_date',
+                                'returned',
+                                'lost',
+                                'destroyed')) DEFAULT ('N/A'),
+  occured_day INTEGER CHECK (typeof(occured_day) IN ('integer', 'null')),
+  recorded_at INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+  occured_at TEXT GENERATED ALWAYS AS (date(occured_day * 86400, 'unixepoch')) VIRTUAL,
+  recorded_in_database TEXT GENERATED ALWAYS AS (datetime(recorded_at, 'unixepoch')) VIRTUAL,
+  FOREIGN KEY (batch_id) REFERENCES batches(id) ON DELETE CASCADE,
+  FOREIGN KEY (stock_id) REFERENCES stock_names(id) ON DELETE CASCADE
+);
+
+INSERT INTO transactions_new (id, transaction_type, batch_id, stock_id, quantity, removal_reason, occured_day, recorded_at)
+SELECT id, transaction_type, batch_id, stock_id, quantity, removal_reason,
+  day_number(occured_at), CAST(strftime('%s', recorded_in_database) AS INTEGER)
+FROM transactions;
+
+-- Carry the AUTOINCREMENT counters over to the new tables, so that the ids of
+-- deleted rows are not reused
+DELETE FROM sqlite_sequence WHERE name IN ('batches_new', 'transactions_new');
+UPDATE sqlite_sequence SET name = name || '_new' WHERE name IN ('batches', 'transactions');
+
+DROP TABLE transactions;
+DROP TABLE batches;
+ALTER TABLE batches_new RENAME TO batches;
+ALTER TABLE transactions_new RENAME TO transactions;
+
+COMMIT;
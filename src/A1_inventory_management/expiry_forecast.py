@@ -0,0 +1,100 @@
+# This file defines the expiry forecast, which finds how much of each stock
+# type reaches its use by date on each day or week ahead. Every batch still
+# in stock is read with one query, and the quantities are totalled with NumPy
+# rather than a query for each stock type.
+from collections import namedtuple
+from datetime import date
+
+import numpy as np
+
+from A1_inventory_management.inventory_store import ResultSet
+from A1_inventory_management.utils.datetime_helpers import fromDayNumber, toDayNumber
+
+DEFAULT_HORIZON_DAYS = 28
+
+# The forecast of forecastExpiry. stockIds and stockNames give the stock type
+# of each row of expiring and expired. bucketStarts is the first date of each
+# column of expiring, which holds the quantity whose use by date falls in that
+# day or week. expired is the quantity held whose use by date has passed
+ExpiryForecast = namedtuple("ExpiryForecast", ["stockIds", "stockNames", "bucketStarts", "expiring", "expired"])
+
+
+###########################
+## def forecastExpiry () ##
+###########################
+# Total the stock reaching its use by date over the days ahead
+def forecastExpiry(store, horizonDays=DEFAULT_HORIZON_DAYS, bucketDays=1, today=None, stockId=None):
+    """Forecast how much of each stock type will expire over the next
+    horizonDays days, in buckets of bucketDays days. A batch is counted on its
+    use by date, and as expired from the day after.
+
+    Args:
+        store (InventoryStore): the store to forecast
+        horizonDays (int): the number of days ahead to forecast, from today
+        bucketDays (int): the days in each bucket, 1 for each day or 7 for
+            each week
+        today (string): the date to forecast from. If None, today's date
+        stockId (int): id of a single stock type to forecast. If None, every
+            stock type is forecast
+
+    Raises:
+        ValueError: if horizonDays or bucketDays is less than 1
+
+    Returns:
+        ExpiryForecast: the quantities expiring and expired by stock type
+    """
+    if horizonDays < 1 or bucketDays < 1:
+        raise ValueError("The horizon and bucket must each be at least one day")
+    todayDay = toDayNumber(today if today is not None else date.today().isoformat())
+    buckets = -(-horizonDays // bucketDays)
+
+    names = store.stock_names()
+    stockIds = np.array([stockId] if stockId is not None else sorted(names), dtype=np.int64)
+    stockNames = [names.get(int(i)) for i in stockIds]
+
+    rows = store.in_stock_by_use_by(fromDayNumber(todayDay + horizonDays), stockId)
+    batches = np.array(rows, dtype=np.int64).reshape(-1, 3)
+    codes = np.searchsorted(stockIds, batches[:, 0])
+    offsets = batches[:, 1] - todayDay
+    quantities = batches[:, 2]
+
+    # bincount totals the weights in float64, which holds every quantity
+    # exactly below 2 ** 53
+    past = offsets < 0
+    expired = np.bincount(codes[past], weights=quantities[past], minlength=len(stockIds)).astype(np.int64)
+    ahead = ~past
+    cells = codes[ahead] * buckets + offsets[ahead] // bucketDays
+    expiring = np.bincount(cells, weights=quantities[ahead], minlength=len(stockIds) * buckets)
+    expiring = expiring.astype(np.int64).reshape(len(stockIds), buckets)
+
+    bucketStarts = [fromDayNumber(todayDay + b * bucketDays) for b in range(buckets)]
+    return ExpiryForecast(stockIds, stockNames, bucketStarts, expiring, expired)
+
+
+##########################
+## def forecastTable () ##
+##########################
+# Lay out a forecast as rows for a table or csv
+def forecastTable(forecast, includeEmpty=False):
+    """Turn a forecast into a row for each stock type
+
+    Args:
+        forecast (ExpiryForecast): the forecast
+        includeEmpty (bool): whether to include stock types with nothing
+            expired or expiring
+
+    Returns:
+        ResultSet: the columns id, name, expired, the start date of each
+            bucket, and the total expiring over the horizon, and the rows
+    """
+    columns = ["id", "name", "expired"] + forecast.bucketStarts + ["expiring"]
+    totals = forecast.expiring.sum(axis=1)
+    keep = np.arange(len(forecast.stockIds))
+    if not includeEmpty:
+        keep = np.flatnonzero((totals > 0) | (forecast.expired > 0))
+    rows = [
+        (int(forecast.stockIds[i]), forecast.stockNames[i], int(forecast.expired[i]),
+         *forecast.expiring[i].tolist(), int(totals[i]))
+        for i in keep
+    ]
+    return ResultSet(columns, rows)
@@ -0,0 +1,448 @@
+# This file defines the instrumentation used to find where time goes: the
+# statements run on each connection and how long the slow ones take, timers
+# around the pages' checks, searches and tables and around database jobs,
+# and counters of the rows read and written.
+#
+# It is off unless enabled, and costs next to nothing while off, so it is
+# left in place for normal use. Connections are only traced if they are
+# opened while it is enabled, and timed functions check a single flag before
+# calling straight through.
+#
+# Set A1_METRICS_DIR to a folder before starting the app or the API server to
+# enable it. Slow statements and timings are then written as JSON lines to
+# metrics.jsonl in that folder, which is rotated as it grows, and the metrics
+# so far to metrics.prom in the Prometheus text format. A1_SLOW_QUERY_MS sets
+# how long a statement runs before it is logged as slow.
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
+# Environment variables read by enableFromEnvironment
+METRICS_DIR_VARIABLE = "A1_METRICS_DIR"
+SLOW_QUERY_VARIABLE = "A1_SLOW_QUERY_MS"
+
+# Milliseconds a statement runs before it is logged as slow
+DEFAULT_SLOW_QUERY_MS = 100
+
+# Files written to the metrics folder. The log is rotated once it reaches
+# MAX_LOG_BYTES, keeping LOG_BACKUPS older files
+LOG_FILE_NAME = "metrics.jsonl"
+PROMETHEUS_FILE_NAME = "metrics.prom"
+MAX_LOG_BYTES = 5_000_000
+LOG_BACKUPS = 3
+
+# SQLite instructions run between each check of how long a statement has run
+PROGRESS_INSTRUCTIONS = 1000
+
+# Longest statement text written to the log
+MAX_LOGGED_SQL = 1000
+
+# Upper bounds in seconds of the buckets that timings are counted in
+TIMER_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Prefix of every metric exported to Prometheus
+METRIC_PREFIX = "a1_"
+
+# Whether the instrumentation is on. Read by every timed function, so it is a
+# plain module global rather than an attribute
+_enabled = False
+_slowQuerySeconds = DEFAULT_SLOW_QUERY_MS / 1000
+_metricsDir = None
+_log = None
+# The tracer that last traced a statement on each thread, so that a timer
+# ending on that thread can close the statement
+_local = threading.local()
+
+
+###################
+## class Metrics ##
+###################
+# Counters and timings recorded while enabled
+class Metrics:
+    """
+    Counters and timings, safe to record from any thread. A counter is
+    identified by its name and labels, and a timing by its name and the name
+    of what was timed. Each timing keeps how many times it was recorded,
+    their total, and how many fell in each of TIMER_BUCKETS.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.timings = {}
+
+    def increment(self, name, amount=1, **labels):
+        """Add to a counter
+
+        Args:
+            name (string): the counter
+            amount (int): the amount added
+            **labels: the labels of the counter, such as kind="select"
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, timed, seconds):
+        """Record a timing
+
+        Args:
+            name (string): the timing, such as "timer"
+            timed (string): what was timed, such as "AddPage.checkValid"
+            seconds (float): how long it took
+        """
+        key = (name, timed)
+        with self._lock:
+            timing = self.timings.get(key)
+            if timing is None:
+                timing = self.timings[key] = [0, 0.0, [0] * len(TIMER_BUCKETS)]
+            timing[0] += 1
+            timing[1] += seconds
+            for i, bound in enumerate(TIMER_BUCKETS):
+                if seconds <= bound:
+                    timing[2][i] += 1
+                    break
+
+    def snapshot(self):
+        """The counters and timings recorded so far, as a dict that can be
+        written as JSON"""
+        with self._lock:
+            return {
+                "counters": [{"name": name, "labels": dict(labels), "value": value}
+                             for (name, labels), value in sorted(self.counters.items())],
+                "timings": [{"name": name, "timed": timed, "count": count, "seconds": total}
+                            for (name, timed), (count, total, buckets) in sorted(self.timings.items())],
+            }
+
+    def prometheusText(self):
+        """The counters and timings in the Prometheus text format, with each
+        timing as a histogram in seconds
+
+        Returns:
+            string: the exposition text
+        """
+        lines = []
+        with self._lock:
+            counters = sorted(self.counters.items())
+            timings = sorted((name, timed, count, total, list(buckets))
+                             for (name, timed), (count, total, buckets) in self.timings.items())
+        typed = set()
+        for (name, labels), value in counters:
+            metric = f"{METRIC_PREFIX}{name}_total"
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} counter")
+                typed.add(metric)
+            lines.append(f"{metric}{_labelText(labels)} {value}")
+        for name, timed, count, total, buckets in timings:
+            metric = f"{METRIC_PREFIX}{name}_seconds"
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} histogram")
+                typed.add(metric)
+            # Prometheus buckets count every timing up to their bound
+            cumulative = 0
+            for bound, inBucket in zip(TIMER_BUCKETS, buckets):
+                cumulative += inBucket
+                lines.append(f"{metric}_bucket{_labelText((('name', timed), ('le', repr(bound))))} {cumulative}")
+            lines.append(f"{metric}_bucket{_labelText((('name', timed), ('le', '+Inf')))} {count}")
+            lines.append(f"{metric}_sum{_labelText((('name', timed),))} {total}")
+            lines.append(f"{metric}_count{_labelText((('name', timed),))} {count}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        """Forget every counter and timing"""
+        with self._lock:
+            self.counters.clear()
+            self.timings.clear()
+
+
+# The metrics recorded by this process
+METRICS = Metrics()
+
+
+###########################
+## class StatementTracer ##
+###########################
+# Follows the statements run on one connection
+class StatementTracer:
+    """
+    Counts the statements run on a connection and times them, through its
+    trace callback and progress handler. The trace callback is called as
+    each statement starts, and the progress handler every
+    PROGRESS_INSTRUCTIONS instructions while it runs, so a statement's time
+    is taken from its start to the last time it was seen running. Time spent
+    after its last rows were fetched is not counted, and statements of fewer
+    instructions are recorded as taking no time.
+
+    A statement is finished when the next one starts on the connection, or
+    when a timer ends on the thread that ran it. The rows it wrote, counting
+    those written by triggers, are taken from the connection's total_changes.
+    """
+    def __init__(self, conn):
+        self._conn = conn
+        self._changes = conn.total_changes
+        self._statement = None
+        self._started = 0.0
+        self._lastRun = 0.0
+        conn.set_trace_callback(self._traced)
+        conn.set_progress_handler(self._running, PROGRESS_INSTRUCTIONS)
+
+    def finish(self):
+        """Record the statement being followed, if any"""
+        statement = self._statement
+        if statement is None:
+            return
+        self._statement = None
+        seconds = self._lastRun - self._started
+        changes = self._conn.total_changes
+        if changes > self._changes:
+            METRICS.increment("rows_written", changes - self._changes)
+        self._changes = changes
+        kind = statement.lstrip().split(None, 1)[0].lower() if statement.strip() else "other"
+        if kind not in ("select", "insert", "update", "delete", "with"):
+            kind = "other"
+        METRICS.increment("sql_statements", kind=kind)
+        METRICS.observe("sql_statement", kind, seconds)
+        if seconds >= _slowQuerySeconds:
+            METRICS.increment("sql_slow_statements")
+            logEvent("slow_query", ms=round(seconds * 1000, 3), sql=statement[:MAX_LOGGED_SQL])
+
+    def close(self):
+        """Record the statement being followed, and stop following the
+        connection. Called before the connection is closed"""
+        self.finish()
+        self._conn.set_trace_callback(None)
+        self._conn.set_progress_handler(None, 0)
+
+    def _traced(self, statement):
+        # The statements of triggers are reported with the text of the
+        # statement that fired them
+        if statement == self._statement:
+            return
+        self.finish()
+        self._statement = statement
+        self._started = self._lastRun = time.perf_counter()
+        _local.tracer = self
+
+    def _running(self):
+        self._lastRun = time.perf_counter()
+        return 0
+
+
+############################
+## def traceConnection () ##
+############################
+# Follow the statements of a connection if the instrumentation is on
+def traceConnection(conn):
+    """Trace a newly opened connection. Does nothing while the
+    instrumentation is off, so the connection runs without any callbacks
+
+    Args:
+        conn (sqlite3.Connection): the connection to trace
+
+    Returns:
+        StatementTracer: the connection's tracer, or None if it is not traced
+    """
+    if not _enabled:
+        return None
+    return StatementTracer(conn)
+
+
+##################
+## def timer () ##
+##################
+# Time the statements in a with block
+@contextmanager
+def timer(name):
+    """Time the with block as name, and finish the statement it last ran so
+    that it is recorded with the block
+
+    Args:
+        name (string): what is being timed
+    """
+    if not _enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _finished(name, start)
+
+
+##################
+## def timed () ##
+##################
+# Decorator that times each call of a function
+def timed(name=None):
+    """Decorate a function so that each call is timed while the
+    instrumentation is on. While it is off the function is called straight
+    through after checking one flag
+
+    Args:
+        name (string): what the timing is recorded as. If None, the
+            function's qualified name, such as AddPage.checkValid
+    """
+    def decorate(function):
+        timedName = name or function.__qualname__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                _finished(timedName, start)
+        return wrapper
+    return decorate
+
+
+def _finished(name, start):
+    seconds = time.perf_counter() - start
+    tracer = getattr(_local, "tracer", None)
+    if tracer is not None:
+        tracer.finish()
+    METRICS.observe("timer", name, seconds)
+    logEvent("timing", name=name, ms=round(seconds * 1000, 3))
+
+
+#####################
+## def rowsRead () ##
+#####################
+# Count rows fetched from the database
+def rowsRead(rows):
+    """Count the rows read by a query while the instrumentation is on
+
+    Args:
+        rows (list): the rows fetched
+
+    Returns:
+        list: rows, unchanged
+    """
+    if _enabled:
+        METRICS.increment("rows_read", len(rows))
+    return rows
+
+
+###################
+## def enable () ##
+###################
+# Turn the instrumentation on
+def enable(metricsDir=None, slowQueryMs=DEFAULT_SLOW_QUERY_MS, maxLogBytes=MAX_LOG_BYTES):
+    """Turn the instrumentation on. Only connections opened from now on are
+    traced
+
+    Args:
+        metricsDir (string or Path): folder to write the log and Prometheus
+            file to. If None, metrics are only kept in METRICS
+        slowQueryMs (float): milliseconds a statement runs before it is
+            logged as slow
+        maxLogBytes (int): size the log reaches before it is rotated
+    """
+    global _enabled, _slowQuerySeconds, _metricsDir, _log
+    disable()
+    _slowQuerySeconds = slowQueryMs / 1000
+    if metricsDir is not None:
+        _metricsDir = Path(metricsDir)
+        _metricsDir.mkdir(parents=True, exist_ok=True)
+        handler = RotatingFileHandler(_metricsDir / LOG_FILE_NAME, maxBytes=maxLogBytes, backupCount=LOG_BACKUPS, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        _log = logging.getLogger(__name__)
+        _log.setLevel(logging.INFO)
+        _log.propagate = False
+        _log.addHandler(handler)
+    _enabled = True
+
+
+####################
+## def disable () ##
+####################
+# Turn the instrumentation off
+def disable():
+    """Turn the instrumentation off and close the log. Connections already
+    traced keep their tracer until they are closed"""
+    global _enabled, _metricsDir, _log
+    _enabled = False
+    if _log is not None:
+        for handler in list(_log.handlers):
+            _log.removeHandler(handler)
+            handler.close()
+    _metricsDir = None
+    _log = None
+
+
+##################################
+## def enableFromEnvironment () ##
+##################################
+# Turn the instrumentation on if the environment asks for it
+def enableFromEnvironment(environ=os.environ):
+    """Turn the instrumentation on if A1_METRICS_DIR is set, writing to that
+    folder. A1_SLOW_QUERY_MS sets the slow statement threshold
+
+    Returns:
+        bool: whether the instrumentation was turned on
+    """
+    metricsDir = environ.get(METRICS_DIR_VARIABLE)
+    if not metricsDir:
+        return False
+    enable(metricsDir, float(environ.get(SLOW_QUERY_VARIABLE, DEFAULT_SLOW_QUERY_MS)))
+    return True
+
+
+def isEnabled():
+    """Whether the instrumentation is on"""
+    return _enabled
+
+
+#####################
+## def logEvent () ##
+#####################
+# Write an event to the JSON lines log
+def logEvent(event, **fields):
+    """Write one line of JSON to the log, if there is one
+
+    Args:
+        event (string): the kind of event, such as "slow_query"
+        **fields: the details of the event
+    """
+    if _log is not None:
+        _log.info(json.dumps(dict(time=round(time.time(), 3), event=event, thread=threading.current_thread().name, **fields)))
+
+
+#########################
+## def writeMetrics () ##
+#########################
+# Export the metrics recorded so far
+def writeMetrics():
+    """Write the metrics so far to the log as a "metrics" event, and replace
+    the Prometheus file with them. Does nothing without a metrics folder
+
+    Returns:
+        Path: the Prometheus file written, or None
+    """
+    if _metricsDir is None:
+        return None
+    logEvent("metrics", **METRICS.snapshot())
+    path = _metricsDir / PROMETHEUS_FILE_NAME
+    # Written to another file first, so that a collector reading it never
+    # sees it half written
+    partial = path.with_suffix(".prom.tmp")
+    partial.write_text(METRICS.prometheusText(), encoding="utf-8")
+    os.replace(partial, path)
+    return path
+
+
+def _labelText(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escapeLabel(value)}"' for name, value in labels) + "}"
+
+
+def _escapeLabel(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
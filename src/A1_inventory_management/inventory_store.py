@@ -0,0 +1,990 @@
+# This file defines the InventoryStore, the headless service layer that owns
+# the connection to the sqlite3 database. The Tkinter pages in core.py call
+# into it rather than opening their own connections, and it can be used
+# directly by scripts that need to read or modify the stock database.
+import random
+import sqlite3 as sql
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import date
+from pathlib import Path
+
+from A1_inventory_management.database_init import G_DB_PATH
+from A1_inventory_management.instrumentation import rowsRead, traceConnection
+from A1_inventory_management.query_builder import BATCHES, TRANSACTIONS, SearchQuery
+from A1_inventory_management.stock_index import MAX_SUGGESTIONS, StockNameIndex
+from A1_inventory_management.utils.datetime_helpers import EPOCH_DATE, fromDayNumber, toDayNumber
+from A1_inventory_management.validation import checkStockName
+
+TRANSACTION_TYPE_ADDITION_STRING = 'addition'
+TRANSACTION_TYPE_REMOVAL_STRING = 'removal'
+
+# Reasons a removal can be recorded for, as stored in the database
+REMOVAL_REASONS = ('used', 'out_of_date', 'returned', 'lost', 'destroyed')
+
+# Removal reasons counted as losses by losses_by_month
+LOSS_REASONS = ('out_of_date', 'lost', 'destroyed')
+
+# Seconds a statement waits for another station to finish writing before the
+# database is reported as busy
+DEFAULT_BUSY_TIMEOUT = 5.0
+
+# Further attempts made to write once the busy timeout has run out, and the
+# longest pause between them in seconds. The pauses double after each attempt
+WRITE_RETRIES = 4
+MAX_RETRY_PAUSE = 2.0
+
+# Prepared statements kept by each connection. Searches built by
+# query_builder share a statement for each combination of filters, so this
+# covers every search the pages can make along with the writes
+CACHED_STATEMENTS = 256
+
+# Columns and rows returned by a search of the database
+ResultSet = namedtuple("ResultSet", ["columns", "rows"])
+
+
+class DatabaseBusyError(sql.OperationalError):
+    """Raised when a write could not be made because other stations kept the
+    database locked through the busy timeout and every retry. The database
+    has not been altered."""
+
+
+class BatchNotFoundError(ValueError):
+    """Raised when stock is removed from a batch that does not exist. The
+    database has not been altered."""
+
+
+class ArchiveError(sql.OperationalError):
+    """Raised when a search reaches into an archived year whose archive file
+    is missing, or into more archived years than can be read at once"""
+
+
+##########################
+## class InventoryStore ##
+##########################
+# Long-lived connection to the stock database with its pragmas set once
+class InventoryStore:
+    """
+    Owns a single connection to the stock database and exposes the queries
+    used by the pages of the app.
+
+    The connection is opened in autocommit mode so that every write can be
+    grouped into an explicit transaction with transaction(). Several stations
+    can share one database file: each waits up to busyTimeout seconds for
+    another's write to finish, and a write that still cannot start is retried
+    writeRetries more times before DatabaseBusyError is raised.
+
+    The connection keeps up to cachedStatements prepared statements, so
+    searches repeated with different values are not prepared again.
+    """
+    def __init__(self, dbPath=G_DB_PATH, busyTimeout=DEFAULT_BUSY_TIMEOUT, writeRetries=WRITE_RETRIES, cachedStatements=CACHED_STATEMENTS):
+        self.dbPath = dbPath
+        self.writeRetries = writeRetries
+        self.conn = sql.connect(dbPath, timeout=busyTimeout, isolation_level=None, check_same_thread=False, cached_statements=cachedStatements)
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        # Only traced while the instrumentation is on
+        self._tracer = traceConnection(self.conn)
+        # stock_names rarely changes, so it is held in memory as an index. It
+        # is only reread when the database has been changed by another
+        # connection and stock_names_version shows that the change was to
+        # stock_names
+        self._stockIndex = None
+        self._stockNamesVersion = None
+        self._stockNamesChanges = None
+        # archived_years is cached in the same way, as it is needed by every
+        # search. It is read as the store opens, so that searches only read
+        # it again after another station has written. _attachedYears lists
+        # the years whose archive is attached, from the least recently
+        # attached
+        self._archives = []
+        self._archivesVersion = None
+        self._attachedYears = []
+        self._loadArchives()
+
+    def close(self):
+        """Close the connection to the database"""
+        if self.conn is not None:
+            if self._tracer is not None:
+                self._tracer.close()
+            self.conn.close()
+            self.conn = None
+
+    @contextmanager
+    def transaction(self):
+        """Run the statements in the with block as a single write transaction.
+
+        The transaction is started with BEGIN IMMEDIATE, so it holds the
+        write lock from its first statement and cannot deadlock with another
+        station partway through. It is committed if the block completes, and
+        rolled back if it raises.
+
+        Inside another transaction, the block is run in a savepoint instead.
+        If it raises, only its own statements are undone, and the outer
+        transaction carries on if the error is caught.
+
+        The cached stock names and archived years are reread after any
+        rollback, as a change to them made and cached within the block has
+        been undone.
+
+        Raises:
+            DatabaseBusyError: if the write lock could not be taken, or the
+                transaction could not be committed, before the retries ran out
+
+        Yields:
+            sqlite3.Cursor: cursor to execute the statements with
+        """
+        cur = self.conn.cursor()
+        if self.conn.in_transaction:
+            try:
+                cur.execute("SAVEPOINT nested")
+                try:
+                    yield cur
+                except BaseException:
+                    cur.execute("ROLLBACK TO nested")
+                    self._invalidateCaches()
+                    raise
+                finally:
+                    cur.execute("RELEASE nested")
+            finally:
+                cur.close()
+            return
+        try:
+            self._retryWhileBusy(lambda: cur.execute("BEGIN IMMEDIATE"))
+            try:
+                yield cur
+            except BaseException:
+                self.conn.rollback()
+                self._invalidateCaches()
+                raise
+            try:
+                self._retryWhileBusy(self.conn.commit)
+            except BaseException:
+                self.conn.rollback()
+                self._invalidateCaches()
+                raise
+        finally:
+            cur.close()
+
+    def resolve_stock_id(self, nameOrId: str) -> int | None:
+        """Find the id of a stock type from either its name, in any case, or
+        its id number
+
+        Args:
+            nameOrId (string): the name or id number of the stock type
+
+        Returns:
+            int: the id of the stock type, or None if it does not exist
+        """
+        return self.stock_name_index().resolve(nameOrId)
+
+    def stock_names(self) -> dict[int, str]:
+        """Get the name of every stock type
+
+        The names are cached and only reread from the database when it has
+        changed, so this can be called for every search.
+
+        Returns:
+            dict: the name of each stock type keyed by its id. It is shared
+                with the cache and must not be modified.
+        """
+        return self.stock_name_index().names
+
+    def stock_name_index(self) -> StockNameIndex:
+        """Get the index of the stock names, to look names up without reading
+        the database
+
+        The index is made again when stock_names has changed, so this can be
+        called as each key is pressed. An index already returned is not
+        changed, and can be kept by another thread.
+
+        Returns:
+            StockNameIndex: the index of the current names
+        """
+        self._loadStockNames()
+        return self._stockIndex
+
+    def suggest_stock_names(self, prefix: str, limit: int = MAX_SUGGESTIONS, includeRetired: bool = True) -> list[str]:
+        """Get the names of the stock types that start with what has been
+        typed, in any case
+
+        Args:
+            prefix (string): the start of the name
+            limit (int): the most names returned
+            includeRetired (bool): whether to suggest retired stock types
+
+        Returns:
+            list: up to limit names, in alphabetical order
+        """
+        return self.stock_name_index().startingWith(prefix, limit, includeRetired)
+
+    def find_stock_types(self, prefix: str = "", includeRetired: bool = True, limit: int | None = None) -> ResultSet:
+        """Search the catalog of stock types by the start of their name
+
+        Args:
+            prefix (string): the start of the name, in any case
+            includeRetired (bool): whether to include retired stock types
+            limit (int): the most stock types returned. If None, every match
+
+        Returns:
+            ResultSet: the id, name and retired_at date of each stock type,
+                in alphabetical order. retired_at is None for those in use
+        """
+        escaped = prefix.lstrip().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        queryString = (
+            "SELECT id, name, date(retired_day * 86400, 'unixepoch') AS retired_at FROM stock_names "
+            "WHERE name LIKE ? ESCAPE '\\'"
+        )
+        if not includeRetired:
+            queryString += " AND retired_day IS NULL"
+        cur = self.conn.execute(queryString + " ORDER BY name COLLATE NOCASE LIMIT ?", (escaped + "%", -1 if limit is None else limit))
+        return ResultSet([d[0] for d in cur.description], rowsRead(cur.fetchall()))
+
+    def add_stock_type(self, name: str) -> int:
+        """Add a stock type to the catalog
+
+        Args:
+            name (string): the name. Spaces at either end are removed
+
+        Raises:
+            ValueError: if the name is not valid, or another stock type has
+                it in any case
+
+        Returns:
+            int: the id of the new stock type
+        """
+        name = _checkedName(name)
+        try:
+            with self.transaction() as cur:
+                stockId = cur.execute("INSERT INTO stock_names (name) VALUES (?)", (name,)).lastrowid
+        except sql.IntegrityError:
+            raise ValueError(f"There is already a stock type named {name}") from None
+        self.invalidate_stock_names()
+        return stockId
+
+    def rename_stock_type(self, stockId: int, name: str):
+        """Change the name of a stock type. Its batches and transactions are
+        kept, as they refer to it by id
+
+        Args:
+            stockId (int): the id of the stock type
+            name (string): the new name. Spaces at either end are removed
+
+        Raises:
+            ValueError: if the stock type does not exist, the name is not
+                valid, or another stock type has it in any case
+        """
+        name = _checkedName(name)
+        try:
+            with self.transaction() as cur:
+                renamed = cur.execute("UPDATE stock_names SET name = ? WHERE id = ?", (name, stockId)).rowcount
+        except sql.IntegrityError:
+            raise ValueError(f"There is already a stock type named {name}") from None
+        if not renamed:
+            raise ValueError(f"There is no stock type {stockId}")
+        self.invalidate_stock_names()
+
+    def retire_stock_type(self, stockId: int, retiredOn: str | None = None):
+        """Retire a stock type, so that no more batches of it can be added.
+        Its stock can still be removed, and its history searched. Retiring a
+        stock type that is already retired keeps the date it was retired
+
+        Args:
+            stockId (int): the id of the stock type
+            retiredOn (string): the date it was retired, YYYY-MM-DD. If None,
+                today's date
+
+        Raises:
+            ValueError: if the stock type does not exist
+        """
+        retiredDay = toDayNumber(retiredOn if retiredOn is not None else date.today().isoformat())
+        self._setRetiredDay(stockId, "COALESCE(retired_day, ?)", (retiredDay,))
+
+    def restore_stock_type(self, stockId: int):
+        """Put a retired stock type back in use
+
+        Args:
+            stockId (int): the id of the stock type
+
+        Raises:
+            ValueError: if the stock type does not exist
+        """
+        self._setRetiredDay(stockId, "NULL", ())
+
+    def invalidate_stock_names(self):
+        """Make the next lookup reread stock_names.
+
+        PRAGMA data_version does not change for commits made on this
+        connection, so anything that writes to stock_names through it must
+        call this afterwards.
+        """
+        self._stockNamesVersion = None
+
+    def invalidate_archives(self):
+        """Make the next search reread archived_years. Like
+        invalidate_stock_names, this must be called after archiving through
+        this store's own connection.
+        """
+        self._archivesVersion = None
+
+    def get_batch(self, batchId: int) -> tuple | None:
+        """Get the details of a single batch needed to validate a removal
+
+        Args:
+            batchId (int): the id of the batch
+
+        Returns:
+            tuple: (id, stock_id, quantity_current, delivered_at), or None if
+                the batch does not exist
+        """
+        return self.conn.execute(
+            "SELECT id, stock_id, quantity_current, delivered_at FROM batches WHERE id = ?",
+            (batchId,)
+        ).fetchone()
+
+    def add_batch(self, stockId: int, quantity: int, deliveredAt: str, useBy: str) -> int:
+        """Add a new batch and record its addition in the transactions table
+
+        Args:
+            stockId (int): id of the stock type of the batch
+            quantity (int): the number of units delivered
+            deliveredAt (string): delivery date in the form YYYY-MM-DD
+            useBy (string): use by date in the form YYYY-MM-DD
+
+        Returns:
+            int: the id assigned to the new batch
+        """
+        deliveredDay = toDayNumber(deliveredAt)
+        with self.transaction() as cur:
+            cur.execute(
+                "INSERT INTO batches (stock_id, quantity_initial, quantity_current, delivered_day, use_by_day) VALUES (?, ?, ?, ?, ?)",
+                (stockId, quantity, quantity, deliveredDay, toDayNumber(useBy))
+            )
+            batchId = cur.lastrowid
+            cur.execute(
+                "INSERT INTO transactions (transaction_type, batch_id, stock_id, quantity, occured_day) VALUES (?, ?, ?, ?, ?)",
+                (TRANSACTION_TYPE_ADDITION_STRING, batchId, stockId, quantity, deliveredDay)
+            )
+        return batchId
+
+    def remove_from_batch(self, batchId: int, quantity: int, removalDate: str, removalReason: str) -> int:
+        """Remove a quantity from a batch and record the removal in the
+        transactions table
+
+        Args:
+            batchId (int): id of the batch to remove stock from
+            quantity (int): the number of units removed
+            removalDate (string): date of removal in the form YYYY-MM-DD
+            removalReason (string): the reason for removal as recorded in the
+                database
+
+        Raises:
+            BatchNotFoundError: if the batch does not exist
+            ValueError: if the batch holds less than quantity. The database
+                is not altered.
+
+        Returns:
+            int: the id of the stock type of the batch
+        """
+        with self.transaction() as cur:
+            # The check that the batch holds enough and the removal are one
+            # statement, so a removal made by another station in between
+            # cannot take the batch below zero
+            row = cur.execute(
+                "UPDATE batches SET quantity_current = quantity_current - ? "
+                "WHERE id = ? AND quantity_current >= ? RETURNING stock_id",
+                (quantity, batchId, quantity)
+            ).fetchone()
+            if row is None:
+                if cur.execute("SELECT 1 FROM batches WHERE id = ?", (batchId,)).fetchone() is None:
+                    raise BatchNotFoundError(f"Batch {batchId} does not exist")
+                raise ValueError(f"Batch {batchId} holds fewer than {quantity} units")
+            stockId = row[0]
+            cur.execute(
+                "INSERT INTO transactions (batch_id, stock_id, transaction_type, quantity, occured_day, removal_reason) VALUES (?, ?, ?, ?, ?, ?)",
+                (batchId, stockId, TRANSACTION_TYPE_REMOVAL_STRING, quantity, toDayNumber(removalDate), removalReason)
+            )
+        return stockId
+
+    def remove_stock(self, stockId: int, quantity: int, removalDate: str, removalReason: str) -> list[tuple[int, int]]:
+        """Remove a quantity of a stock type, taking it from its batches in
+        first expiry first out order (earliest use by date, then earliest
+        delivery). Only batches delivered on or before the removal date are
+        used. Every affected batch is updated, and a removal is recorded for
+        each, in a single transaction.
+
+        Args:
+            stockId (int): id of the stock type to remove
+            quantity (int): the total number of units removed
+            removalDate (string): date of removal in the form YYYY-MM-DD
+            removalReason (string): the reason for removal as recorded in the
+                database
+
+        Raises:
+            ValueError: if the batches do not hold enough stock. The database
+                is not altered.
+
+        Returns:
+            list: (batch id, quantity taken) for each batch removed from
+        """
+        removalDay = toDayNumber(removalDate)
+        with self.transaction() as cur:
+            # A running total over the batches in FEFO order picks out every
+            # batch needed to make up the quantity. The order matches the
+            # partial index of batches in stock, so it is read without a sort.
+            # The + stops the delivery date being used to choose an index.
+            allocation = cur.execute(
+                "SELECT id, MIN(quantity_current, ? - (running - quantity_current)) FROM ("
+                "  SELECT id, quantity_current,"
+                "    SUM(quantity_current) OVER (ORDER BY use_by_day, delivered_day, quantity_current, id) AS running"
+                "  FROM batches WHERE stock_id = ? AND quantity_current > 0 AND +delivered_day <= ?"
+                ") WHERE running - quantity_current < ? ORDER BY running",
+                (quantity, stockId, removalDay, quantity)
+            ).fetchall()
+            allocated = sum(taken for _, taken in allocation)
+            if allocated < quantity:
+                raise ValueError(f"Only {allocated} units of stock {stockId} are available to remove")
+
+            cur.executemany(
+                "UPDATE batches SET quantity_current = quantity_current - ? WHERE id = ?",
+                [(taken, batchId) for batchId, taken in allocation]
+            )
+            cur.executemany(
+                "INSERT INTO transactions (batch_id, stock_id, transaction_type, quantity, occured_day, removal_reason) VALUES (?, ?, ?, ?, ?, ?)",
+                [(batchId, stockId, TRANSACTION_TYPE_REMOVAL_STRING, taken, removalDay, removalReason) for batchId, taken in allocation]
+            )
+        return allocation
+
+    def find_batches(self, batchId: int | None = None, stockId: int | None = None,
+                     deliveredAt: tuple[str, str] | None = None,
+                     useBy: tuple[str, str] | None = None,
+                     recordedInDatabase: tuple[str, str] | None = None,
+                     afterId: int | None = None, beforeId: int | None = None,
+                     limit: int | None = None) -> ResultSet:
+        """Search the batches table. If batchId is given it is the only filter
+        used; otherwise every filter that is not None is combined with AND.
+
+        Rows are returned in id order. A page of results is found by passing
+        limit along with the id of the last row of the previous page as
+        afterId, or the first row of the next page as beforeId.
+
+        Args:
+            batchId (int): id of a specific batch
+            stockId (int): id of the stock type
+            deliveredAt (tuple): (from, to) range of delivery dates
+            useBy (tuple): (from, to) range of use by dates
+            recordedInDatabase (tuple): (from, to) range of dates recorded
+            afterId (int): only return rows with an id greater than this
+            beforeId (int): only return rows with an id less than this
+            limit (int): the largest number of rows to return
+
+        Returns:
+            ResultSet: the column names and matching rows
+        """
+        filters = self._batchFilters(batchId, stockId, deliveredAt, useBy, recordedInDatabase)
+        return self.search(SearchQuery(BATCHES, filters, afterId, beforeId, limit=limit))
+
+    def count_batches(self, **filters) -> int:
+        """Count the rows find_batches would return for the same filters
+
+        Returns:
+            int: the number of matching batches
+        """
+        return self.count(SearchQuery(BATCHES, self._batchFilters(**filters)))
+
+    def find_transactions(self, transactionType: str | None = None, stockId: int | None = None,
+                          occuredAt: tuple[str, str] | None = None,
+                          recordedInDatabase: tuple[str, str] | None = None,
+                          removalReason: str | None = None,
+                          afterId: int | None = None, beforeId: int | None = None,
+                          limit: int | None = None) -> ResultSet:
+        """Search the transactions table, combining every filter that is not
+        None with AND. Rows are returned in id order, and can be paged through
+        in the same way as find_batches.
+
+        Args:
+            transactionType (string): 'addition' or 'removal'
+            stockId (int): id of the stock type
+            occuredAt (tuple): (from, to) range of transaction dates
+            recordedInDatabase (tuple): (from, to) range of dates recorded
+            removalReason (string): the reason for removal
+            afterId (int): only return rows with an id greater than this
+            beforeId (int): only return rows with an id less than this
+            limit (int): the largest number of rows to return
+
+        Returns:
+            ResultSet: the column names and matching rows
+        """
+        filters = {
+            "transactionType": transactionType, "stockId": stockId, "occuredAt": occuredAt,
+            "recordedInDatabase": recordedInDatabase, "removalReason": removalReason,
+        }
+        return self.search(SearchQuery(TRANSACTIONS, filters, afterId, beforeId, limit=limit))
+
+    def count_transactions(self, **filters) -> int:
+        """Count the rows find_transactions would return for the same filters
+
+        Returns:
+            int: the number of matching transactions
+        """
+        return self.count(SearchQuery(TRANSACTIONS, filters))
+
+    def search(self, query: SearchQuery) -> ResultSet:
+        """Run a search built with query_builder
+
+        Args:
+            query (SearchQuery): the search to run
+
+        Returns:
+            ResultSet: the column names and matching rows
+        """
+        cur = self.search_cursor(query)
+        rows = rowsRead(cur.fetchall())
+        if query.backwards:
+            rows.reverse()
+        return ResultSet([d[0] for d in cur.description], rows)
+
+    def search_cursor(self, query: SearchQuery) -> sql.Cursor:
+        """Run a search built with query_builder and return its cursor, for
+        reading a large number of rows a batch at a time. Rows of archived
+        years are included when the search's date range reaches them.
+
+        Args:
+            query (SearchQuery): the search to run
+
+        Returns:
+            sqlite3.Cursor: the cursor of the matching rows
+        """
+        return self.conn.execute(*query.select(self._searchArchives(query)))
+
+    def count(self, query: SearchQuery) -> int:
+        """Count the rows a search built with query_builder matches
+
+        Args:
+            query (SearchQuery): the search to count, whose page and limit
+                are ignored
+
+        Returns:
+            int: the number of matching rows
+        """
+        return self.conn.execute(*query.count(self._searchArchives(query))).fetchone()[0] or 0
+
+    def stock_totals(self, stockId: int | None = None) -> ResultSet:
+        """Get the total quantity currently held of each stock type from the
+        stock_totals table, which is kept up to date by triggers on batches
+
+        Args:
+            stockId (int): id of a single stock type to total. If None, every
+                stock type is totalled
+
+        Returns:
+            ResultSet: rows of (id, name, quantity, batch_count, earliest_use_by)
+        """
+        queryString = (
+            "SELECT s.id, s.name, t.quantity, t.batch_count, t.earliest_use_by "
+            "FROM stock_names s JOIN stock_totals t ON t.stock_id = s.id"
+        )
+        queryParameters = ()
+        if stockId is not None:
+            queryString = queryString + " WHERE s.id = ?"
+            queryParameters = (stockId,)
+        queryString = queryString + " ORDER BY s.id"
+        cur = self.conn.execute(queryString, queryParameters)
+        return ResultSet([d[0] for d in cur.description], rowsRead(cur.fetchall()))
+
+    def in_stock_by_use_by(self, before: str, stockId: int | None = None) -> list[tuple[int, int, int]]:
+        """Find the batches still holding stock whose use by date is before a
+        date, read from the partial index over batches in stock
+
+        Args:
+            before (string): only return batches used by before this date
+            stockId (int): id of a single stock type. If None, batches of
+                every stock type are returned
+
+        Returns:
+            list: (stock_id, use_by_day, quantity_current) of each batch, with
+                use_by_day as a day number
+        """
+        queryString = (
+            "SELECT stock_id, use_by_day, quantity_current FROM batches "
+            "WHERE quantity_current > 0 AND use_by_day < ?"
+        )
+        queryParameters = (toDayNumber(before),)
+        if stockId is not None:
+            queryString = queryString + " AND stock_id = ?"
+            queryParameters = queryParameters + (stockId,)
+        return rowsRead(self.conn.execute(queryString, queryParameters).fetchall())
+
+    def update_checkpoints(self, through: str | None = None) -> int:
+        """Checkpoint the stock held at the end of every month that has
+        ended before through and is not yet checkpointed. Each month is
+        found from the checkpoint before it and that month's transactions,
+        and is written in its own transaction, so that other stations are
+        only kept waiting for one month at a time.
+
+        Args:
+            through (string): checkpoint months that end before this date. If
+                None, today's date
+
+        Returns:
+            int: the number of months checkpointed
+        """
+        beforeDay = toDayNumber(through if through is not None else date.today().isoformat())
+        previous = self.conn.execute("SELECT MAX(day) FROM checkpoint_days").fetchone()[0]
+        if previous is None:
+            start = self.conn.execute("SELECT MIN(occured_day) FROM transactions").fetchone()[0]
+            firstYear = self.conn.execute("SELECT MIN(year) FROM archived_years").fetchone()[0]
+            if firstYear is not None:
+                firstArchived = toDayNumber(f"{firstYear}-01-01")
+                start = firstArchived if start is None else min(start, firstArchived)
+            if start is None:
+                return 0
+        else:
+            start = previous + 1
+
+        made = 0
+        for monthEnd in _monthEnds(start, beforeDay):
+            # Archives cannot be attached inside the transaction
+            self._archiveSchemas("transactions", _dayAfter(previous), monthEnd)
+            with self.transaction() as cur:
+                # A transaction dated before the previous checkpoint may have
+                # dropped it since it was read
+                if previous is not None and cur.execute("SELECT 1 FROM checkpoint_days WHERE day = ?", (previous,)).fetchone() is None:
+                    break
+                cur.execute("INSERT INTO checkpoint_days (day) VALUES (?)", (monthEnd,))
+                changes, queryParameters = self._changesSince(previous, monthEnd)
+                cur.execute(
+                    "INSERT INTO stock_checkpoints (day, stock_id, quantity) "
+                    f"SELECT ?, stock_id, SUM(quantity) FROM ({changes}) GROUP BY stock_id HAVING SUM(quantity) <> 0",
+                    (monthEnd,) + queryParameters
+                )
+            previous = monthEnd
+            made += 1
+        return made
+
+    def stock_levels_at(self, day: str, stockId: int | None = None) -> ResultSet:
+        """Find the quantity of each stock type held at the end of a day,
+        from the latest checkpoint on or before it and the transactions dated
+        after the checkpoint. Without a checkpoint, the whole ledger up to
+        the day is added up.
+
+        Args:
+            day (string): the date to find the stock held on
+            stockId (int): id of a single stock type. If None, every stock
+                type is given
+
+        Returns:
+            ResultSet: rows of (id, name, quantity)
+        """
+        dayNumber = toDayNumber(day)
+        checkpointQuery = "SELECT MAX(day) FROM checkpoint_days WHERE day <= ?"
+        while True:
+            # Any archives needed after the checkpoint are attached before
+            # the read transaction, as they cannot be attached inside it
+            checkpoint = self.conn.execute(checkpointQuery, (dayNumber,)).fetchone()[0]
+            self._archiveSchemas("transactions", _dayAfter(checkpoint), dayNumber)
+            # The checkpoint and the transactions since it are read in one
+            # transaction, so that another station cannot drop the checkpoint
+            # between the two. If it was dropped before the transaction
+            # began, an earlier checkpoint may need other archives
+            with self._readTransaction():
+                if self.conn.execute(checkpointQuery, (dayNumber,)).fetchone()[0] != checkpoint:
+                    continue
+                changes, queryParameters = self._changesSince(checkpoint, dayNumber, stockId)
+                queryString = f"SELECT s.id, s.name, COALESCE(SUM(c.quantity), 0) AS quantity FROM stock_names s LEFT JOIN ({changes}) c ON c.stock_id = s.id"
+                if stockId is not None:
+                    queryString = queryString + " WHERE s.id = ?"
+                    queryParameters = queryParameters + (stockId,)
+                cur = self.conn.execute(queryString + " GROUP BY s.id ORDER BY s.id", queryParameters)
+                return ResultSet([d[0] for d in cur.description], rowsRead(cur.fetchall()))
+
+    def batch_levels_at(self, day: str, stockId: int | None = None) -> ResultSet:
+        """Find the quantity each batch held at the end of a day. Rather
+        than adding up the ledger from the start, the removals dated after
+        the day are added back to each batch's current quantity, so a recent
+        day only reads the transactions since it.
+
+        Args:
+            day (string): the date to find the stock held on
+            stockId (int): id of a single stock type. If None, batches of
+                every stock type are given
+
+        Returns:
+            ResultSet: rows of (id, stock_id, quantity) for each batch that
+                was delivered by the day and held stock at its end
+        """
+        dayNumber = toDayNumber(day)
+        # A batch emptied in an archived year, and removals from a batch
+        # dated in one, are in that year's archive
+        batches = self._unionOf("batches", "id, stock_id, quantity_current, delivered_day", self._archiveSchemas("batches", dayNumber))
+        transactions = self._unionOf("transactions", "batch_id, stock_id, transaction_type, quantity, occured_day",
+                                     self._archiveSchemas("transactions", dayNumber + 1))
+        batchFilter = " AND b.stock_id = ?" if stockId is not None else ""
+        transactionFilter = " AND t.stock_id = ?" if stockId is not None else ""
+        stockParameters = (stockId,) if stockId is not None else ()
+        cur = self.conn.execute(
+            "SELECT id, stock_id, SUM(quantity) AS quantity FROM ("
+            f"  SELECT b.id, b.stock_id, b.quantity_current AS quantity FROM {batches} b"
+            "  WHERE b.quantity_current > 0 AND b.delivered_day <= ?" + batchFilter +
+            "  UNION ALL"
+            f"  SELECT b.id, b.stock_id, t.quantity FROM {transactions} t JOIN {batches} b ON b.id = t.batch_id"
+            "  WHERE t.transaction_type = ? AND t.occured_day > ? AND b.delivered_day <= ?" + transactionFilter +
+            ") GROUP BY id HAVING SUM(quantity) > 0 ORDER BY id",
+            (dayNumber,) + stockParameters + (TRANSACTION_TYPE_REMOVAL_STRING, dayNumber, dayNumber) + stockParameters
+        )
+        return ResultSet([d[0] for d in cur.description], rowsRead(cur.fetchall()))
+
+    def usage_by_week(self, fromDate: str, toDate: str, stockId: int | None = None) -> ResultSet:
+        """Total the stock used of each stock type in each week, from the
+        transaction_daily rollup. Weeks start on a Monday, and only removals
+        for the reason 'used' are counted.
+
+        Args:
+            fromDate (string): the first date to count, YYYY-MM-DD
+            toDate (string): the last date to count, YYYY-MM-DD
+            stockId (int): id of a single stock type to count. If None, every
+                stock type is counted
+
+        Returns:
+            ResultSet: rows of (week_starting, id, name, quantity), by week
+                and then stock id
+        """
+        stockFilter = " AND stock_id = ?" if stockId is not None else ""
+        cur = self.conn.execute(
+            # 1970-01-01 was a Thursday, so day + 3 is a multiple of 7 on a
+            # Monday. The weeks are totalled as day numbers before the dates
+            # and names are looked up
+            "SELECT date(w.week * 86400, 'unixepoch') AS week_starting, w.stock_id AS id, s.name, w.quantity FROM ("
+            "  SELECT day - (day + 3) % 7 AS week, stock_id, SUM(quantity) AS quantity FROM transaction_daily"
+            "  WHERE day BETWEEN ? AND ? AND transaction_type = ? AND removal_reason = 'used'" + stockFilter +
+            "  GROUP BY week, stock_id"
+            ") w JOIN stock_names s ON s.id = w.stock_id ORDER BY w.week, w.stock_id",
+            (toDayNumber(fromDate), toDayNumber(toDate), TRANSACTION_TYPE_REMOVAL_STRING) + ((stockId,) if stockId is not None else ())
+        )
+        return ResultSet([d[0] for d in cur.description], rowsRead(cur.fetchall()))
+
+    def losses_by_month(self, fromDate: str, toDate: str, stockId: int | None = None) -> ResultSet:
+        """Total the stock lost for each reason in each month, from the
+        transaction_daily rollup. The reasons counted as losses are
+        LOSS_REASONS.
+
+        Args:
+            fromDate (string): the first date to count, YYYY-MM-DD
+            toDate (string): the last date to count, YYYY-MM-DD
+            stockId (int): id of a single stock type to count. If None, every
+                stock type is counted
+
+        Returns:
+            ResultSet: rows of (month, removal_reason, quantity,
+                transactions), by month and then reason
+        """
+        stockFilter = " AND stock_id = ?" if stockId is not None else ""
+        cur = self.conn.execute(
+            "SELECT strftime('%Y-%m', day * 86400, 'unixepoch') AS month, removal_reason, "
+            "SUM(quantity) AS quantity, SUM(transaction_count) AS transactions "
+            "FROM transaction_daily "
+            f"WHERE day BETWEEN ? AND ? AND transaction_type = ? AND removal_reason IN ({', '.join('?' * len(LOSS_REASONS))})" + stockFilter +
+            " GROUP BY month, removal_reason ORDER BY month, removal_reason",
+            (toDayNumber(fromDate), toDayNumber(toDate), TRANSACTION_TYPE_REMOVAL_STRING) + LOSS_REASONS
+            + ((stockId,) if stockId is not None else ())
+        )
+        return ResultSet([d[0] for d in cur.description], rowsRead(cur.fetchall()))
+
+    def rebuild_stock_totals(self):
+        """Recalculate the stock_totals table from the batches table. The
+        triggers keep it up to date, so this is only needed to repair it.
+        """
+        with self.transaction() as cur:
+            cur.execute("DELETE FROM stock_totals")
+            cur.execute(
+                "INSERT INTO stock_totals (stock_id, quantity, batch_count, earliest_use_by_day) "
+                "SELECT s.id, COALESCE(SUM(b.quantity_current), 0), COUNT(b.id), MIN(b.use_by_day) "
+                "FROM stock_names s LEFT JOIN batches b ON b.stock_id = s.id AND b.quantity_current > 0 "
+                "GROUP BY s.id"
+            )
+
+    def rebuild_transaction_daily(self):
+        """Recalculate the transaction_daily table from the transactions
+        table. The triggers keep it up to date, so this is only needed to
+        repair it.
+        """
+        # Archived years are totalled as well
+        transactions = self._unionOf("transactions", "stock_id, transaction_type, removal_reason, quantity, occured_day",
+                                     self._archiveSchemas("transactions"))
+        with self.transaction() as cur:
+            cur.execute("DELETE FROM transaction_daily")
+            cur.execute(
+                "INSERT INTO transaction_daily (day, stock_id, transaction_type, removal_reason, quantity, transaction_count) "
+                "SELECT occured_day, stock_id, transaction_type, COALESCE(removal_reason, 'N/A'), SUM(quantity), COUNT(*) "
+                f"FROM {transactions} WHERE occured_day IS NOT NULL "
+                "GROUP BY occured_day, stock_id, transaction_type, COALESCE(removal_reason, 'N/A')"
+            )
+
+    def _retryWhileBusy(self, statement):
+        # Each attempt has already waited for the busy timeout, so the pauses
+        # between them are kept short. Their length is varied so that stations
+        # that were kept waiting by the same write do not retry together.
+        for attempt in range(self.writeRetries + 1):
+            try:
+                return statement()
+            except sql.OperationalError as e:
+                if (e.sqlite_errorcode or 0) & 0xFF != sql.SQLITE_BUSY:
+                    raise
+                if attempt == self.writeRetries:
+                    raise DatabaseBusyError("The database is in use by another station. Please try again") from e
+            time.sleep(random.uniform(0.5, 1) * min(MAX_RETRY_PAUSE, 0.05 * 2 ** attempt))
+
+    def _invalidateCaches(self):
+        # A rollback does not change PRAGMA data_version either, so the
+        # caches are reread in case the undone statements had changed them
+        self.invalidate_stock_names()
+        self.invalidate_archives()
+
+    def _loadStockNames(self):
+        version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        if version == self._stockNamesVersion:
+            return
+        # Most changes are to batches and transactions, which leave the names
+        # as they are. The count of changes is read before the names, so a
+        # change made between the two reads the names again next time
+        changes = self.conn.execute("SELECT version FROM stock_names_version").fetchone()[0]
+        if changes != self._stockNamesChanges or self._stockIndex is None:
+            names = {}
+            retired = set()
+            for stockId, name, retiredDay in self.conn.execute("SELECT id, name, retired_day FROM stock_names"):
+                names[stockId] = name
+                if retiredDay is not None:
+                    retired.add(stockId)
+            self._stockIndex = StockNameIndex(names, retired)
+            self._stockNamesChanges = changes
+        self._stockNamesVersion = version
+
+    def _setRetiredDay(self, stockId, value, parameters):
+        with self.transaction() as cur:
+            changed = cur.execute(f"UPDATE stock_names SET retired_day = {value} WHERE id = ?", (*parameters, stockId)).rowcount
+        if not changed:
+            raise ValueError(f"There is no stock type {stockId}")
+        self.invalidate_stock_names()
+
+    @contextmanager
+    def _readTransaction(self):
+        self.conn.execute("BEGIN")
+        try:
+            yield
+        finally:
+            self.conn.execute("COMMIT")
+
+    def _changesSince(self, checkpoint, throughDay, stockId=None):
+        # Rows of (stock_id, quantity) that add up to the stock held at the
+        # end of throughDay: the quantities of the checkpoint, and every
+        # transaction dated after it, with removals negative
+        stockFilter = " AND stock_id = ?" if stockId is not None else ""
+        stockParameters = (stockId,) if stockId is not None else ()
+        transactions = self._unionOf("transactions", "stock_id, transaction_type, quantity, occured_day",
+                                     self._archiveSchemas("transactions", _dayAfter(checkpoint), throughDay))
+        changes = (
+            "SELECT stock_id, CASE transaction_type WHEN ? THEN quantity ELSE -quantity END AS quantity "
+            f"FROM {transactions} WHERE occured_day <= ?" + stockFilter
+        )
+        queryParameters = (TRANSACTION_TYPE_ADDITION_STRING, throughDay) + stockParameters
+        if checkpoint is None:
+            return changes, queryParameters
+        return (
+            "SELECT stock_id, quantity FROM stock_checkpoints WHERE day = ?" + stockFilter +
+            " UNION ALL " + changes + " AND occured_day > ?",
+            (checkpoint,) + stockParameters + queryParameters + (checkpoint,)
+        )
+
+    def _searchArchives(self, query):
+        # Archives are searched when the date range of the search reaches
+        # into their year, and always if the search has no date range
+        dates = query.filters.get("occuredAt" if query.table is TRANSACTIONS else "deliveredAt")
+        fromDay, toDay = (toDayNumber(d) for d in dates) if dates is not None else (None, None)
+        return self._archiveSchemas(query.table.name, fromDay, toDay)
+
+    def _archiveSchemas(self, table, fromDay=None, toDay=None):
+        # Schema names of the archives that can hold rows of table dated from
+        # fromDay to toDay, attaching any that are not yet attached. An
+        # archive holds the transactions dated in its year, and batches
+        # emptied in its year, which may have been delivered in any year up
+        # to it. Attaching cannot be done inside a transaction, so callers
+        # that read in one attach what they need before it begins
+        self._loadArchives()
+        archives = self._archives
+        if not archives:
+            return ()
+        years = []
+        for year, fileName in archives:
+            firstDay = toDayNumber(f"{year}-01-01") if table == "transactions" else None
+            lastDay = toDayNumber(f"{year}-12-31")
+            if (fromDay is None or lastDay >= fromDay) and (toDay is None or firstDay is None or firstDay <= toDay):
+                years.append((year, fileName))
+
+        attachLimit = self.conn.getlimit(sql.SQLITE_LIMIT_ATTACHED)
+        if len(years) > attachLimit:
+            raise ArchiveError(f"Only {attachLimit} archived years can be read at once. Please search a shorter range of dates")
+        for year, fileName in years:
+            if year in self._attachedYears:
+                continue
+            path = Path(self.dbPath).parent / fileName
+            if not path.exists():
+                raise ArchiveError(f"The archive of {year} is missing from {path}")
+            if len(self._attachedYears) >= attachLimit:
+                unused = next(y for y in self._attachedYears if y not in dict(years))
+                self.conn.execute(f"DETACH DATABASE archive_{unused}")
+                self._attachedYears.remove(unused)
+            self.conn.execute(f"ATTACH DATABASE ? AS archive_{year}", (str(path),))
+            self._attachedYears.append(year)
+        return tuple(f"archive_{year}" for year, fileName in years)
+
+    def _loadArchives(self):
+        version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        if version == self._archivesVersion:
+            return
+        try:
+            self._archives = self.conn.execute("SELECT year, file_name FROM archived_years ORDER BY year").fetchall()
+        except sql.OperationalError:
+            # A database that initialiseDb has not yet brought up to date
+            # has no archived years
+            self._archives = []
+        self._archivesVersion = version
+
+    def _unionOf(self, table, columns, schemas):
+        # The table, or the table and its archives as one subquery. sqlite
+        # pushes the conditions on it down into each part
+        if not schemas:
+            return table
+        parts = [f"SELECT {columns} FROM {schema}.{table}" for schema in ("main",) + tuple(schemas)]
+        return f"({' UNION ALL '.join(parts)})"
+
+    def _batchFilters(self, batchId=None, stockId=None, deliveredAt=None, useBy=None, recordedInDatabase=None):
+        # A batch id finds a single batch, so the other filters are not used
+        if batchId is not None:
+            return {"batchId": batchId}
+        return {"stockId": stockId, "deliveredAt": deliveredAt, "useBy": useBy, "recordedInDatabase": recordedInDatabase}
+
+
+def _checkedName(name):
+    name = name.strip()
+    problem = checkStockName(name)
+    if problem is not None:
+        raise ValueError(problem)
+    return name
+
+
+def _dayAfter(day):
+    # The first day after a checkpoint, or None if there is no checkpoint
+    return day + 1 if day is not None else None
+
+
+def _monthEnds(fromDay, beforeDay):
+    # Day numbers of the last day of each month, from the month holding
+    # fromDay to the last month that ends before beforeDay
+    month = date.fromisoformat(fromDayNumber(fromDay)).replace(day=1)
+    while True:
+        nextMonth = date(month.year + month.month // 12, month.month % 12 + 1, 1)
+        monthEnd = (nextMonth - EPOCH_DATE).days - 1
+        if monthEnd >= beforeDay:
+            return
+        yield monthEnd
+        month = nextMonth
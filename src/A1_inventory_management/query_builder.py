@@ -0,0 +1,219 @@
+# This file turns the searches made by the check pages into SQL. A search of
+# a table is described by which of its filters are used, and the same filters
+# always give the same SQL text whatever order they were given in, with every
+# value passed as a parameter. Searches that differ only in their values then
+# share a statement in the sqlite3 statement cache rather than each being
+# prepared again. It only needs sqlite3, so it can be used by reporting
+# scripts without the app.
+from collections import namedtuple
+
+from A1_inventory_management.utils.datetime_helpers import toDayNumber
+
+# Columns returned by searches of batches and transactions. Dates are given by
+# the generated text columns rather than the integer columns they are stored in
+BATCH_COLUMNS = ["id", "stock_id", "quantity_initial", "quantity_current", "delivered_at", "recorded_in_database", "use_by"]
+TRANSACTION_COLUMNS = ["id", "transaction_type", "batch_id", "stock_id", "quantity", "removal_reason", "occured_at", "recorded_in_database"]
+
+# The integer column each date column is stored in, which searches compare
+# and sort against so that they can use its index
+DATE_COLUMNS = {
+    "delivered_at": "delivered_day",
+    "use_by": "use_by_day",
+    "occured_at": "occured_day",
+    "recorded_in_database": "recorded_at",
+}
+
+# How a filter compares its column. A day range is a (from, to) pair of
+# dates, inclusive of both. A second range is the same, but against a column
+# stored in seconds, so it runs to the end of the last day
+EQUAL = "equal"
+DAY_RANGE = "day range"
+SECOND_RANGE = "second range"
+
+Filter = namedtuple("Filter", ["column", "kind"])
+
+# A table that can be searched, and its filters by name. The filters are
+# written into the SQL in this order
+TableSpec = namedtuple("TableSpec", ["name", "columns", "filters"])
+
+BATCHES = TableSpec("batches", BATCH_COLUMNS, {
+    "batchId": Filter("id", EQUAL),
+    "stockId": Filter("stock_id", EQUAL),
+    "deliveredAt": Filter("delivered_day", DAY_RANGE),
+    "recordedInDatabase": Filter("recorded_at", SECOND_RANGE),
+    "useBy": Filter("use_by_day", DAY_RANGE),
+})
+
+TRANSACTIONS = TableSpec("transactions", TRANSACTION_COLUMNS, {
+    "transactionType": Filter("transaction_type", EQUAL),
+    "stockId": Filter("stock_id", EQUAL),
+    "occuredAt": Filter("occured_day", DAY_RANGE),
+    "recordedInDatabase": Filter("recorded_at", SECOND_RANGE),
+    "removalReason": Filter("removal_reason", EQUAL),
+})
+
+
+#######################
+## class SearchQuery ##
+#######################
+# A search of one table, ready to be turned into SQL
+class SearchQuery:
+    """
+    A search of the rows of a table that match every filter given, combined
+    with AND. Filters whose value is None are left out.
+
+    Rows are sorted by orderBy, then by id. When sorting by id, a page of
+    results is found by passing limit along with the id of the last row of
+    the previous page as afterId, or the first row of the next page as
+    beforeId, so each page is found by seeking rather than with OFFSET.
+    offset skips rows instead, for reading rows from any position when the
+    rows before it have not been read.
+
+    Args:
+        table (TableSpec): the table to search, BATCHES or TRANSACTIONS
+        filters (dict): value of each filter used, by name
+        afterId (int): only return rows with an id greater than this
+        beforeId (int): only return rows with an id less than this
+        orderBy (string): the column to sort by, one of table.columns
+        descending (bool): whether to sort from largest to smallest
+        limit (int): the largest number of rows to return
+        offset (int): the number of matching rows to skip
+
+    Raises:
+        ValueError: if a filter or orderBy is not one of the table's, or a
+            page is asked for when not sorting by id in ascending order
+    """
+    def __init__(self, table, filters=None, afterId=None, beforeId=None, orderBy="id", descending=False, limit=None, offset=None):
+        filters = {k: v for k, v in (filters or {}).items() if v is not None}
+        unknown = [k for k in filters if k not in table.filters]
+        if unknown:
+            raise ValueError(f"{table.name} cannot be filtered by {', '.join(unknown)}")
+        if orderBy not in table.columns:
+            raise ValueError(f"{table.name} cannot be sorted by {orderBy}")
+        if (afterId is not None or beforeId is not None) and (orderBy != "id" or descending):
+            raise ValueError("Pages can only be found when sorting by id in ascending order")
+        self.table = table
+        self.filters = filters
+        self.afterId = afterId
+        self.beforeId = beforeId
+        self.orderBy = orderBy
+        self.descending = descending
+        self.limit = limit
+        self.offset = offset
+
+    @property
+    def backwards(self):
+        """Whether the rows are read in reverse and must be put back in
+        order. A page before beforeId is the last rows before it, so they are
+        read from beforeId down"""
+        return self.beforeId is not None and self.afterId is None and self.limit is not None
+
+    def select(self, archives=()):
+        """Build the statement that finds the matching rows
+
+        Args:
+            archives (list): schema names of attached archives to search as
+                well as the table. Each is searched with the same filters,
+                order and limit, and their rows merged
+
+        Returns:
+            tuple: (SQL text, parameters)
+        """
+        conditions, queryParameters = self._where()
+        column = DATE_COLUMNS.get(self.orderBy, self.orderBy)
+        direction = " DESC" if self.descending != self.backwards else ""
+        if column == "id":
+            order = f" ORDER BY id{direction}"
+        else:
+            # id breaks ties so that the order is the same every time
+            order = f" ORDER BY {column}{direction}, id{direction}"
+        limit = " LIMIT ?" if self.limit is not None else ""
+        limitParameters = [self.limit] if self.limit is not None else []
+        if self.offset:
+            # A negative limit is no limit
+            limit = " LIMIT ? OFFSET ?"
+            limitParameters = [self.limit if self.limit is not None else -1, self.offset]
+
+        columns = ", ".join(self.table.columns)
+        if not archives:
+            queryString = f"SELECT {columns} FROM {self.table.name}" + self._whereClause(conditions) + order + limit
+            return queryString, tuple(queryParameters + limitParameters)
+
+        # Each part reads at most limit rows in order through its own
+        # indexes, so only those are sorted together. Rows skipped by offset
+        # may come from any part, so each reads offset more. The column
+        # sorted by is carried out of each part as sort_key, as it may not be
+        # one of the columns returned
+        partLimit = " LIMIT ?" if self.limit is not None else ""
+        partParameters = [self.limit + (self.offset or 0)] if self.limit is not None else []
+        parts = [
+            f"SELECT * FROM (SELECT {columns}, {column} AS sort_key FROM {schema}.{self.table.name}"
+            + self._whereClause(conditions) + order + partLimit + ")"
+            for schema in ("main",) + tuple(archives)
+        ]
+        queryString = (
+            f"SELECT {columns} FROM ({' UNION ALL '.join(parts)}) "
+            f"ORDER BY sort_key{direction}, id{direction}" + limit
+        )
+        return queryString, tuple((queryParameters + partParameters) * len(parts) + limitParameters)
+
+    def count(self, archives=()):
+        """Build the statement that counts the matching rows, ignoring any
+        page and limit
+
+        Args:
+            archives (list): schema names of attached archives to count the
+                rows of as well as the table
+
+        Returns:
+            tuple: (SQL text, parameters)
+        """
+        conditions, queryParameters = self._where(paged=False)
+        if not archives:
+            return f"SELECT COUNT(*) FROM {self.table.name}" + self._whereClause(conditions), tuple(queryParameters)
+        parts = [
+            f"SELECT COUNT(*) AS n FROM {schema}.{self.table.name}" + self._whereClause(conditions)
+            for schema in ("main",) + tuple(archives)
+        ]
+        return f"SELECT SUM(n) FROM ({' UNION ALL '.join(parts)})", tuple(queryParameters * len(parts))
+
+    def explain(self, conn):
+        """Find how sqlite will run the search
+
+        Args:
+            conn (sqlite3.Connection): connection to the database to search
+
+        Returns:
+            list: the detail of each step of the query plan, in order
+        """
+        queryString, queryParameters = self.select()
+        return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {queryString}", queryParameters)]
+
+    def _where(self, paged=True):
+        conditions = []
+        queryParameters = []
+        for name, (column, kind) in self.table.filters.items():
+            if name not in self.filters:
+                continue
+            value = self.filters[name]
+            if kind == EQUAL:
+                conditions.append(f"{column} = ?")
+                queryParameters.append(value)
+                continue
+            start, end = (toDayNumber(d) for d in value)
+            if kind == SECOND_RANGE:
+                conditions.append(f"{column} >= ? AND {column} < ?")
+                queryParameters.extend((start * 86400, (end + 1) * 86400))
+            else:
+                conditions.append(f"{column} >= ? AND {column} <= ?")
+                queryParameters.extend((start, end))
+        if paged and self.afterId is not None:
+            conditions.append("id > ?")
+            queryParameters.append(self.afterId)
+        if paged and self.beforeId is not None:
+            conditions.append("id < ?")
+            queryParameters.append(self.beforeId)
+        return conditions, queryParameters
+
+    def _whereClause(self, conditions):
+        return " WHERE " + " AND ".join(conditions) if conditions else ""
@@ -0,0 +1,161 @@
+# This file defines the row source that the results grid in core.py reads
+# from. A search can match far more rows than can be shown, so the source
+# reads them a block at a time as they are scrolled to, and keeps only the
+# blocks used most recently. Rows are sorted by the database rather than in
+# memory, so a block anywhere in the results is read without reading the
+# blocks before it. It only needs sqlite3, so it can be tested without the
+# app.
+from collections import OrderedDict
+
+from A1_inventory_management.query_builder import SearchQuery
+
+# Rows read from the database at a time
+ROWS_PER_BLOCK = 200
+
+# Blocks kept in memory
+MAX_CACHED_BLOCKS = 50
+
+# Columns that results can be sorted by, by table. An index reads each of
+# them in order, so a block deep into the results is found by skipping index
+# entries rather than by sorting every matching row again
+SORTABLE_COLUMNS = {
+    "batches": ("id", "delivered_at", "use_by", "recorded_in_database"),
+    "transactions": ("id", "occured_at", "recorded_in_database"),
+}
+
+
+###########################
+## class SearchRowSource ##
+###########################
+# The rows of a search, read a block at a time as they are needed
+class SearchRowSource:
+    """
+    The rows matched by a search, in the order given by orderBy and then id.
+    Row n is in block n // blockSize, and each block is read with a search
+    limited to blockSize rows from its offset.
+
+    The source is used from the thread that shows the rows. Reading a block
+    from the database is done elsewhere, such as on the DatabaseWorker, by
+    the jobs from loadJob and countJob, and their results are handed back
+    with addBlocks and the rowCount attribute.
+
+    Args:
+        table (TableSpec): the table searched, BATCHES or TRANSACTIONS
+        filters (dict): value of each filter used, by name
+        orderBy (string): the column to sort by, one of SORTABLE_COLUMNS
+        descending (bool): whether to sort from largest to smallest
+        blockSize (int): the rows read at a time
+        maxBlocks (int): the blocks kept in memory. Those used least
+            recently are dropped first
+
+    Raises:
+        ValueError: if the results cannot be sorted by orderBy
+    """
+    def __init__(self, table, filters, orderBy="id", descending=False, blockSize=ROWS_PER_BLOCK, maxBlocks=MAX_CACHED_BLOCKS):
+        if orderBy not in SORTABLE_COLUMNS[table.name]:
+            raise ValueError(f"{table.name} results cannot be sorted by {orderBy}")
+        self.table = table
+        self.filters = filters
+        self.orderBy = orderBy
+        self.descending = descending
+        self.blockSize = blockSize
+        self.maxBlocks = maxBlocks
+        # The number of matching rows, once counted
+        self.rowCount = None
+        self._blocks = OrderedDict()
+
+    def sortedBy(self, orderBy, descending=False):
+        """A source of the same search sorted another way, which reads its
+        rows again. The rows are the same, so their count is kept
+
+        Returns:
+            SearchRowSource: the new source
+        """
+        source = SearchRowSource(self.table, self.filters, orderBy, descending, self.blockSize, self.maxBlocks)
+        source.rowCount = self.rowCount
+        return source
+
+    def query(self, block=None):
+        """The search of a block of rows, or of every row if block is None
+
+        Returns:
+            SearchQuery: the search
+        """
+        if block is None:
+            return SearchQuery(self.table, self.filters, orderBy=self.orderBy, descending=self.descending)
+        return SearchQuery(self.table, self.filters, orderBy=self.orderBy, descending=self.descending,
+                           limit=self.blockSize, offset=block * self.blockSize)
+
+    def rows(self, start, stop):
+        """The rows from start up to stop that have been read
+
+        Returns:
+            list: a row, or None if it has not been read, for each position.
+                Positions past the last row are left out once it is known
+        """
+        if self.rowCount is not None:
+            stop = min(stop, self.rowCount)
+        found = []
+        for n in range(start, stop):
+            block = self._blocks.get(n // self.blockSize)
+            found.append(block[n % self.blockSize] if block is not None and n % self.blockSize < len(block) else None)
+        # The blocks shown are the last to be dropped
+        for b in range(start // self.blockSize, (max(start, stop - 1)) // self.blockSize + 1):
+            if b in self._blocks:
+                self._blocks.move_to_end(b)
+        return found
+
+    def missingBlocks(self, start, stop):
+        """The blocks holding rows from start up to stop that have not been
+        read, in order"""
+        if self.rowCount is not None:
+            stop = min(stop, self.rowCount)
+        if stop <= start:
+            return []
+        return [b for b in range(start // self.blockSize, (stop - 1) // self.blockSize + 1) if b not in self._blocks]
+
+    def loadJob(self, blocks):
+        """Make a job that reads blocks from the database, for the thread
+        that runs it to call with an InventoryStore
+
+        Args:
+            blocks (list): the blocks to read
+
+        Returns:
+            function: reads the blocks with the store it is given, and
+                returns a list of (block, rows) to pass to addBlocks
+        """
+        queries = [(block, self.query(block)) for block in blocks]
+        return lambda store: [(block, store.search(query).rows) for block, query in queries]
+
+    def countJob(self):
+        """Make a job that counts every matching row, for the thread that
+        runs it to call with an InventoryStore"""
+        query = self.query()
+        return lambda store: store.count(query)
+
+    def addBlocks(self, loaded):
+        """Keep blocks read by a job from loadJob, dropping the least
+        recently used once more than maxBlocks are held. A block shorter than
+        blockSize is the last, so it also gives the number of rows
+
+        Args:
+            loaded (list): (block, rows) for each block read
+        """
+        for block, rows in loaded:
+            self._blocks[block] = rows
+            self._blocks.move_to_end(block)
+            if len(rows) < self.blockSize:
+                self.rowCount = block * self.blockSize + len(rows)
+        while len(self._blocks) > self.maxBlocks:
+            self._blocks.popitem(last=False)
+
+    def rowsKnown(self):
+        """The number of rows, or if they have not been counted, the rows up
+        to the end of the furthest block read"""
+        if self.rowCount is not None:
+            return self.rowCount
+        if not self._blocks:
+            return 0
+        last = max(self._blocks)
+        return last * self.blockSize + len(self._blocks[last])
@@ -0,0 +1,204 @@
+# This file defines snapshots of the batches and transactions tables for
+# reporting. A snapshot is a folder holding one NumPy .npy file for each
+# column of each table, which reports open memory-mapped and scan without
+# reading the live database. Several report processes can share one snapshot
+# without copying it.
+#
+# Layout of a snapshot folder:
+#   manifest.json            format, when it was taken, row counts and the
+#                            dictionaries of the encoded columns
+#   batches/<column>.npy     one file per column of batches
+#   transactions/<column>.npy
+import json
+import shutil
+import time
+from pathlib import Path
+
+import numpy as np
+
+SNAPSHOT_FORMAT = 1
+
+# Rows read from the database and written to the column files at a time
+DEFAULT_CHUNK_SIZE = 100_000
+
+# Stored in a date column in place of NULL
+NULL_DAY = np.iinfo(np.int32).min
+
+# Columns of each table in a snapshot, with how they are stored. Each is the
+# (column, dtype, encoding). stock_id is stored as a
+# code into stock_ids, and the text columns as codes into their dictionary.
+# Dates are day numbers since 1970-01-01, and recorded_at is seconds
+SNAPSHOT_COLUMNS = {
+    "batches": [
+        ("id", np.int64, None),
+        ("stock_id", np.int32, "stock_ids"),
+        ("quantity_initial", np.int64, None),
+        ("quantity_current", np.int64, None),
+        ("delivered_day", np.int32, "day"),
+        ("use_by_day", np.int32, "day"),
+        ("recorded_at", np.int64, None),
+    ],
+    "transactions": [
+        ("id", np.int64, None),
+        ("transaction_type", np.uint8, "transaction_types"),
+        ("batch_id", np.int64, None),
+        ("stock_id", np.int32, "stock_ids"),
+        ("quantity", np.int64, None),
+        ("removal_reason", np.uint8, "removal_reasons"),
+        ("occured_day", np.int32, "day"),
+        ("recorded_at", np.int64, None),
+    ],
+}
+
+
+####################
+## class Snapshot ##
+####################
+# The columns of a snapshot, opened memory-mapped
+class Snapshot:
+    """
+    A snapshot opened by loadSnapshot. batches and transactions map each
+    column name to a read-only memory-mapped array, so a column is only read
+    from disk as it is scanned.
+
+    The stock_id columns hold codes: stockIds[code] is the stock id and
+    stockNames[code] its name. transaction_type and removal_reason hold codes
+    into transactionTypes and removalReasons. Date columns are day numbers,
+    with NULL_DAY where the date was not recorded.
+    """
+    def __init__(self, path, manifest, batches, transactions):
+        self.path = path
+        self.takenAt = manifest["taken_at"]
+        self.stockIds = np.array(manifest["stock_ids"], dtype=np.int64)
+        self.stockNames = np.array(manifest["stock_names"], dtype=object)
+        self.transactionTypes = np.array(manifest["transaction_types"], dtype=object)
+        self.removalReasons = np.array(manifest["removal_reasons"], dtype=object)
+        self.batches = batches
+        self.transactions = transactions
+
+    def stockCode(self, stockId):
+        """Find the code a stock id is stored as, or None if it is not in the
+        snapshot"""
+        code = int(np.searchsorted(self.stockIds, stockId))
+        if code < len(self.stockIds) and self.stockIds[code] == stockId:
+            return code
+        return None
+
+
+##########################
+## def writeSnapshot () ##
+##########################
+# Copy batches and transactions into a new snapshot folder
+def writeSnapshot(store, path, chunkSize=DEFAULT_CHUNK_SIZE):
+    """Write a snapshot of the batches and transactions tables.
+
+    Both tables are read in one read transaction, so they agree with each
+    other even while stations write to the database. Each column file is
+    filled a chunk of rows at a time, so a table of any size is written
+    without being held in memory. The snapshot is written beside path and
+    then moved into place, replacing any snapshot already there.
+
+    Args:
+        store (InventoryStore): the store to take the snapshot of
+        path (string or Path): the folder to write the snapshot to
+        chunkSize (int): the number of rows read at a time
+
+    Returns:
+        dict: the number of rows written for each table
+    """
+    path = Path(path)
+    partial = path.with_name(path.name + ".partial")
+    shutil.rmtree(partial, ignore_errors=True)
+    partial.mkdir(parents=True)
+
+    conn = store.conn
+    conn.execute("BEGIN")
+    try:
+        stockRows = conn.execute("SELECT id, name FROM stock_names ORDER BY id").fetchall()
+        dictionaries = {
+            "stock_ids": [stockId for stockId, name in stockRows],
+            "transaction_types": [r[0] for r in conn.execute("SELECT DISTINCT transaction_type FROM transactions ORDER BY 1")],
+            "removal_reasons": [r[0] for r in conn.execute("SELECT DISTINCT removal_reason FROM transactions ORDER BY 1")],
+        }
+        rowCounts = {}
+        for table, columns in SNAPSHOT_COLUMNS.items():
+            rowCounts[table] = _writeTable(conn, partial / table, table, columns, dictionaries, chunkSize)
+    finally:
+        conn.execute("COMMIT")
+
+    manifest = {
+        "format": SNAPSHOT_FORMAT,
+        "taken_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "rows": rowCounts,
+        "stock_ids": dictionaries["stock_ids"],
+        "stock_names": [name for stockId, name in stockRows],
+        "transaction_types": dictionaries["transaction_types"],
+        "removal_reasons": dictionaries["removal_reasons"],
+    }
+    with open(partial / "manifest.json", "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    shutil.rmtree(path, ignore_errors=True)
+    partial.rename(path)
+    return rowCounts
+
+
+#########################
+## def loadSnapshot () ##
+#########################
+# Open a snapshot without reading its columns
+def loadSnapshot(path):
+    """Open a snapshot written by writeSnapshot. Every column is opened with
+    np.load(mmap_mode='r'), so nothing is read until it is used and the
+    arrays cannot be changed.
+
+    Args:
+        path (string or Path): the snapshot folder
+
+    Raises:
+        ValueError: if the folder holds a snapshot of another format
+
+    Returns:
+        Snapshot: the opened snapshot
+    """
+    path = Path(path)
+    with open(path / "manifest.json") as f:
+        manifest = json.load(f)
+    if manifest["format"] != SNAPSHOT_FORMAT:
+        raise ValueError(f"{path} is a snapshot of format {manifest['format']}, not {SNAPSHOT_FORMAT}")
+    tables = {}
+    for table, columns in SNAPSHOT_COLUMNS.items():
+        tables[table] = {name: np.load(path / table / f"{name}.npy", mmap_mode="r") for name, dtype, encoding in columns}
+    return Snapshot(path, manifest, tables["batches"], tables["transactions"])
+
+
+def _writeTable(conn, folder, table, columns, dictionaries, chunkSize):
+    folder.mkdir()
+    rowCount = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    # open_memmap writes the .npy header and lets the rows be filled in place,
+    # so only a chunk of them is in memory at once
+    arrays = [np.lib.format.open_memmap(folder / f"{name}.npy", mode="w+", dtype=dtype, shape=(rowCount,))
+              for name, dtype, encoding in columns]
+    encoders = [_encoder(encoding, dictionaries) for name, dtype, encoding in columns]
+
+    cur = conn.execute(f"SELECT {', '.join(name for name, dtype, encoding in columns)} FROM {table} ORDER BY id")
+    written = 0
+    while True:
+        rows = cur.fetchmany(chunkSize)
+        if not rows:
+            break
+        for array, encoder, values in zip(arrays, encoders, zip(*rows)):
+            array[written:written + len(rows)] = values if encoder is None else [encoder(v) for v in values]
+        written += len(rows)
+    for array in arrays:
+        array.flush()
+    return written
+
+
+def _encoder(encoding, dictionaries):
+    if encoding is None:
+        return None
+    if encoding == "day":
+        return lambda day: NULL_DAY if day is None else day
+    codes = {value: code for code, value in enumerate(dictionaries[encoding])}
+    return codes.__getitem__
@@ -0,0 +1,102 @@
+# This file defines the index of stock names that InventoryStore keeps in
+# memory. Names are matched without regard to case, both exactly, to find
+# the stock type entered on a page, and by their start, to suggest names as
+# they are typed. The names are held in sorted order, so the names starting
+# with what has been typed are found by a binary search however many stock
+# types there are. It has no imports from the app, so it can be tested on
+# its own.
+from bisect import bisect_left
+
+# Names suggested at once while a name is typed
+MAX_SUGGESTIONS = 10
+
+
+##########################
+## class StockNameIndex ##
+##########################
+# The names of the stock types, for lookups that do not read the database
+class StockNameIndex:
+    """
+    The name of each stock type, looked up by id, by name or by the start of
+    a name. Names are compared by their casefolded form, so "Steel Plates"
+    finds "steel plates". Where several stock types share a name, it finds
+    the one with the lowest id.
+
+    Retired stock types are still found by name and id, so that their
+    history can be searched, and can be left out of the suggestions.
+
+    The index is not changed once made. InventoryStore makes a new one when
+    stock_names has changed, so an index can be kept and read from another
+    thread.
+
+    Args:
+        names (dict): the name of each stock type, keyed by its id
+        retired (set): the ids of the retired stock types
+    """
+    def __init__(self, names, retired=frozenset()):
+        self.names = names
+        self.retired = frozenset(retired)
+        ids = {}
+        for stockId in sorted(names):
+            ids.setdefault(_key(names[stockId]), stockId)
+        self._ids = ids
+        # _keys and _sortedIds are in the order of the casefolded names, so
+        # that the names with a prefix are next to each other
+        self._keys = sorted(ids)
+        self._sortedIds = [ids[key] for key in self._keys]
+
+    def __len__(self):
+        return len(self.names)
+
+    def find(self, name):
+        """The id of the stock type with a name, in any case
+
+        Returns:
+            int: the id, or None if no stock type has the name
+        """
+        return self._ids.get(_key(name))
+
+    def resolve(self, nameOrId):
+        """The id of a stock type from either its name or its id number
+
+        Returns:
+            int: the id, or None if the stock type does not exist
+        """
+        nameOrId = str(nameOrId).strip()
+        if nameOrId.isdecimal():
+            return int(nameOrId) if int(nameOrId) in self.names else None
+        return self.find(nameOrId)
+
+    def nameOf(self, stockId):
+        """The name of a stock type, or None if its id does not exist"""
+        return self.names.get(stockId)
+
+    def isRetired(self, stockId):
+        """Whether a stock type has been retired"""
+        return stockId in self.retired
+
+    def startingWith(self, prefix, limit=MAX_SUGGESTIONS, includeRetired=True):
+        """The names that start with a prefix, in any case, in the order of
+        their casefolded form
+
+        Args:
+            prefix (string): the start of the name. Leading spaces are ignored
+            limit (int): the most names returned
+            includeRetired (bool): whether to include retired stock types
+
+        Returns:
+            list: up to limit names, as they are stored. An empty prefix
+                matches the first names in order
+        """
+        prefix = prefix.lstrip().casefold()
+        found = []
+        for i in range(bisect_left(self._keys, prefix), len(self._keys)):
+            if len(found) == limit or not self._keys[i].startswith(prefix):
+                break
+            if includeRetired or self._sortedIds[i] not in self.retired:
+                found.append(self.names[self._sortedIds[i]])
+        return found
+
+
+def _key(name):
+    return name.strip().casefold()
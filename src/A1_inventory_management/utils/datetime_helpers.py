@@ -1,4 +1,7 @@
-from datetime import datetime
+from datetime import date as _date, datetime, timedelta
+
+# Dates are stored in the database as the number of days since this date
+EPOCH_DATE = _date(1970, 1, 1)
 
 def isDate(date):
     try:
@@ -33,4 +36,30 @@ def dateLessThan(date1, date2):
 
 def getCurrentDateTime():
     now = datetime.now()
-    return now.strftime("%Y_%m_%d_%H_%M_%S")
\ No newline at end of file
+    return now.strftime("%Y_%m_%d_%H_%M_%S")
+
+def toDayNumber(date):
+    """Converts a date to the day number it is stored as in the database
+
+    Args:
+        date (string): A string in the form "YYYY-MM-DD". Leading zeroes may
+            be left out, as in "YYYY-M-D"
+
+    Raises:
+        ValueError: if date is not a valid date
+
+    Returns:
+        int: The number of days from 1970-01-01 to date
+    """
+    return (datetime.strptime(date, "%Y-%m-%d").date() - EPOCH_DATE).days
+
+def fromDayNumber(day):
+    """Converts a day number stored in the database back to a date
+
+    Args:
+        day (int): The number of days since 1970-01-01
+
+    Returns:
+        string: A string in the form "YYYY-MM-DD"
+    """
+    return (EPOCH_DATE + timedelta(days=day)).isoformat()
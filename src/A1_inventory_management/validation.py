@@ -0,0 +1,130 @@
+# This file defines the checks made on the data entered to add or remove
+# stock, or to name a stock type, before it is submitted to the database. They
+# need only the store, so they can be used without tkinter or pandas.
+from A1_inventory_management.utils.datetime_helpers import isDate, dateInFuture, dateLessThan
+
+# The longest name a stock type can have, as checked by stock_names
+MAX_NAME_LENGTH = 50
+
+
+##########################
+## def checkAddition () ##
+##########################
+# Check the details of a new batch
+def checkAddition(store, name, quantity, deliveredAt, useBy):
+    """Check each detail of a batch to be added
+
+    Args:
+        store (InventoryStore): store used to look up the stock type
+        name (string): name or id number of the stock type
+        quantity (int): the number of units delivered
+        deliveredAt (string): delivery date in the form YYYY-MM-DD
+        useBy (string): use by date in the form YYYY-MM-DD
+
+    Returns:
+        dict: True or False for each of name, quantity, delivered_at and use_by
+    """
+    stockIndex = store.stock_name_index()
+    stockId = stockIndex.resolve(name)
+    return {
+        # check name is valid, in any case. A stock number may be entered
+        # instead of a name. A retired stock type cannot have batches added
+        "name": stockId is not None and not stockIndex.isRetired(stockId),
+        # Ensure that quantity is an integer and is greater than 0
+        "quantity": quantity > 0,
+        # Ensure that the delivery date is formatted correctly (yyyy-mm-dd),
+        # that all parts are possible (eg, no 13th month), and that it is not
+        # in the future
+        "delivered_at": isDate(deliveredAt) and not dateInFuture(deliveredAt),
+        # Ensure that the use by date is formatted correctly and in the future
+        "use_by": isDate(useBy) and dateInFuture(useBy),
+    }
+
+
+#########################
+## def checkRemoval () ##
+#########################
+# Check the details of a removal from a single batch
+def checkRemoval(store, batchId, quantity, removalDate, removalReason):
+    """Check each detail of a removal from a batch
+
+    Args:
+        store (InventoryStore): store used to look up the batch
+        batchId (int): id of the batch to remove stock from
+        quantity (int): the number of units removed
+        removalDate (string): date of removal in the form YYYY-MM-DD
+        removalReason (string): the reason for removal
+
+    Returns:
+        dict: True or False for each of batchId, quantity, removalDate and
+            removalReason. If the batch does not exist, the other checks
+            cannot be made and are None.
+    """
+    batch = store.get_batch(batchId)
+    if batch is None:
+        return {"batchId": False, "quantity": None, "removalDate": None, "removalReason": None}
+    _, _, quantityCurrent, deliveredAt = batch
+    return {
+        "batchId": True,
+        # Ensure that quantity is greater than 0, and is not more than the
+        # quantity_current in the chosen batch
+        "quantity": 0 < quantity <= int(quantityCurrent),
+        # Ensure that the removal date is a valid date, not in the future, and
+        # not before the batch was delivered
+        "removalDate": isDate(removalDate) and not dateInFuture(removalDate) and not dateLessThan(removalDate, deliveredAt),
+        "removalReason": bool(removalReason),
+    }
+
+
+##############################
+## def checkStockRemoval () ##
+##############################
+# Check the details of a removal from the batches of a stock type
+def checkStockRemoval(store, name, quantity, removalDate, removalReason):
+    """Check each detail of a removal of a quantity of a stock type
+
+    Args:
+        store (InventoryStore): store used to look up the stock type
+        name (string): name or id number of the stock type
+        quantity (int): the total number of units removed
+        removalDate (string): date of removal in the form YYYY-MM-DD
+        removalReason (string): the reason for removal
+
+    Returns:
+        dict: True or False for each of name, quantity, removalDate and
+            removalReason. If the stock type does not exist, the quantity
+            cannot be checked and is None.
+    """
+    stockId = store.resolve_stock_id(name)
+    return {
+        "name": stockId is not None,
+        # Ensure that quantity is greater than 0 and no more than the total
+        # held of that stock type
+        "quantity": None if stockId is None else 0 < quantity <= store.stock_totals(stockId).rows[0][2],
+        "removalDate": isDate(removalDate) and not dateInFuture(removalDate),
+        "removalReason": bool(removalReason),
+    }
+
+
+###########################
+## def checkStockName () ##
+###########################
+# Check a name for a new or renamed stock type
+def checkStockName(name):
+    """Check that a name can be given to a stock type. Whether another stock
+    type already has it is checked by the database
+
+    Args:
+        name (string): the name, without spaces at either end
+
+    Returns:
+        string: why the name cannot be used, or None if it can
+    """
+    if not name:
+        return "A stock type must have a name"
+    if len(name) > MAX_NAME_LENGTH:
+        return f"The name of a stock type can be at most {MAX_NAME_LENGTH} characters"
+    # A name made only of digits would be read as an id number
+    if name.isdecimal():
+        return "The name of a stock type cannot be only a number"
+    return None
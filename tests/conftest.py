@@ -1,8 +1,19 @@
 import pytest
 import A1_inventory_management.core as qc
+from A1_inventory_management.database_init import initialiseDb
+from A1_inventory_management.inventory_store import InventoryStore
 
 @pytest.fixture(scope="session")
 def root():
     root = qc.App()
     root.withdraw()
-    yield root
\ No newline at end of file
+    yield root
+
+# Store connected to a new database in a temporary folder
+@pytest.fixture()
+def store(tmp_path):
+    dbPath = tmp_path / "stock_database.db"
+    initialiseDb(dbPath)
+    store = InventoryStore(dbPath)
+    yield store
+    store.close()
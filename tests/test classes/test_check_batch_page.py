@@ -0,0 +1,36 @@
+import pytest
+from unittest.mock import patch
+import A1_inventory_management.core as qc
+
+# Test that a date range that is not made of valid dates is turned down
+# before any search is made
+@pytest.mark.parametrize("dates", [
+    ("2025-13-40", "2025-12-31"),
+    ("2025-01-01", "abc"),
+], ids=["Invalid_Start", "Invalid_End"])
+@patch("A1_inventory_management.core.CheckBatchPage.showResults")
+@patch("A1_inventory_management.core.showerror")
+def test_check_batch_page_invalid_range(mock_showerror, mock_show_results, root, dates):
+    page = qc.CheckBatchPage(root.container, root)
+    parameters = root.queryData["parameters"]
+    page.dataUsed["name"].set(False)
+    page.dataUsed["delivered_at"].set(True)
+    for var, date in zip(parameters["delivered_at"], dates):
+        var.set(date)
+
+    page.submitQuery()
+
+    mock_showerror.assert_called_once()
+    assert "YYYY-MM-DD" in mock_showerror.call_args.kwargs["message"]
+    mock_show_results.assert_not_called()
+
+# Test that an error from a search that is not a database error is shown
+# rather than raised from the Tk event loop
+@patch("A1_inventory_management.core.showerror")
+def test_check_batch_page_search_error_shown(mock_showerror, root):
+    page = qc.CheckBatchPage(root.container, root)
+    with patch.object(root, "runInBackground", lambda work, onDone, onError, **kwargs: onError(ValueError("bad block"))):
+        page.runSearch(lambda store: None, lambda result: None)
+
+    mock_showerror.assert_called_once()
+    assert "bad block" in mock_showerror.call_args.kwargs["message"]
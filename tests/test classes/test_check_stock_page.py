@@ -0,0 +1,13 @@
+from unittest.mock import patch
+import A1_inventory_management.core as qc
+
+# Test that an error from the search that is not a database error is shown
+# rather than raised from the Tk event loop
+@patch("A1_inventory_management.core.showerror")
+def test_check_stock_page_search_error_shown(mock_showerror, root):
+    page = qc.CheckStockPage(root.container, root)
+    with patch.object(root, "runInBackground", lambda work, onDone, onError, **kwargs: onError(RuntimeError("unexpected"))):
+        page.submitQuery()
+
+    mock_showerror.assert_called_once()
+    assert "unexpected" in mock_showerror.call_args.kwargs["message"]
@@ -0,0 +1,24 @@
+import pytest
+from unittest.mock import patch
+import A1_inventory_management.core as qc
+
+# Test that a date range that is not made of valid dates is turned down
+# before any search is made
+@pytest.mark.parametrize("dates", [
+    ("2025-13-40", "2025-12-31"),
+    ("2025-01-01", "abc"),
+], ids=["Invalid_Start", "Invalid_End"])
+@patch("A1_inventory_management.core.CheckTransactionPage.showResults")
+@patch("A1_inventory_management.core.showerror")
+def test_check_transaction_page_invalid_range(mock_showerror, mock_show_results, root, dates):
+    page = qc.CheckTransactionPage(root.container, root)
+    parameters = root.queryData["parameters"]
+    page.dataUsed["occured_at"].set(True)
+    for var, date in zip(parameters["occured_at"], dates):
+        var.set(date)
+
+    page.submitQuery()
+
+    mock_showerror.assert_called_once()
+    assert "YYYY-MM-DD" in mock_showerror.call_args.kwargs["message"]
+    mock_show_results.assert_not_called()
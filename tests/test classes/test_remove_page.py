@@ -54,3 +54,27 @@ def test_remove_page_checkValid(mock_display_invalid, mock_confirm_query, mock_c
 
     # check that the results are what they should be
     assert list(page.dataValid) == list(expected_results)
+
+# Test that a removal from a batch that does not exist is reported as a
+# missing batch, one from a batch without enough stock as a shortage, and
+# any other error as a failure rather than raised
+@pytest.mark.parametrize("error, title", [
+    (qc.BatchNotFoundError("Batch 99 does not exist"), "Batch not found"),
+    (ValueError("Batch 1 holds fewer than 45 units"), "Not enough stock"),
+    (RuntimeError("unexpected"), "Failed to update batches"),
+], ids=["Missing_Batch", "Not_Enough_Stock", "Unexpected_Error"])
+@patch("A1_inventory_management.core.showerror")
+def test_remove_page_submit_failed(mock_showerror, root, error, title):
+    page = qc.RemovePage(root.container, root)
+    parameters = root.queryData["parameters"]
+    parameters["batchId"].set(99)
+    parameters["quantity"].set(45)
+    parameters["removalDate"].set("2025-6-4")
+    parameters["removalReason"].set("used")
+    with patch.object(root, "runInBackground", lambda work, onDone, onError, **kwargs: onError(error)):
+        page.submitQuery()
+
+    mock_showerror.assert_called_once()
+    assert mock_showerror.call_args.kwargs["title"] == title
+    assert str(error) in mock_showerror.call_args.kwargs["message"]
+    assert root.queryData["outcome"] == qc.FAILURE_STRING_G
@@ -0,0 +1,36 @@
+import pytest
+from A1_inventory_management.inventory_store import InventoryStore
+from benchmarks.bench_queries import percentile
+from benchmarks.datagen import generateDatabase
+
+# Test that the generator makes exactly the rows asked for, and that the batch
+# totals agree with their transactions
+def test_generate_database(tmp_path):
+    generateDatabase(tmp_path / "bench.db", 10, 200, 900, seed=1)
+    store = InventoryStore(tmp_path / "bench.db")
+
+    assert len(store.stock_names()) == 10
+    assert store.count_batches() == 200
+    assert store.count_transactions() == 900
+    assert store.count_transactions(transactionType="addition") == 200
+    removed, = store.conn.execute(
+        "SELECT SUM(quantity) FROM transactions WHERE transaction_type = 'removal'"
+    ).fetchone()
+    initial, current = store.conn.execute("SELECT SUM(quantity_initial), SUM(quantity_current) FROM batches").fetchone()
+    assert initial - current == removed
+    assert sum(r[2] for r in store.stock_totals().rows) == current
+    store.close()
+
+# Test that the same seed always generates the same database
+def test_generate_database_is_deterministic(tmp_path):
+    dumps = []
+    for name in ("a.db", "b.db"):
+        generateDatabase(tmp_path / name, 5, 50, 120, seed=7)
+        store = InventoryStore(tmp_path / name)
+        dumps.append(store.conn.execute("SELECT * FROM transactions ORDER BY id").fetchall())
+        store.close()
+    assert dumps[0] == dumps[1]
+
+@pytest.mark.parametrize("p, expected", [(50, 50), (95, 95), (99, 99), (100, 100), (0, 1)])
+def test_percentile(p, expected):
+    assert percentile(list(range(1, 101)), p) == expected
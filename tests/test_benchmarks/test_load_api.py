@@ -0,0 +1,23 @@
+import threading
+from A1_inventory_management.api_server import InventoryServer
+from benchmarks.load_api import REQUEST_MIX, runLoad
+
+# Test that the load test makes every kind of request, and that each one
+# succeeds against a server on localhost, apart from removals turned down for
+# want of stock
+def test_run_load(store):
+    server = InventoryServer(("127.0.0.1", 0), store.dbPath, threads=2)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        timings, statuses, elapsed = runLoad(server.server_address, clients=2, requests=40, batchSize=3)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert sum(len(values) for values in timings.values()) == 80
+    assert set(timings) == set(REQUEST_MIX)
+    assert all(status in (200, 201) for kind, counts in statuses.items() if kind != "remove_stock" for status in counts)
+    assert set(statuses["remove_stock"]) <= {200, 400}
+    added = sum(statuses["add"].values()) + 3 * sum(statuses["movements"].values())
+    assert store.count_transactions(transactionType="addition") == added
@@ -0,0 +1,25 @@
+import pytest
+from A1_inventory_management.database_init import initialiseDb
+from A1_inventory_management.inventory_store import InventoryStore
+from benchmarks.stress_writers import checkLedger, runStress
+
+# Test that a dock and two pick stations writing at once leave the batches,
+# transactions and stock totals in agreement
+@pytest.mark.parametrize("walMode", [True, False], ids=["WAL", "Rollback_Journal"])
+def test_concurrent_stations_keep_ledger(tmp_path, walMode):
+    dbPath = tmp_path / "stock_database.db"
+    initialiseDb(dbPath, walMode=walMode)
+    outcomes, _ = runStress(dbPath, pickers=2, operations=150)
+
+    assert outcomes["busy"] == 0
+    store = InventoryStore(dbPath)
+    assert checkLedger(store) == []
+    assert store.count_transactions(transactionType="addition") == 150
+    store.close()
+
+# Test that the ledger check finds a batch that disagrees with its
+# transactions
+def test_check_ledger_finds_problems(store):
+    batchId = store.add_batch(1, 10, "2025-01-01", "2030-01-01")
+    store.conn.execute("UPDATE batches SET quantity_current = 4 WHERE id = ?", (batchId,))
+    assert checkLedger(store) == [f"batch {batchId}: 10 added and 0 removed, but 4 held"]
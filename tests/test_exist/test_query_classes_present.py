@@ -21,9 +21,12 @@ def test_window_exists(root):
 @pytest.mark.parametrize("page_class", [
     qc.AddPage,
     qc.RemovePage,
+    qc.RemoveStockPage,
     qc.CheckBatchPage,
     qc.CheckStockPage,
     qc.CheckTransactionPage,
+    qc.ExpiryForecastPage,
+    qc.CatalogPage,
 ])
 def test_page_exists(root, page_class):
     page = page_class(root.container, root)
@@ -45,6 +48,12 @@ def test_page_exists(root, page_class):
         "removalDate" : tk.StringVar,
         "removalReason" : tk.StringVar
     }],
+    [qc.RemoveStockPage, {
+        "name" : tk.StringVar,
+        "quantity" : tk.IntVar,
+        "removalDate" : tk.StringVar,
+        "removalReason" : tk.StringVar
+    }],
     [qc.CheckBatchPage, {
             "batchId" : tk.IntVar,
             "name" : tk.StringVar,
@@ -61,8 +70,9 @@ def test_page_exists(root, page_class):
     }],
     [qc.CheckStockPage, {
         "stock_id" : tk.StringVar,
+        "as_of" : tk.StringVar,
     }]
-], ids=["AddPage", "RemovePage", "CheckBatchPage", "CheckTransactionPage", "CheckStockPage"]
+], ids=["AddPage", "RemovePage", "RemoveStockPage", "CheckBatchPage", "CheckTransactionPage", "CheckStockPage"]
 )
 def test_write_page_data(root, page_class_dict):
     # Create a page of the chosen class
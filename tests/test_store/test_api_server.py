@@ -0,0 +1,117 @@
+import http.client
+import json
+import threading
+import pytest
+from A1_inventory_management.api_server import InventoryServer, MovementWriter
+
+@pytest.fixture()
+def server(store):
+    server = InventoryServer(("127.0.0.1", 0), store.dbPath, threads=4)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def request(server, method, path, body=None):
+    """Make a request and return the status and decoded JSON body"""
+    conn = http.client.HTTPConnection(*server.server_address, timeout=5)
+    try:
+        conn.request(method, path, json.dumps(body) if body is not None else None, {"Content-Type": "application/json"})
+        response = conn.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        conn.close()
+
+ADD = {"stock": "nuts", "quantity": 10, "delivered_at": "2025-01-01", "use_by": "2099-01-01"}
+
+# Test that stock added and removed through the API can be searched for
+def test_add_remove_and_search(server):
+    assert request(server, "POST", "/api/add", ADD) == (201, {"batch_id": 1})
+    assert request(server, "POST", "/api/add", dict(ADD, stock=2, quantity=5)) == (201, {"batch_id": 2})
+    assert request(server, "POST", "/api/remove", {"batch_id": 1, "quantity": 3, "date": "2025-02-01", "reason": "used"}) == (200, {"stock_id": 1})
+    assert request(server, "POST", "/api/remove_stock", {"stock": "steel plates", "quantity": 5, "date": "2025-02-01", "reason": "lost"}) == (200, {"batches": [[2, 5]]})
+
+    status, body = request(server, "GET", "/api/batches?stock=nuts")
+    assert status == 200
+    assert [dict(zip(body["columns"], row))["quantity_current"] for row in body["rows"]] == [7]
+    status, body = request(server, "GET", "/api/transactions?removal_reason=lost&occured_from=2025-02-01&occured_to=2025-02-28")
+    assert [row[0] for row in body["rows"]] == [4]
+    status, body = request(server, "GET", "/api/stock_totals?stock=1")
+    assert body["rows"][0][:3] == [1, "nuts", 7]
+
+# Test that invalid movements and searches are turned down, naming the
+# fields at fault
+def test_invalid_requests(server):
+    status, body = request(server, "POST", "/api/add", dict(ADD, stock="bolts", use_by="2020-01-01"))
+    assert status == 400 and body["fields"] == ["name", "use_by"]
+    status, body = request(server, "POST", "/api/remove", {"batch_id": "1", "quantity": 1})
+    assert status == 400 and body["fields"] == ["batch_id", "date", "reason"]
+    status, body = request(server, "POST", "/api/remove_stock", {"stock": "nuts", "quantity": 1, "date": "2025-02-01", "reason": "eaten"})
+    assert status == 400 and body["fields"] == ["quantity", "removalReason"]
+    assert request(server, "GET", "/api/batches?delivered_from=2025-01-01")[0] == 400
+    assert request(server, "GET", "/api/orders")[0] == 404
+
+# Test that a batch of movements is applied together, and that one that
+# fails undoes the rest
+def test_movements_batch(server, store):
+    status, body = request(server, "POST", "/api/movements", {"movements": [
+        dict(ADD, action="add"),
+        {"action": "remove", "batch_id": 1, "quantity": 4, "date": "2025-02-01", "reason": "used"},
+    ]})
+    assert status == 200
+    assert body == {"results": [{"batch_id": 1}, {"stock_id": 1}]}
+
+    status, body = request(server, "POST", "/api/movements", {"movements": [
+        dict(ADD, action="add"),
+        {"action": "remove", "batch_id": 1, "quantity": 99, "date": "2025-02-01", "reason": "used"},
+    ]})
+    assert status == 400
+    assert body["index"] == 1 and body["fields"] == ["quantity"]
+    assert store.count_batches() == 1
+    assert store.count_transactions() == 2
+
+# Test that a stock type renamed in a batch of movements that fails keeps
+# its old name for the requests that follow
+def test_movements_batch_rename_undone(server, store):
+    status, body = request(server, "POST", "/api/movements", {"movements": [
+        {"action": "rename_stock_type", "stock": "nuts", "name": "bolts"},
+        dict(ADD, action="add", quantity=0),
+    ]})
+    assert status == 400
+    assert request(server, "POST", "/api/add", dict(ADD, stock="bolts"))[0] == 400
+    assert request(server, "POST", "/api/add", ADD) == (201, {"batch_id": 1})
+    assert store.stock_names()[1] == "nuts"
+
+# Test that requests waiting for the writer are committed together, each
+# in its own savepoint so that one that fails does not undo the others
+def test_writer_groups_requests(store):
+    writer = MovementWriter(store.dbPath)
+    # Hold the write lock so that every request queues behind it
+    store.conn.execute("BEGIN IMMEDIATE")
+    futures = [writer.submit([dict(ADD, action="add")]) for _ in range(5)]
+    failing = writer.submit([{"action": "remove", "batch_id": 99, "quantity": 1, "date": "2025-02-01", "reason": "used"}])
+    store.conn.execute("COMMIT")
+    assert sorted(f.result(timeout=5)[0]["batch_id"] for f in futures) == [1, 2, 3, 4, 5]
+    with pytest.raises(ValueError):
+        failing.result(timeout=5)
+    writer.close()
+    assert store.count_transactions() == 5
+
+# Test that stock types are added, renamed and retired through the API, and
+# that a retired stock type cannot have batches added
+def test_catalog_actions(server):
+    assert request(server, "POST", "/api/add_stock_type", {"name": "Washers"}) == (201, {"stock_id": 5})
+    status, body = request(server, "POST", "/api/add_stock_type", {"name": "washers"})
+    assert status == 409 and "already" in body["error"]
+    assert request(server, "POST", "/api/rename_stock_type", {"stock": "washers", "name": "Flat washers"}) == (200, {"stock_id": 5})
+    assert request(server, "POST", "/api/retire_stock_type", {"stock": 5}) == (200, {"stock_id": 5})
+    status, body = request(server, "POST", "/api/add", dict(ADD, stock="flat washers"))
+    assert status == 400 and body["fields"] == ["name"]
+    assert request(server, "POST", "/api/retire_stock_type", {"stock": "bolts"})[0] == 400
+
+    status, body = request(server, "GET", "/api/stock_types?prefix=F")
+    assert body["columns"] == ["id", "name", "retired_at"]
+    assert [row[:2] for row in body["rows"]] == [[5, "Flat washers"], [4, "folding chairs"]]
+    status, body = request(server, "GET", "/api/stock_types?prefix=f&include_retired=0")
+    assert body["rows"] == [[4, "folding chairs", None]]
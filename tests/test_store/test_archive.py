@@ -0,0 +1,91 @@
+import pytest
+from A1_inventory_management.archive import archiveClosedYears, archivePath, archiveYear
+from A1_inventory_management.inventory_store import ArchiveError, InventoryStore
+from A1_inventory_management.query_builder import TRANSACTIONS, SearchQuery
+
+TODAY = "2025-06-01"
+
+@pytest.fixture()
+def archived(store):
+    emptied = store.add_batch(1, 10, "2023-03-01", "2030-01-01")
+    store.remove_from_batch(emptied, 10, "2023-06-01", "used")
+    held = store.add_batch(1, 5, "2023-05-01", "2030-01-01")
+    store.remove_from_batch(held, 2, "2024-02-01", "lost")
+    emptiedLater = store.add_batch(2, 7, "2024-01-10", "2030-01-01")
+    store.remove_from_batch(emptiedLater, 7, "2024-03-01", "used")
+    store.add_batch(2, 4, "2025-01-05", "2030-01-01")
+    moved = archiveClosedYears(store, today=TODAY)
+    assert moved == {2023: {"transactions": 3, "batches": 1}, 2024: {"transactions": 3, "batches": 1}}
+    return store
+
+def attached(store):
+    return [row[1] for row in store.conn.execute("PRAGMA database_list")]
+
+# Test that the closed years are moved out, leaving the stock database with
+# only the batches that hold stock and this year's transactions
+def test_archive_moves_closed_years(archived):
+    assert archived.conn.execute("SELECT id FROM main.batches ORDER BY id").fetchall() == [(2,), (4,)]
+    assert archived.conn.execute("SELECT id FROM main.transactions").fetchall() == [(7,)]
+    assert archivePath(archived.dbPath, 2023).exists()
+    assert archived.stock_totals().rows[0][2:4] == (3, 1)
+
+# Test that searches read the archives only when their dates reach into them
+def test_search_reads_archives_in_range(archived):
+    store = InventoryStore(archived.dbPath)
+    assert [r[0] for r in store.find_transactions(occuredAt=("2025-01-01", "2025-12-31")).rows] == [7]
+    assert [r[0] for r in store.find_batches(deliveredAt=("2025-01-01", "2025-12-31")).rows] == [4]
+    assert attached(store) == ["main"]
+
+    assert [r[0] for r in store.find_transactions(occuredAt=("2024-01-01", "2024-12-31")).rows] == [4, 5, 6]
+    assert attached(store) == ["main", "archive_2024"]
+
+    # Without a date range every archive is searched, with rows in order
+    # across them and paged in the same way
+    assert [r[0] for r in store.find_transactions().rows] == [1, 2, 3, 4, 5, 6, 7]
+    assert [r[0] for r in store.find_transactions(afterId=2, limit=3).rows] == [3, 4, 5]
+    assert [r[0] for r in store.find_transactions(beforeId=6, limit=2).rows] == [4, 5]
+    assert [r[0] for r in store.search(SearchQuery(TRANSACTIONS, limit=3, offset=2)).rows] == [3, 4, 5]
+    assert store.count_transactions(transactionType="removal") == 3
+    assert [r[0] for r in store.find_batches(stockId=2).rows] == [3, 4]
+    store.close()
+
+# Test that stock levels of archived dates are still found, and that the
+# daily totals still count the archived transactions
+def test_history_after_archiving(archived):
+    assert archived.stock_levels_at("2023-12-31").rows[:2] == [(1, "nuts", 5), (2, "steel plates", 0)]
+    assert archived.stock_levels_at("2024-02-15").rows[:2] == [(1, "nuts", 3), (2, "steel plates", 7)]
+    assert archived.batch_levels_at("2023-04-01").rows == [(1, 1, 10)]
+    assert archived.batch_levels_at("2024-02-15").rows == [(2, 1, 3), (3, 2, 7)]
+
+    # A transaction dated in an archived year drops the checkpoints from its
+    # date, leaving March to July 2023, and they are made again from the
+    # archives
+    archived.add_batch(3, 6, "2023-08-01", "2030-01-01")
+    assert archived.conn.execute("SELECT COUNT(*) FROM checkpoint_days").fetchone()[0] == 5
+    assert archived.update_checkpoints(through=TODAY) > 0
+    assert archived.stock_levels_at("2024-02-15").rows[:3] == [(1, "nuts", 3), (2, "steel plates", 7), (3, "screws", 6)]
+
+    daily = archived.conn.execute("SELECT * FROM transaction_daily ORDER BY 1, 2, 3, 4").fetchall()
+    archived.rebuild_transaction_daily()
+    assert archived.conn.execute("SELECT * FROM transaction_daily ORDER BY 1, 2, 3, 4").fetchall() == daily
+    assert archived.usage_by_week("2023-01-01", "2023-12-31").rows == [("2023-05-29", 1, "nuts", 10)]
+
+# Test that a year is only archived once it has ended, and after the years
+# before it
+def test_archive_year_order(store):
+    store.add_batch(1, 10, "2023-03-01", "2030-01-01")
+    store.add_batch(1, 10, "2024-03-01", "2030-01-01")
+    with pytest.raises(ValueError, match="has not ended"):
+        archiveYear(store, 2025, today=TODAY)
+    with pytest.raises(ValueError, match="archived first"):
+        archiveYear(store, 2024, today=TODAY)
+    assert store.count_transactions() == 2
+
+# Test that a search reaching into an archive that is missing is refused
+def test_missing_archive(archived):
+    archivePath(archived.dbPath, 2023).unlink()
+    store = InventoryStore(archived.dbPath)
+    assert len(store.find_transactions(occuredAt=("2024-01-01", "2025-12-31")).rows) == 4
+    with pytest.raises(ArchiveError):
+        store.find_transactions()
+    store.close()
@@ -0,0 +1,68 @@
+import pytest
+from A1_inventory_management.bulk_import import importDeliveries, ManifestError
+
+def write_manifest(path, lines):
+    path.write_text("\n".join(lines) + "\n")
+    return path
+
+# Test that valid rows are added as batches with matching transactions, and
+# invalid rows are reported by row number
+def test_import_csv(store, tmp_path):
+    manifest = write_manifest(tmp_path / "delivery.csv", [
+        "name,quantity,delivered_at,use_by",
+        "nuts,10,2025-6-4,2099-01-01",
+        "Screws,5,2025-06-04,2099-01-01",
+        "2,7,2025-06-05,2099-02-01",
+        "bolts,5,2025-06-04,2099-01-01",
+        "nuts,0,2025-06-04,2099-01-01",
+        "nuts,3,2025-06-04,2020-01-01",
+        "",
+        "nuts,4,2025-13-01,2099-01-01",
+    ])
+
+    report = importDeliveries(store, manifest, chunkSize=2)
+
+    assert report.imported == 3
+    assert [e[0] for e in report.errors] == [5, 6, 7, 9]
+    assert "bolts" in report.errors[0][1]
+    batches = store.find_batches().rows
+    assert [(b[1], b[2], b[4]) for b in batches] == [(1, 10, "2025-06-04"), (3, 5, "2025-06-04"), (2, 7, "2025-06-05")]
+    columns, transactions = store.find_transactions(transactionType="addition")
+    assert [t[columns.index("batch_id")] for t in transactions] == [b[0] for b in batches]
+    assert store.stock_totals(1).rows[0][2] == 10
+
+# Test that a dry run validates without writing to the database
+def test_import_dry_run(store, tmp_path):
+    manifest = write_manifest(tmp_path / "delivery.csv", [
+        "use_by,name,quantity,delivered_at",
+        "2099-01-01,nuts,10,2025-06-04",
+    ])
+    assert importDeliveries(store, manifest, dryRun=True) == (1, [])
+    assert store.find_batches().rows == []
+
+# Test that a manifest without the required columns is rejected
+def test_import_missing_column(store, tmp_path):
+    manifest = write_manifest(tmp_path / "delivery.csv", ["name,quantity,use_by", "nuts,10,2099-01-01"])
+    with pytest.raises(ManifestError):
+        importDeliveries(store, manifest)
+    assert store.find_batches().rows == []
+
+# Test that spreadsheet manifests are read, including cells holding dates
+def test_import_xlsx(store, tmp_path):
+    openpyxl = pytest.importorskip("openpyxl")
+    from datetime import date
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(["name", "quantity", "delivered_at", "use_by"])
+    sheet.append(["folding chairs", 12, date(2025, 6, 4), "2099-01-01"])
+    sheet.append([1, 3, "2025-06-04", date(2099, 1, 1)])
+    manifest = tmp_path / "delivery.xlsx"
+    workbook.save(manifest)
+
+    report = importDeliveries(store, manifest)
+
+    assert report == (2, [])
+    assert [(b[1], b[2], b[4], b[6]) for b in store.find_batches().rows] == [
+        (4, 12, "2025-06-04", "2099-01-01"),
+        (1, 3, "2025-06-04", "2099-01-01"),
+    ]
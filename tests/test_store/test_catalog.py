@@ -0,0 +1,121 @@
+import sqlite3 as sql
+import pytest
+from A1_inventory_management.catalog import loadCatalog
+from A1_inventory_management.database_init import initialiseDb
+from A1_inventory_management.inventory_store import InventoryStore
+
+TODAY = "2025-06-01"
+
+def writeFile(tmp_path, text):
+    path = tmp_path / "catalog.csv"
+    path.write_text(text)
+    return path
+
+# Test that stock types are added, renamed and retired, and that retired ones
+# can no longer have batches added but can still be found
+def test_catalog_changes(store):
+    washers = store.add_stock_type(" Washers ")
+    assert store.resolve_stock_id("washers") == washers
+    with pytest.raises(ValueError, match="already"):
+        store.add_stock_type("NUTS")
+    with pytest.raises(ValueError, match="only a number"):
+        store.add_stock_type("42")
+    with pytest.raises(ValueError, match="already"):
+        store.rename_stock_type(washers, "screws")
+    store.rename_stock_type(1, "Nuts")
+    assert store.stock_names()[1] == "Nuts"
+
+    store.retire_stock_type(washers, retiredOn=TODAY)
+    store.retire_stock_type(washers, retiredOn="2025-07-01")
+    assert store.find_stock_types("wash").rows == [(washers, "Washers", TODAY)]
+    assert store.find_stock_types("wash", includeRetired=False).rows == []
+    assert store.suggest_stock_names("w", includeRetired=False) == []
+    assert store.resolve_stock_id("washers") == washers
+    store.restore_stock_type(washers)
+    assert store.suggest_stock_names("w", includeRetired=False) == ["Washers"]
+    with pytest.raises(ValueError, match="no stock type"):
+        store.retire_stock_type(99)
+
+# Test that names changed in a transaction that is rolled back, or in a
+# savepoint within one, resolve as they did before
+def test_rolled_back_changes_not_cached(store):
+    with pytest.raises(ValueError):
+        with store.transaction():
+            store.rename_stock_type(1, "bolts")
+            assert store.resolve_stock_id("bolts") == 1
+            store.add_stock_type("washers")
+            assert store.resolve_stock_id("washers") is not None
+            raise ValueError("undo")
+    with store.transaction():
+        with pytest.raises(ValueError):
+            with store.transaction():
+                store.add_stock_type("rivets")
+                assert store.resolve_stock_id("rivets") is not None
+                raise ValueError("undo")
+        assert store.resolve_stock_id("rivets") is None
+
+    assert store.resolve_stock_id("bolts") is None
+    assert store.resolve_stock_id("nuts") == 1
+    assert store.resolve_stock_id("washers") is None
+    washers = store.add_stock_type("washers")
+    assert store.resolve_stock_id("washers") == washers
+
+# Test that a renamed built-in stock type is not added again when the
+# database is opened again
+def test_renamed_seed_not_restored(store):
+    store.rename_stock_type(1, "hex nuts")
+    initialiseDb(store.dbPath)
+    store.invalidate_stock_names()
+
+    assert store.stock_names() == {1: "hex nuts", 2: "steel plates", 3: "screws", 4: "folding chairs"}
+    store.rename_stock_type(1, "nuts")
+    assert store.resolve_stock_id("nuts") == 1
+
+# Test that a product master adds the new names in order, updates the case
+# and retired state of known ones, and skips rows that are not valid
+def test_load_catalog(store, tmp_path):
+    path = writeFile(tmp_path, "Name,Retired\nwashers,no\nNuts,\nscrews,yes\nsteel plates,\nbolts,\n,no\nWASHERS,no\nrivets,maybe\n12,\n")
+    assert loadCatalog(store, path, dryRun=True, today=TODAY)[:3] == (2, 2, 1)
+    assert len(store.stock_names()) == 4
+
+    report = loadCatalog(store, path, today=TODAY)
+    assert report[:3] == (2, 2, 1)
+    assert [row for row, message in report.errors] == [7, 8, 9, 10]
+    assert "repeats the name on row 2" in report.errors[1][1]
+    assert store.find_stock_types().rows == [
+        (6, "bolts", None), (4, "folding chairs", None), (1, "Nuts", None),
+        (3, "screws", TODAY), (2, "steel plates", None), (5, "washers", None),
+    ]
+
+    # Loading it again changes nothing, and takes no ids
+    assert loadCatalog(store, path, today=TODAY)[:3] == (0, 0, 5)
+    assert store.add_stock_type("rivets") == 7
+
+# Test that a file without a retired column leaves retired stock types as
+# they are
+def test_load_without_retired(store, tmp_path):
+    store.retire_stock_type(3, retiredOn=TODAY)
+    assert loadCatalog(store, writeFile(tmp_path, "name\nscrews\nwashers\n"))[:3] == (1, 0, 1)
+    assert store.stock_name_index().isRetired(3)
+
+# Test that stock types added again under the same name before names were
+# unique are merged into the first, along with their batches and totals
+def test_duplicate_names_merged(tmp_path):
+    dbPath = tmp_path / "stock_database.db"
+    initialiseDb(dbPath)
+    conn = sql.connect(dbPath)
+    conn.executescript("""
+        DROP INDEX idx_stock_names_name;
+        INSERT INTO stock_names (name) VALUES ('Nuts'), ('washers'), ('screws');
+        INSERT INTO batches (stock_id, quantity_initial, quantity_current, delivered_day, use_by_day) VALUES (5, 10, 10, 20000, 30000), (1, 3, 3, 20000, 30000);
+        INSERT INTO transactions (transaction_type, batch_id, stock_id, quantity, occured_day) VALUES ('addition', 1, 5, 10, 20000), ('addition', 2, 1, 3, 20000);
+    """)
+    conn.close()
+
+    initialiseDb(dbPath)
+    store = InventoryStore(dbPath)
+    assert store.stock_names() == {1: "nuts", 2: "steel plates", 3: "screws", 4: "folding chairs", 6: "washers"}
+    assert store.stock_totals(1).rows[0][2:4] == (13, 2)
+    assert store.conn.execute("SELECT stock_id, quantity FROM transaction_daily").fetchall() == [(1, 13)]
+    assert store.count_transactions(stockId=1) == 2
+    store.close()
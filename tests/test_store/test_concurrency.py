@@ -0,0 +1,46 @@
+import threading
+import pytest
+import sqlite3 as sql
+from A1_inventory_management.database_init import initialiseDb
+from A1_inventory_management.inventory_store import DatabaseBusyError, InventoryStore
+
+# Test that databases are put into WAL mode unless the rollback journal is
+# asked for
+@pytest.mark.parametrize("walMode, expected", [(True, "wal"), (False, "delete")], ids=["WAL", "Rollback_Journal"])
+def test_journal_mode(tmp_path, walMode, expected):
+    dbPath = tmp_path / "stock_database.db"
+    initialiseDb(dbPath, walMode=walMode)
+    store = InventoryStore(dbPath)
+    assert store.conn.execute("PRAGMA journal_mode").fetchone()[0] == expected
+    store.close()
+
+# Hold the write lock on the database from another connection
+@pytest.fixture()
+def other_station(store):
+    conn = sql.connect(store.dbPath, isolation_level=None, check_same_thread=False)
+    conn.execute("BEGIN IMMEDIATE")
+    yield conn
+    if conn.in_transaction:
+        conn.rollback()
+    conn.close()
+
+# Test that a write gives up with DatabaseBusyError once its retries run out,
+# leaving the database unaltered
+def test_write_gives_up_when_busy(store, other_station):
+    busyStore = InventoryStore(store.dbPath, busyTimeout=0.01, writeRetries=2)
+    with pytest.raises(DatabaseBusyError):
+        busyStore.add_batch(1, 10, "2025-01-01", "2030-01-01")
+    other_station.rollback()
+    assert busyStore.count_batches() == 0
+    busyStore.close()
+
+# Test that a write that finds the database busy is retried, and made once
+# the other station has finished
+def test_write_retried_until_free(store, other_station):
+    busyStore = InventoryStore(store.dbPath, busyTimeout=0.01, writeRetries=8)
+    timer = threading.Timer(0.1, other_station.commit)
+    timer.start()
+    batchId = busyStore.add_batch(1, 10, "2025-01-01", "2030-01-01")
+    timer.join()
+    assert busyStore.get_batch(batchId) == (batchId, 1, 10, "2025-01-01")
+    busyStore.close()
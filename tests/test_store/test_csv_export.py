@@ -0,0 +1,48 @@
+import csv
+import gzip
+import pytest
+from A1_inventory_management.csv_export import exportSearch
+from A1_inventory_management.query_builder import BATCHES, TRANSACTIONS, SearchQuery
+
+@pytest.fixture()
+def stocked(store):
+    for n in range(1, 8):
+        store.add_batch(1 + n % 2, n, f"2025-01-0{n}", "2030-01-01")
+    return store
+
+def read_csv(path, opener=open):
+    with opener(path, "rt", newline="") as f:
+        return list(csv.reader(f))
+
+# Test that every matching row is exported, however many batches it takes,
+# with the stock names filled in and hidden columns left out
+def test_export_streams_every_row(stocked, tmp_path):
+    path = tmp_path / "export.csv"
+    progress = []
+    written = exportSearch(stocked, SearchQuery(TRANSACTIONS, {"stockId": 2}), path, stocked.stock_names(), ["id"],
+                           progress=progress.append, fetchSize=2)
+    rows = read_csv(path)
+    assert rows[0] == ["transaction_type", "batch_id", "name", "quantity", "removal_reason", "occured_at", "recorded_in_database"]
+    assert [r[:4] for r in rows[1:]] == [["addition", str(n), "steel plates", str(n)] for n in (1, 3, 5, 7)]
+    assert written == 4
+    assert progress == [2, 4]
+
+# Test that a file ending in .gz is compressed
+def test_export_gzip(stocked, tmp_path):
+    path = tmp_path / "export.csv.gz"
+    assert exportSearch(stocked, SearchQuery(BATCHES), path) == 7
+    rows = read_csv(path, gzip.open)
+    assert rows[0][:2] == ["id", "stock_id"]
+    assert len(rows) == 8
+
+# Test that an export stopped part way does not leave a file behind
+def test_cancelled_export_removes_file(stocked, tmp_path):
+    path = tmp_path / "export.csv"
+    batches = []
+    def checkCancelled():
+        batches.append(1)
+        if len(batches) > 1:
+            raise RuntimeError("cancelled")
+    with pytest.raises(RuntimeError):
+        exportSearch(stocked, SearchQuery(BATCHES), path, checkCancelled=checkCancelled, fetchSize=2)
+    assert not path.exists()
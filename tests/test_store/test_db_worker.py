@@ -0,0 +1,102 @@
+import threading
+import time
+import pytest
+from A1_inventory_management.db_worker import DatabaseWorker
+
+# Query that runs until it is interrupted
+ENDLESS_QUERY = "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) SELECT COUNT(*) FROM n"
+
+@pytest.fixture()
+def worker(store):
+    worker = DatabaseWorker(store.dbPath)
+    yield worker
+    worker.close()
+
+def wait_for(worker, job, timeout=5):
+    """Poll the worker until job has finished"""
+    deadline = time.monotonic() + timeout
+    while not job.finished:
+        assert time.monotonic() < deadline, "job did not finish"
+        worker.poll()
+        time.sleep(0.01)
+
+# Test that a job's result is passed to onDone from the polling thread, and
+# that its changes are seen by other connections
+def test_job_result_delivered_by_poll(store, worker):
+    delivered = []
+    job = worker.submit(lambda s: s.add_batch(1, 5, "2025-01-01", "2030-01-01"),
+                        lambda batchId: delivered.append((batchId, threading.current_thread())))
+    wait_for(worker, job)
+    assert delivered == [(1, threading.current_thread())]
+    assert store.get_batch(1)[2] == 5
+    assert not worker.busy()
+
+# Test that an exception raised by a job is passed to onError, and raised by
+# poll if there is no onError
+def test_job_error_delivered_by_poll(worker):
+    errors = []
+    job = worker.submit(lambda s: s.remove_from_batch(99, 1, "2025-01-01", "used"), onError=errors.append)
+    wait_for(worker, job)
+    assert [str(e) for e in errors] == ["Batch 99 does not exist"]
+
+    job = worker.submit(lambda s: s.remove_from_batch(99, 1, "2025-01-01", "used"))
+    with pytest.raises(ValueError):
+        wait_for(worker, job)
+
+# Test that a job cancelled before it starts is not run
+def test_cancel_queued_job(store, worker):
+    started = threading.Event()
+    release = threading.Event()
+    delivered = []
+    blocking = worker.submit(lambda s: (started.set(), release.wait()))
+    queued = worker.submit(lambda s: s.add_batch(1, 5, "2025-01-01", "2030-01-01"), delivered.append, delivered.append)
+    started.wait()
+    worker.cancel(queued)
+    release.set()
+    wait_for(worker, blocking)
+    wait_for(worker, queued)
+    assert delivered == []
+    assert store.get_batch(1) is None
+
+# Test that cancelling a running query interrupts it, and that the worker
+# goes on to run the next job
+def test_cancel_interrupts_running_query(worker):
+    delivered = []
+    job = worker.submit(lambda s: s.conn.execute(ENDLESS_QUERY).fetchone(), delivered.append, delivered.append)
+    time.sleep(0.1)
+    worker.cancel(job)
+    wait_for(worker, job)
+    assert delivered == []
+
+    job = worker.submit(lambda s: s.count_batches(), delivered.append)
+    wait_for(worker, job)
+    assert delivered == [0]
+
+# Test that a job looping over steps stops at checkCancelled once cancelled
+def test_check_cancelled_stops_job(worker):
+    steps = []
+    delivered = []
+    def work(store):
+        while True:
+            worker.checkCancelled()
+            steps.append(1)
+            time.sleep(0.01)
+    job = worker.submit(work, delivered.append, delivered.append)
+    time.sleep(0.1)
+    worker.cancel(job)
+    wait_for(worker, job)
+    assert steps and delivered == []
+
+# Test that progress reported by a running job can be read from its Job
+def test_report_progress(worker):
+    reported = threading.Event()
+    release = threading.Event()
+    def work(store):
+        worker.reportProgress("half way")
+        reported.set()
+        release.wait()
+    job = worker.submit(work)
+    reported.wait()
+    assert job.progress == "half way"
+    release.set()
+    wait_for(worker, job)
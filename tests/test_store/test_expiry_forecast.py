@@ -0,0 +1,63 @@
+import pytest
+from A1_inventory_management.expiry_forecast import forecastExpiry, forecastTable
+
+@pytest.fixture()
+def stocked(store):
+    store.add_batch(1, 10, "2025-01-01", "2025-03-01")
+    store.add_batch(1, 4, "2025-01-01", "2025-03-03")
+    store.add_batch(2, 7, "2025-01-01", "2025-03-09")
+    store.add_batch(2, 5, "2025-01-01", "2025-02-27")
+    store.add_batch(3, 6, "2025-01-01", "2025-03-02")
+    store.add_batch(4, 8, "2025-01-01", "2026-01-01")
+    # Batches that are empty are not counted
+    store.remove_from_batch(5, 6, "2025-01-10", "used")
+    return store
+
+# Test that the stock is totalled on the day it expires, with stock past its
+# use by date counted as expired
+def test_daily_forecast(stocked):
+    forecast = forecastExpiry(stocked, horizonDays=7, today="2025-03-01")
+    assert forecast.stockIds.tolist() == [1, 2, 3, 4]
+    assert forecast.bucketStarts[:3] == ["2025-03-01", "2025-03-02", "2025-03-03"]
+    assert forecast.expiring.tolist() == [
+        [10, 0, 4, 0, 0, 0, 0],
+        [0] * 7,
+        [0] * 7,
+        [0] * 7,
+    ]
+    assert forecast.expired.tolist() == [0, 5, 0, 0]
+
+# Test that weekly buckets total each week, and that the last bucket is cut
+# off at the horizon
+def test_weekly_forecast(stocked):
+    forecast = forecastExpiry(stocked, horizonDays=9, bucketDays=7, today="2025-03-01")
+    assert forecast.bucketStarts == ["2025-03-01", "2025-03-08"]
+    assert forecast.expiring.tolist() == [[14, 0], [0, 7], [0, 0], [0, 0]]
+
+# Test that a single stock type can be forecast, and that the table leaves out
+# stock types with nothing expiring
+def test_forecast_table(stocked):
+    columns, rows = forecastTable(forecastExpiry(stocked, horizonDays=14, bucketDays=7, today="2025-03-01"))
+    assert columns == ["id", "name", "expired", "2025-03-01", "2025-03-08", "expiring"]
+    assert rows == [(1, "nuts", 0, 14, 0, 14), (2, "steel plates", 5, 0, 7, 7)]
+
+    forecast = forecastExpiry(stocked, horizonDays=14, today="2025-03-01", stockId=2)
+    assert forecast.stockNames == ["steel plates"]
+    assert forecast.expiring.sum() == 7
+
+# Test that the forecast is read with one query through the in stock index
+def test_forecast_uses_one_query(stocked):
+    statements = []
+    stocked.stock_names()
+    stocked.conn.set_trace_callback(statements.append)
+    forecastExpiry(stocked, today="2025-03-01")
+    stocked.conn.set_trace_callback(None)
+    selects = [s for s in statements if s.startswith("SELECT") and "batches" in s]
+    assert len(selects) == 1
+    plan = " ".join(r[3] for r in stocked.conn.execute(f"EXPLAIN QUERY PLAN {selects[0]}"))
+    assert "idx_batches_in_stock" in plan
+
+# Test that a forecast of no days ahead is refused
+def test_forecast_rejects_empty_horizon(store):
+    with pytest.raises(ValueError):
+        forecastExpiry(store, horizonDays=0)
@@ -0,0 +1,39 @@
+import subprocess
+import sys
+import pytest
+
+def imported_with(module):
+    """Import module in a new interpreter and return the heavy modules that
+    were imported along with it"""
+    script = (
+        f"import sys\nimport {module}\n"
+        "print(','.join(m for m in ('tkinter', 'pandas', 'pandastable') if m in sys.modules))"
+    )
+    output = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True).stdout
+    return [m for m in output.strip().split(",") if m]
+
+# Test that the database layer and validation can be used without tkinter or
+# pandas being imported
+@pytest.mark.parametrize("module", [
+    "A1_inventory_management.inventory_store",
+    "A1_inventory_management.validation",
+    "A1_inventory_management.bulk_import",
+    "A1_inventory_management.db_worker",
+    "A1_inventory_management.query_builder",
+    "A1_inventory_management.csv_export",
+    "A1_inventory_management.snapshot",
+    "A1_inventory_management.expiry_forecast",
+    "A1_inventory_management.archive",
+    "A1_inventory_management.instrumentation",
+    "A1_inventory_management.row_source",
+    "A1_inventory_management.api_server",
+    "A1_inventory_management.stock_index",
+    "A1_inventory_management.catalog",
+])
+def test_headless_modules_are_light(module):
+    assert imported_with(module) == []
+
+# Test that importing the pages does not import pandas or pandastable, which
+# are only loaded when a results table is needed
+def test_core_does_not_import_pandas():
+    assert imported_with("A1_inventory_management.core") == ["tkinter"]
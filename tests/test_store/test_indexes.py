@@ -0,0 +1,72 @@
+import pytest
+from A1_inventory_management.database_init import initialiseDb
+from A1_inventory_management.inventory_store import InventoryStore
+
+def query_plans(store, search):
+    """Run search against the store, and return the query plan of every
+    statement it executed"""
+    statements = []
+    store.conn.set_trace_callback(statements.append)
+    search(store)
+    store.conn.set_trace_callback(None)
+    return [
+        " | ".join(row[3] for row in store.conn.execute(f"EXPLAIN QUERY PLAN {s}"))
+        for s in statements if s.lstrip().upper().startswith("SELECT")
+    ]
+
+# Test that each search made by the check pages reads through an index rather
+# than scanning the whole table
+@pytest.mark.parametrize("search", [
+    lambda s: s.find_batches(batchId=1),
+    lambda s: s.find_batches(stockId=1),
+    lambda s: s.find_batches(stockId=1, deliveredAt=("2025-01-01", "2025-12-31")),
+    lambda s: s.find_batches(deliveredAt=("2025-01-01", "2025-12-31")),
+    lambda s: s.find_batches(useBy=("2025-01-01", "2025-12-31")),
+    lambda s: s.find_batches(recordedInDatabase=("2025-01-01", "2025-12-31")),
+    lambda s: s.find_transactions(transactionType="removal"),
+    lambda s: s.find_transactions(stockId=2, occuredAt=("2025-01-01", "2025-12-31")),
+    lambda s: s.find_transactions(transactionType="addition", occuredAt=("2025-01-01", "2025-12-31")),
+    lambda s: s.find_transactions(transactionType="removal", removalReason="lost"),
+    lambda s: s.find_transactions(occuredAt=("2025-01-01", "2025-12-31")),
+    lambda s: s.find_transactions(recordedInDatabase=("2025-01-01", "2025-12-31")),
+    lambda s: s.stock_totals(1),
+], ids=[
+    "Batch_Id", "Batch_Stock", "Batch_Stock_Delivered", "Batch_Delivered",
+    "Batch_Use_By", "Batch_Recorded", "Transaction_Type", "Transaction_Stock_Occured",
+    "Transaction_Type_Occured", "Transaction_Reason", "Transaction_Occured",
+    "Transaction_Recorded", "Stock_Totals",
+])
+def test_search_uses_index(store, search):
+    plans = query_plans(store, search)
+    assert plans
+    for plan in plans:
+        assert "USING" in plan, plan
+        assert "SCAN batches" not in plan and "SCAN transactions" not in plan, plan
+
+# Test that the totals of every stock type are read from stock_totals without
+# touching batches
+def test_stock_totals_does_not_read_batches(store):
+    plans = query_plans(store, lambda s: s.stock_totals())
+    assert plans == ["SCAN s | SEARCH t USING INTEGER PRIMARY KEY (rowid=?)"]
+
+# Test that the indexes are added to a database created before they existed
+def test_indexes_added_to_existing_database(tmp_path):
+    dbPath = tmp_path / "stock_database.db"
+    initialiseDb(dbPath)
+    store = InventoryStore(dbPath)
+    store.conn.execute("DROP INDEX idx_transactions_occured")
+    store.close()
+
+    initialiseDb(dbPath)
+    store = InventoryStore(dbPath)
+    names = [r[0] for r in store.conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")]
+    store.close()
+    assert "idx_transactions_occured" in names
+
+# Test that the FEFO allocation of a removal reads batches in order from the
+# partial index of batches in stock
+def test_remove_stock_uses_partial_index(store):
+    store.add_batch(1, 10, "2025-01-01", "2030-01-01")
+    plans = query_plans(store, lambda s: s.remove_stock(1, 5, "2025-02-01", "used"))
+    assert "USING COVERING INDEX idx_batches_in_stock" in plans[0]
+    assert "RIGHT PART OF ORDER BY" not in plans[0]
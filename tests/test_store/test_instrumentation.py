@@ -0,0 +1,96 @@
+import json
+import time
+import pytest
+import A1_inventory_management.instrumentation as instrumentation
+from A1_inventory_management.db_worker import DatabaseWorker
+from A1_inventory_management.instrumentation import METRICS, enable, enableFromEnvironment, timed, writeMetrics
+from A1_inventory_management.inventory_store import InventoryStore
+
+@pytest.fixture()
+def metricsDir(tmp_path):
+    # Every statement is logged as slow, so that each is written out
+    metricsDir = tmp_path / "metrics"
+    METRICS.reset()
+    enable(metricsDir, slowQueryMs=0)
+    yield metricsDir
+    instrumentation.disable()
+    METRICS.reset()
+
+def counter(name, **labels):
+    return METRICS.counters.get((name, tuple(sorted(labels.items()))), 0)
+
+def events(metricsDir, event):
+    with open(metricsDir / "metrics.jsonl") as f:
+        return [line for line in map(json.loads, f) if line["event"] == event]
+
+# Test that nothing is traced or recorded while the instrumentation is off
+def test_off_by_default(store):
+    assert not instrumentation.isEnabled()
+    assert store._tracer is None
+    assert timed()(lambda x: x + 1)(1) == 2
+    store.add_batch(1, 5, "2025-01-01", "2030-01-01")
+    assert store.find_batches().rows
+    assert METRICS.counters == {} and METRICS.timings == {}
+    assert not enableFromEnvironment({})
+
+# Test that the statements of a traced connection are counted, with the rows
+# they read and wrote, and that slow ones are logged when their timer ends
+def test_statements_traced(store, metricsDir):
+    traced = InventoryStore(store.dbPath)
+
+    @timed("add two")
+    def addTwo():
+        traced.add_batch(1, 5, "2025-01-01", "2030-01-01")
+        traced.add_batch(2, 3, "2025-01-01", "2030-01-01")
+
+    addTwo()
+    assert len(traced.find_batches().rows) == 2
+    traced.close()
+
+    # Each batch writes a batch and a transaction, and the triggers their
+    # totals
+    assert counter("rows_written") >= 4
+    assert counter("rows_read") >= 2
+    assert counter("sql_statements", kind="insert") == 4
+    assert counter("sql_statements", kind="select") >= 1
+    assert METRICS.timings[("timer", "add two")][0] == 1
+    slow = events(metricsDir, "slow_query")
+    assert sum("INSERT INTO batches" in event["sql"] for event in slow) == 2
+    assert [event["name"] for event in events(metricsDir, "timing")] == ["add two"]
+
+# Test that the metrics are written to the log and as Prometheus text
+def test_write_metrics(store, metricsDir):
+    timed("check")(lambda: None)()
+    METRICS.increment("rows_read", 3)
+    path = writeMetrics()
+    text = path.read_text()
+    assert "# TYPE a1_rows_read_total counter\na1_rows_read_total 3\n" in text
+    assert 'a1_timer_seconds_bucket{name="check",le="+Inf"} 1\n' in text
+    assert 'a1_timer_seconds_count{name="check"} 1\n' in text
+    assert events(metricsDir, "metrics")[-1]["counters"] == [{"name": "rows_read", "labels": {}, "value": 3}]
+
+# Test that the log is rotated once it reaches its size
+def test_log_rotated(tmp_path):
+    enable(tmp_path, maxLogBytes=1000)
+    try:
+        for _ in range(50):
+            instrumentation.logEvent("test", padding="x" * 50)
+    finally:
+        instrumentation.disable()
+        METRICS.reset()
+    assert (tmp_path / "metrics.jsonl.1").exists()
+    assert (tmp_path / "metrics.jsonl").stat().st_size <= 1000
+
+# Test that jobs run by the DatabaseWorker are timed under the label they
+# were submitted with
+def test_worker_jobs_timed_by_label(metricsDir, store):
+    worker = DatabaseWorker(store.dbPath)
+    try:
+        job = worker.submit(lambda s: s.count_batches(), label="checkBatch.search")
+        while not job.finished:
+            worker.poll()
+            time.sleep(0.01)
+    finally:
+        worker.close()
+    assert METRICS.timings[("timer", "checkBatch.search")][0] == 1
+    assert not any("<lambda>" in name for kind, name in METRICS.timings)
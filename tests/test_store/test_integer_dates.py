@@ -0,0 +1,96 @@
+import pytest
+import sqlite3 as sql
+from A1_inventory_management.database_init import initialiseDb
+from A1_inventory_management.inventory_store import InventoryStore
+
+# Schema of a database created when dates were stored as TEXT
+TEXT_DATE_SCHEMA = """
+CREATE TABLE stock_names (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  name TEXT NOT NULL CHECK (LENGTH(name) <= 50)
+);
+INSERT INTO stock_names (name) VALUES ('nuts'), ('steel plates'), ('screws'), ('folding chairs');
+CREATE TABLE batches (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  stock_id INTEGER NOT NULL,
+  quantity_initial INTEGER NOT NULL CHECK (quantity_initial >= 0),
+  quantity_current INTEGER NOT NULL CHECK (quantity_current >= 0),
+  delivered_at TEXT CHECK (delivered_at LIKE '%-%-%'),
+  recorded_in_database TEXT DEFAULT (datetime('now')),
+  use_by TEXT CHECK (use_by LIKE '%-%-%'),
+  FOREIGN KEY (stock_id) REFERENCES stock_names(id) ON DELETE CASCADE
+);
+CREATE TABLE transactions (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  transaction_type TEXT NOT NULL CHECK (transaction_type IN ('addition', 'removal')),
+  batch_id INTEGER NOT NULL,
+  stock_id INTEGER NOT NULL,
+  quantity INTEGER NOT NULL CHECK (quantity >= 0),
+  removal_reason TEXT DEFAULT ('N/A'),
+  occured_at TEXT CHECK (occured_at LIKE '%-%-%'),
+  recorded_in_database TEXT DEFAULT (datetime('now')),
+  FOREIGN KEY (batch_id) REFERENCES batches(id) ON DELETE CASCADE,
+  FOREIGN KEY (stock_id) REFERENCES stock_names(id) ON DELETE CASCADE
+);
+INSERT INTO batches VALUES
+  (1, 1, 10, 4, '2025-01-05', '2025-01-05 09:30:00', '2030-01-01'),
+  (2, 2, 7, 7, '2025-3-4', '2025-03-04 17:00:00', '2030-6-1'),
+  (5, 1, 3, 3, '2025-02-01', '2025-02-01 12:00:00', '2029-12-31');
+INSERT INTO transactions VALUES
+  (1, 'addition', 1, 1, 10, 'N/A', '2025-01-05', '2025-01-05 09:30:00'),
+  (2, 'addition', 2, 2, 7, 'N/A', '2025-3-4', '2025-03-04 17:00:00'),
+  (3, 'removal', 1, 1, 6, 'used', '2025-01-20', '2025-01-20 08:00:00'),
+  (4, 'addition', 5, 1, 3, 'N/A', '2025-02-01', '2025-02-01 12:00:00');
+UPDATE sqlite_sequence SET seq = 9 WHERE name = 'batches';
+"""
+
+@pytest.fixture()
+def migrated(tmp_path):
+    dbPath = tmp_path / "stock_database.db"
+    conn = sql.connect(dbPath)
+    conn.executescript(TEXT_DATE_SCHEMA)
+    conn.close()
+    initialiseDb(dbPath)
+    store = InventoryStore(dbPath)
+    yield store
+    store.close()
+
+# Test that a database with TEXT dates is converted, with every row kept and
+# dates saved without leading zeroes read correctly
+def test_migration_keeps_rows(migrated):
+    columns, rows = migrated.find_batches()
+    assert columns == ["id", "stock_id", "quantity_initial", "quantity_current", "delivered_at", "recorded_in_database", "use_by"]
+    assert rows == [
+        (1, 1, 10, 4, "2025-01-05", "2025-01-05 09:30:00", "2030-01-01"),
+        (2, 2, 7, 7, "2025-03-04", "2025-03-04 17:00:00", "2030-06-01"),
+        (5, 1, 3, 3, "2025-02-01", "2025-02-01 12:00:00", "2029-12-31"),
+    ]
+    assert migrated.count_transactions() == 4
+    assert migrated.stock_totals(1).rows == [(1, "nuts", 7, 2, "2029-12-31")]
+
+# Test that a date saved without leading zeroes is found by a range search,
+# which it fell outside of when dates were compared as text
+def test_migration_fixes_unpadded_dates(migrated):
+    assert [r[0] for r in migrated.find_batches(deliveredAt=("2025-03-01", "2025-03-31")).rows] == [2]
+    assert [r[0] for r in migrated.find_transactions(occuredAt=("2025-03-01", "2025-03-31")).rows] == [2]
+
+# Test that ids carry on from before the migration, and that running
+# initialiseDb again leaves the converted database as it is
+def test_migration_keeps_autoincrement(migrated):
+    assert migrated.add_batch(3, 5, "2025-04-01", "2030-01-01") == 10
+    migrated.close()
+    initialiseDb(migrated.dbPath)
+    store = InventoryStore(migrated.dbPath)
+    assert store.count_batches() == 4
+    store.close()
+
+# Test that a recorded date range covers the whole of both days
+def test_recorded_range_includes_whole_days(store):
+    store.conn.execute(
+        "INSERT INTO batches (stock_id, quantity_initial, quantity_current, delivered_day, use_by_day, recorded_at) "
+        "VALUES (1, 1, 1, 20089, 22280, strftime('%s', '2025-01-01 00:00:00')), "
+        "(1, 1, 1, 20089, 22280, strftime('%s', '2025-01-02 23:59:59')), "
+        "(1, 1, 1, 20089, 22280, strftime('%s', '2025-01-03 00:00:00'))"
+    )
+    rows = store.find_batches(recordedInDatabase=("2025-01-01", "2025-01-02")).rows
+    assert [r[5] for r in rows] == ["2025-01-01 00:00:00", "2025-01-02 23:59:59"]
@@ -0,0 +1,152 @@
+import pytest
+import sqlite3 as sql
+from A1_inventory_management.inventory_store import BatchNotFoundError
+
+# Test that names and id numbers both resolve, and unknown names do not
+@pytest.mark.parametrize("name_or_id, expected", [
+    ("nuts", 1),
+    (" Steel Plates", 2),
+    ("3", 3),
+    ("bolts", None),
+    ("99", None),
+], ids=["Name", "Name_Any_Case", "Id", "Unknown_Name", "Unknown_Id"])
+def test_resolve_stock_id(store, name_or_id, expected):
+    assert store.resolve_stock_id(name_or_id) == expected
+
+# Test that adding a batch writes the batch and its addition transaction
+def test_add_batch(store):
+    batchId = store.add_batch(1, 45, "2025-06-04", "2030-05-04")
+
+    assert store.get_batch(batchId) == (batchId, 1, 45, "2025-06-04")
+    columns, rows = store.find_transactions(transactionType="addition")
+    assert len(rows) == 1
+    assert rows[0][columns.index("batch_id")] == batchId
+
+# Test that a removal updates the batch and records the transaction
+def test_remove_from_batch(store):
+    batchId = store.add_batch(2, 100, "2025-06-04", "2030-05-04")
+    stockId = store.remove_from_batch(batchId, 30, "2025-07-01", "used")
+
+    assert stockId == 2
+    assert store.get_batch(batchId)[2] == 70
+    columns, rows = store.find_transactions(removalReason="used")
+    assert [r[columns.index("quantity")] for r in rows] == [30]
+
+# Test that a removal of more than a batch holds leaves the database unaltered
+def test_remove_from_batch_rolls_back(store):
+    batchId = store.add_batch(2, 10, "2025-06-04", "2030-05-04")
+    with pytest.raises(ValueError, match="fewer than 30"):
+        store.remove_from_batch(batchId, 30, "2025-07-01", "used")
+
+    assert store.get_batch(batchId)[2] == 10
+    assert store.find_transactions(transactionType="removal").rows == []
+
+# Test that removing from a batch that does not exist alters nothing
+def test_remove_from_missing_batch(store):
+    with pytest.raises(BatchNotFoundError, match="does not exist"):
+        store.remove_from_batch(99, 1, "2025-07-01", "used")
+    assert store.count_transactions() == 0
+
+# Test that a failed change made inside another transaction only undoes its
+# own statements
+def test_nested_transaction_rolls_back_alone(store):
+    with store.transaction():
+        batchId = store.add_batch(2, 10, "2025-06-04", "2030-05-04")
+        with pytest.raises(ValueError):
+            store.remove_from_batch(batchId, 30, "2025-07-01", "used")
+        store.remove_from_batch(batchId, 4, "2025-07-01", "used")
+    assert not store.conn.in_transaction
+    assert store.get_batch(batchId)[2] == 6
+    assert store.count_transactions() == 2
+
+# Test that a removal is checked and made in one statement, so that no
+# separate read of the batch is needed
+def test_remove_from_batch_single_update(store):
+    batchId = store.add_batch(2, 10, "2025-06-04", "2030-05-04")
+    statements = []
+    store.conn.set_trace_callback(statements.append)
+    store.remove_from_batch(batchId, 4, "2025-07-01", "used")
+    store.conn.set_trace_callback(None)
+    # Statements run by triggers are traced again under the statement that
+    # fired them, so each is only counted once
+    assert [s.split()[0] for s in dict.fromkeys(statements)] == ["BEGIN", "UPDATE", "INSERT", "COMMIT"]
+    assert store.get_batch(batchId)[2] == 6
+
+# Test that the batch search combines its filters
+def test_find_batches(store):
+    store.add_batch(1, 5, "2025-01-10", "2030-01-01")
+    store.add_batch(1, 6, "2025-03-10", "2030-01-01")
+    store.add_batch(2, 7, "2025-03-12", "2030-01-01")
+
+    columns, rows = store.find_batches(stockId=1, deliveredAt=("2025-02-01", "2025-12-31"))
+    assert [r[columns.index("quantity_initial")] for r in rows] == [6]
+
+# Test that stock totals include stock types with no batches
+def test_stock_totals(store):
+    store.add_batch(1, 5, "2025-01-10", "2030-01-01")
+    store.add_batch(1, 6, "2025-03-10", "2030-01-01")
+
+    columns, rows = store.stock_totals()
+    totals = {r[columns.index("name")]: r[columns.index("quantity")] for r in rows}
+    assert totals == {"nuts": 11, "steel plates": 0, "screws": 0, "folding chairs": 0}
+    assert store.stock_totals(1).rows == [(1, "nuts", 11, 2, "2030-01-01")]
+
+# Test that a removal by stock type takes from the batches with the earliest
+# use by dates first, and records a transaction for each batch
+def test_remove_stock_fefo(store):
+    late = store.add_batch(1, 10, "2025-01-01", "2030-01-01")
+    early = store.add_batch(1, 5, "2025-01-02", "2029-01-01")
+    earlyDelivered = store.add_batch(1, 7, "2025-01-01", "2029-01-01")
+    notYetDelivered = store.add_batch(1, 50, "2025-03-01", "2028-01-01")
+    store.add_batch(2, 100, "2025-01-01", "2027-01-01")
+
+    allocation = store.remove_stock(1, 14, "2025-02-01", "used")
+
+    assert allocation == [(earlyDelivered, 7), (early, 5), (late, 2)]
+    assert [store.get_batch(b)[2] for b in (late, early, earlyDelivered, notYetDelivered)] == [8, 0, 0, 50]
+    columns, rows = store.find_transactions(transactionType="removal")
+    assert [(r[columns.index("batch_id")], r[columns.index("quantity")]) for r in rows] == allocation
+
+# Test that a removal of more than is held alters nothing
+def test_remove_stock_not_enough(store):
+    batchId = store.add_batch(1, 10, "2025-01-01", "2030-01-01")
+    with pytest.raises(ValueError):
+        store.remove_stock(1, 11, "2025-02-01", "used")
+
+    assert store.get_batch(batchId)[2] == 10
+    assert store.find_transactions(transactionType="removal").rows == []
+
+# Test that searches can be paged through forwards and backwards by id, and
+# counted without being read
+def test_find_batches_keyset_pages(store):
+    batchIds = [store.add_batch(1 + i % 2, 5, "2025-01-10", "2030-01-01") for i in range(7)]
+    stockOne = batchIds[0::2]
+
+    first = store.find_batches(stockId=1, limit=2).rows
+    second = store.find_batches(stockId=1, afterId=first[-1][0], limit=2).rows
+    last = store.find_batches(stockId=1, afterId=second[-1][0], limit=2).rows
+    back = store.find_batches(stockId=1, beforeId=second[0][0], limit=2).rows
+
+    assert [r[0] for r in first + second + last] == stockOne
+    assert back == first
+    assert store.count_batches(stockId=1) == len(stockOne)
+    assert store.count_transactions(transactionType="addition") == 7
+
+# Test that stock names are cached, and reread once another connection has
+# changed stock_names but not when it has only changed other tables
+def test_stock_names_cache(store):
+    assert store.stock_names() == {1: "nuts", 2: "steel plates", 3: "screws", 4: "folding chairs"}
+    assert store.stock_names() is store.stock_names()
+    index = store.stock_name_index()
+
+    other = sql.connect(store.dbPath)
+    other.execute("INSERT INTO batches (stock_id, quantity_initial, quantity_current, delivered_day, use_by_day) VALUES (1, 5, 5, 20000, 30000)")
+    other.commit()
+    assert store.stock_name_index() is index
+    other.execute("INSERT INTO stock_names (name) VALUES ('washers')")
+    other.commit()
+    other.close()
+
+    assert store.stock_names()[5] == "washers"
+    assert store.resolve_stock_id("washers") == 5
+    assert store.resolve_stock_id("5") == 5
@@ -0,0 +1,58 @@
+import pytest
+from A1_inventory_management.query_builder import BATCHES, TRANSACTIONS, SearchQuery
+
+# Test that the same filters give the same SQL text whatever order they are
+# given in and whatever their values, with the values passed as parameters
+def test_same_filters_share_sql():
+    first = SearchQuery(TRANSACTIONS, {"removalReason": "lost", "stockId": 1, "occuredAt": ("2025-01-01", "2025-01-31")}).select()
+    second = SearchQuery(TRANSACTIONS, {"occuredAt": ("2025-02-01", "2025-02-28"), "stockId": 2, "removalReason": "used"}).select()
+    assert first[0] == second[0]
+    assert "lost" not in first[0]
+    assert first[1] == (1, 20089, 20119, "lost")
+
+# Test that filters left as None are not used
+def test_none_filters_left_out():
+    queryString, queryParameters = SearchQuery(BATCHES, {"stockId": None, "useBy": None}).select()
+    assert queryString == "SELECT id, stock_id, quantity_initial, quantity_current, delivered_at, recorded_in_database, use_by FROM batches ORDER BY id"
+    assert queryParameters == ()
+
+# Test that sorting by a date sorts by the integer column it is stored in,
+# with the limit applied in the database
+def test_order_by_and_limit(store):
+    for deliveredAt in ("2025-03-01", "2025-01-01", "2025-02-01"):
+        store.add_batch(1, 5, deliveredAt, "2030-01-01")
+    query = SearchQuery(BATCHES, {"stockId": 1}, orderBy="delivered_at", descending=True, limit=2)
+    assert "ORDER BY delivered_day DESC, id DESC LIMIT ?" in query.select()[0]
+    assert [r[4] for r in store.search(query).rows] == ["2025-03-01", "2025-02-01"]
+    assert store.count(query) == 3
+
+# Test that a page before beforeId is returned in id order
+def test_previous_page(store):
+    for _ in range(5):
+        store.add_batch(1, 5, "2025-01-01", "2030-01-01")
+    assert [r[0] for r in store.search(SearchQuery(BATCHES, beforeId=5, limit=2)).rows] == [3, 4]
+
+# Test that explain shows the index a search reads through
+def test_explain(store):
+    plan = SearchQuery(TRANSACTIONS, {"stockId": 1, "occuredAt": ("2025-01-01", "2025-12-31")}).explain(store.conn)
+    assert any("USING INDEX" in step for step in plan)
+
+# Test that searches that cannot be built are refused
+@pytest.mark.parametrize("arguments", [
+    {"filters": {"removalReason": "lost"}},
+    {"orderBy": "removal_reason"},
+    {"orderBy": "use_by", "afterId": 3},
+    {"descending": True, "beforeId": 3},
+], ids=["Unknown_Filter", "Unknown_Column", "Page_Not_By_Id", "Page_Descending"])
+def test_invalid_search(arguments):
+    with pytest.raises(ValueError):
+        SearchQuery(BATCHES, **arguments)
+
+# Test that offset skips rows in the order sorted by, with or without a limit
+def test_offset(store):
+    for deliveredAt in ("2025-03-01", "2025-01-01", "2025-02-01", "2025-04-01"):
+        store.add_batch(1, 5, deliveredAt, "2030-01-01")
+    query = SearchQuery(BATCHES, orderBy="delivered_at", limit=2, offset=1)
+    assert "LIMIT ? OFFSET ?" in query.select()[0]
+    assert [r[0] for r in store.search(query).rows] == [3, 1]
+    assert [r[0] for r in store.search(SearchQuery(BATCHES, offset=3)).rows] == [4]
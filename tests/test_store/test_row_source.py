@@ -0,0 +1,46 @@
+import pytest
+from A1_inventory_management.query_builder import BATCHES, TRANSACTIONS
+from A1_inventory_management.row_source import SearchRowSource
+
+@pytest.fixture()
+def batches(store):
+    for day in range(1, 26):
+        store.add_batch(1 + day % 2, day, f"2025-01-{day:02d}", "2030-01-01")
+    return store
+
+def load(source, store, blocks):
+    source.addBlocks(source.loadJob(blocks)(store))
+
+# Test that rows are read a block at a time from any position, and that
+# the last block gives the number of rows
+def test_blocks_read_from_any_position(batches):
+    source = SearchRowSource(BATCHES, {}, blockSize=10)
+    assert source.missingBlocks(12, 22) == [1, 2]
+    load(source, batches, [2])
+    assert source.rowCount == 25
+    assert source.rows(18, 22) == [None, None] + [r for r in batches.find_batches(afterId=20, limit=2).rows]
+    assert source.missingBlocks(12, 30) == [1]
+    assert source.countJob()(batches) == 25
+
+# Test that rows are sorted in the database, and that sorting again keeps
+# the count and the filters
+def test_sorted_by_database(batches):
+    source = SearchRowSource(BATCHES, {"stockId": 1}, orderBy="delivered_at", descending=True, blockSize=5)
+    load(source, batches, [0, 1, 2])
+    assert [r[4] for r in source.rows(0, 3)] == ["2025-01-24", "2025-01-22", "2025-01-20"]
+    assert source.rowCount == 12
+
+    ascending = source.sortedBy("delivered_at")
+    assert ascending.rowCount == 12 and ascending.rows(0, 1) == [None]
+    load(ascending, batches, [0])
+    assert ascending.rows(0, 1)[0][4] == "2025-01-02"
+    with pytest.raises(ValueError):
+        source.sortedBy("quantity_current")
+
+# Test that only the blocks used most recently are kept
+def test_least_recently_used_blocks_dropped(batches):
+    source = SearchRowSource(TRANSACTIONS, {}, blockSize=5, maxBlocks=2)
+    load(source, batches, [0, 1])
+    source.rows(0, 1)
+    load(source, batches, [2])
+    assert source.missingBlocks(0, 15) == [1]
@@ -0,0 +1,59 @@
+import json
+import numpy as np
+import pytest
+from A1_inventory_management.snapshot import NULL_DAY, loadSnapshot, writeSnapshot
+
+@pytest.fixture()
+def snapshot(store, tmp_path):
+    store.add_batch(2, 10, "2025-01-01", "2030-01-01")
+    store.add_batch(4, 5, "2025-01-02", "2030-01-01")
+    store.add_batch(2, 3, "2025-01-03", "2030-01-01")
+    store.remove_from_batch(1, 4, "2025-01-05", "used")
+    store.remove_from_batch(2, 5, "2025-01-06", "lost")
+    store.conn.execute("UPDATE batches SET use_by_day = NULL WHERE id = 3")
+    path = tmp_path / "snapshot"
+    assert writeSnapshot(store, path, chunkSize=2) == {"batches": 3, "transactions": 5}
+    return loadSnapshot(path)
+
+# Test that every column is written, with stock ids, types and reasons
+# dictionary encoded and dates as day numbers
+def test_snapshot_columns(snapshot):
+    batches = snapshot.batches
+    assert batches["id"].tolist() == [1, 2, 3]
+    assert snapshot.stockIds[batches["stock_id"]].tolist() == [2, 4, 2]
+    assert snapshot.stockNames[batches["stock_id"]].tolist() == ["steel plates", "folding chairs", "steel plates"]
+    assert batches["quantity_current"].tolist() == [6, 0, 3]
+    assert batches["delivered_day"].tolist() == [20089, 20090, 20091]
+    assert batches["use_by_day"].tolist() == [21915, 21915, NULL_DAY]
+
+    transactions = snapshot.transactions
+    assert snapshot.transactionTypes[transactions["transaction_type"]].tolist() == ["addition"] * 3 + ["removal"] * 2
+    assert snapshot.removalReasons[transactions["removal_reason"]].tolist() == ["N/A"] * 3 + ["used", "lost"]
+    assert transactions["occured_day"].tolist() == [20089, 20090, 20091, 20093, 20094]
+
+# Test that the columns are opened memory-mapped and cannot be changed
+def test_snapshot_is_read_only_mmap(snapshot):
+    column = snapshot.transactions["quantity"]
+    assert isinstance(column, np.memmap)
+    with pytest.raises(ValueError):
+        column[0] = 1
+
+# Test that a report can total a column by stock type without the database
+def test_snapshot_report(snapshot):
+    totals = np.bincount(snapshot.batches["stock_id"], weights=snapshot.batches["quantity_current"], minlength=len(snapshot.stockIds))
+    assert totals[snapshot.stockCode(2)] == 9
+    assert snapshot.stockCode(99) is None
+
+# Test that writing again replaces the snapshot, and that a snapshot of
+# another format is refused
+def test_snapshot_replaced(store, snapshot):
+    store.add_batch(1, 1, "2025-02-01", "2030-01-01")
+    writeSnapshot(store, snapshot.path)
+    assert len(loadSnapshot(snapshot.path).batches["id"]) == 4
+
+    manifestPath = snapshot.path / "manifest.json"
+    manifest = json.loads(manifestPath.read_text())
+    manifest["format"] = 0
+    manifestPath.write_text(json.dumps(manifest))
+    with pytest.raises(ValueError):
+        loadSnapshot(snapshot.path)
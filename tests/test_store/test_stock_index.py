@@ -0,0 +1,33 @@
+from A1_inventory_management.stock_index import StockNameIndex
+
+NAMES = {1: "nuts", 2: "Steel Plates", 3: "screws", 4: "steel rods", 5: "NUTS", 6: "spanners"}
+
+# Test that names are found in any case, with a repeated name finding the
+# lowest id, and that id numbers are resolved
+def test_find_any_case():
+    index = StockNameIndex(NAMES)
+    assert index.find("steel plates") == 2
+    assert index.find("Nuts ") == 1
+    assert index.find("bolts") is None
+    assert [index.resolve(x) for x in ["SCREWS", "6", "7", "²"]] == [3, 6, None, None]
+    assert index.nameOf(4) == "steel rods"
+    assert len(index) == 6
+
+# Test that the names starting with a prefix are suggested in order, once
+# each, up to the limit
+def test_starting_with():
+    index = StockNameIndex(NAMES)
+    assert index.startingWith("S") == ["screws", "spanners", "Steel Plates", "steel rods"]
+    assert index.startingWith("steel ", limit=1) == ["Steel Plates"]
+    assert index.startingWith("n") == ["nuts"]
+    assert index.startingWith("x") == []
+    assert index.startingWith("") == ["nuts", "screws", "spanners", "Steel Plates", "steel rods"]
+
+# Test that suggestions from the store follow a rename made through its own
+# connection once it is told of it
+def test_store_suggestions(store):
+    assert store.suggest_stock_names("s") == ["screws", "steel plates"]
+    store.conn.execute("UPDATE stock_names SET name = 'Sheet steel' WHERE id = 2")
+    store.invalidate_stock_names()
+    assert store.suggest_stock_names("s") == ["screws", "Sheet steel"]
+    assert store.resolve_stock_id("sheet STEEL") == 2
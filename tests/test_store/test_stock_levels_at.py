@@ -0,0 +1,73 @@
+import pytest
+
+@pytest.fixture()
+def ledger(store):
+    store.add_batch(1, 10, "2025-01-10", "2030-01-01")
+    store.add_batch(2, 5, "2025-01-20", "2030-01-01")
+    store.remove_from_batch(1, 3, "2025-02-05", "used")
+    store.add_batch(1, 4, "2025-02-15", "2030-01-01")
+    store.remove_from_batch(2, 5, "2025-03-01", "lost")
+    store.remove_from_batch(3, 1, "2025-03-20", "used")
+    return store
+
+def quantities(resultSet):
+    return {row[0]: row[-1] for row in resultSet.rows}
+
+# The stock held of types 1 and 2 at the end of each day checked
+EXPECTED_LEVELS = {
+    "2025-01-09": {1: 0, 2: 0},
+    "2025-01-31": {1: 10, 2: 5},
+    "2025-02-05": {1: 7, 2: 5},
+    "2025-02-28": {1: 11, 2: 5},
+    "2025-03-01": {1: 11, 2: 0},
+    "2025-04-30": {1: 10, 2: 0},
+}
+
+# Test that the stock held at a past date is the same with and without
+# checkpoints to start from
+@pytest.mark.parametrize("checkpointed", [False, True], ids=["Whole_Ledger", "Checkpoints"])
+def test_stock_levels_at(ledger, checkpointed):
+    if checkpointed:
+        assert ledger.update_checkpoints("2025-05-01") == 4
+    for day, expected in EXPECTED_LEVELS.items():
+        levels = quantities(ledger.stock_levels_at(day))
+        assert {k: levels[k] for k in expected} == expected, day
+    assert ledger.stock_levels_at("2025-02-28", stockId=1).rows == [(1, "nuts", 11)]
+
+# Test that a month end is only checkpointed once, and that the checkpoints
+# hold the quantity of each stock type held at the month end
+def test_update_checkpoints(ledger):
+    assert ledger.update_checkpoints("2025-03-01") == 2
+    assert ledger.update_checkpoints("2025-03-01") == 0
+    assert ledger.update_checkpoints("2025-04-01") == 1
+    assert ledger.conn.execute("SELECT day, stock_id, quantity FROM stock_checkpoints ORDER BY day, stock_id").fetchall() == [
+        (20119, 1, 10), (20119, 2, 5), (20147, 1, 11), (20147, 2, 5), (20178, 1, 10),
+    ]
+
+# Test that a transaction dated before a checkpoint drops it and the ones
+# after it, so that they are made again with the transaction counted
+def test_backdated_transaction_drops_checkpoints(ledger):
+    ledger.update_checkpoints("2025-05-01")
+    ledger.remove_from_batch(1, 2, "2025-02-10", "lost")
+    assert [r[0] for r in ledger.conn.execute("SELECT day FROM checkpoint_days")] == [20119]
+    assert quantities(ledger.stock_levels_at("2025-03-31"))[1] == 8
+    ledger.update_checkpoints("2025-05-01")
+    assert quantities(ledger.stock_levels_at("2025-03-31"))[1] == 8
+
+# Test that a stock level reads the transactions since the checkpoint rather
+# than the whole ledger
+def test_stock_levels_read_from_checkpoint(ledger):
+    ledger.update_checkpoints("2025-05-01")
+    statements = []
+    ledger.conn.set_trace_callback(statements.append)
+    ledger.stock_levels_at("2025-03-25")
+    ledger.conn.set_trace_callback(None)
+    query = next(s for s in statements if "stock_checkpoints" in s)
+    assert "occured_day > 20147" in query
+
+# Test that the quantity each batch held is found from its removals since
+def test_batch_levels_at(ledger):
+    assert ledger.batch_levels_at("2025-01-31").rows == [(1, 1, 10), (2, 2, 5)]
+    assert ledger.batch_levels_at("2025-02-28").rows == [(1, 1, 7), (2, 2, 5), (3, 1, 4)]
+    assert ledger.batch_levels_at("2025-03-31").rows == [(1, 1, 7), (3, 1, 3)]
+    assert ledger.batch_levels_at("2025-02-28", stockId=2).rows == [(2, 2, 5)]
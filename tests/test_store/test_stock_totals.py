@@ -0,0 +1,58 @@
+from A1_inventory_management.database_init import initialiseDb
+from A1_inventory_management.inventory_store import InventoryStore
+
+def totals(store):
+    return {r[0]: r[2:] for r in store.stock_totals().rows}
+
+def rebuilt_totals(store):
+    store.rebuild_stock_totals()
+    return totals(store)
+
+# Test that the triggers keep the totals up to date as batches change
+def test_totals_follow_batches(store):
+    first = store.add_batch(1, 10, "2025-01-10", "2030-06-01")
+    second = store.add_batch(1, 5, "2025-02-10", "2029-01-01")
+    assert totals(store)[1] == (15, 2, "2029-01-01")
+
+    # Emptying the batch with the earliest use by date moves it on
+    store.remove_from_batch(second, 5, "2025-03-01", "used")
+    assert totals(store)[1] == (10, 1, "2030-06-01")
+
+    store.remove_from_batch(first, 4, "2025-03-01", "lost")
+    assert totals(store)[1] == (6, 1, "2030-06-01")
+    assert totals(store) == rebuilt_totals(store)
+
+# Test that moving or deleting a batch updates both stock types
+def test_totals_follow_moved_and_deleted_batches(store):
+    batchId = store.add_batch(1, 10, "2025-01-10", "2030-06-01")
+    store.conn.execute("UPDATE batches SET stock_id = 2 WHERE id = ?", (batchId,))
+    assert totals(store)[1] == (0, 0, None)
+    assert totals(store)[2] == (10, 1, "2030-06-01")
+
+    store.conn.execute("DELETE FROM batches WHERE id = ?", (batchId,))
+    assert totals(store)[2] == (0, 0, None)
+
+# Test that new stock types start with an empty total
+def test_new_stock_type_has_total(store):
+    stockId = store.conn.execute("INSERT INTO stock_names (name) VALUES ('bolts')").lastrowid
+    assert totals(store)[stockId] == (0, 0, None)
+
+# Test that initialiseDb backfills the totals of a database created before
+# stock_totals existed
+def test_backfill_existing_database(tmp_path):
+    dbPath = tmp_path / "stock_database.db"
+    initialiseDb(dbPath)
+    store = InventoryStore(dbPath)
+    for (name,) in store.conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'").fetchall():
+        store.conn.execute(f"DROP TRIGGER {name}")
+    store.conn.execute("DROP TABLE stock_totals")
+    store.conn.execute(
+        "INSERT INTO batches (stock_id, quantity_initial, quantity_current, delivered_day, use_by_day) "
+        "VALUES (3, 20, 12, 20089, 22280), (3, 20, 0, 20089, 20454)"
+    )
+    store.close()
+
+    initialiseDb(dbPath)
+    store = InventoryStore(dbPath)
+    assert totals(store)[3] == (12, 1, "2031-01-01")
+    store.close()
@@ -0,0 +1,82 @@
+from A1_inventory_management.database_init import initialiseDb
+from A1_inventory_management.inventory_store import InventoryStore
+
+def daily(store):
+    return store.conn.execute("SELECT * FROM transaction_daily ORDER BY day, stock_id, transaction_type, removal_reason").fetchall()
+
+def rebuilt_daily(store):
+    store.rebuild_transaction_daily()
+    return daily(store)
+
+# Test that the triggers total each day's transactions as they are recorded
+def test_daily_follows_transactions(store):
+    first = store.add_batch(1, 10, "2025-01-06", "2030-01-01")
+    store.add_batch(1, 5, "2025-01-06", "2030-01-01")
+    store.remove_from_batch(first, 3, "2025-01-07", "used")
+    store.remove_from_batch(first, 2, "2025-01-07", "used")
+    assert daily(store) == [
+        (20094, 1, "addition", "N/A", 15, 2),
+        (20095, 1, "removal", "used", 5, 2),
+    ]
+    assert daily(store) == rebuilt_daily(store)
+
+# Test that changing or deleting a transaction moves it out of its day's
+# totals, and that a day left with no transactions is removed
+def test_daily_follows_changed_and_deleted_transactions(store):
+    batchId = store.add_batch(1, 10, "2025-01-06", "2030-01-01")
+    store.remove_from_batch(batchId, 3, "2025-01-07", "used")
+    store.conn.execute("UPDATE transactions SET removal_reason = 'lost', occured_day = 20096 WHERE transaction_type = 'removal'")
+    assert daily(store)[1:] == [(20096, 1, "removal", "lost", 3, 1)]
+    store.conn.execute("DELETE FROM transactions WHERE transaction_type = 'removal'")
+    assert daily(store) == [(20094, 1, "addition", "N/A", 10, 1)]
+    assert daily(store) == rebuilt_daily(store)
+
+# Test that usage is totalled for each week starting on a Monday
+def test_usage_by_week(store):
+    nuts = store.add_batch(1, 50, "2025-01-01", "2030-01-01")
+    plates = store.add_batch(2, 50, "2025-01-01", "2030-01-01")
+    store.remove_from_batch(nuts, 3, "2025-01-06", "used")
+    store.remove_from_batch(nuts, 4, "2025-01-12", "used")
+    store.remove_from_batch(nuts, 5, "2025-01-13", "used")
+    store.remove_from_batch(plates, 6, "2025-01-08", "used")
+    store.remove_from_batch(plates, 7, "2025-01-08", "lost")
+    columns, rows = store.usage_by_week("2025-01-01", "2025-01-31")
+    assert columns == ["week_starting", "id", "name", "quantity"]
+    assert rows == [
+        ("2025-01-06", 1, "nuts", 7),
+        ("2025-01-06", 2, "steel plates", 6),
+        ("2025-01-13", 1, "nuts", 5),
+    ]
+    assert store.usage_by_week("2025-01-01", "2025-01-12", stockId=2).rows == [("2025-01-06", 2, "steel plates", 6)]
+
+# Test that losses are totalled for each reason in each month, leaving out
+# stock that was used or returned
+def test_losses_by_month(store):
+    batchId = store.add_batch(1, 50, "2025-01-01", "2030-01-01")
+    store.remove_from_batch(batchId, 1, "2025-01-06", "lost")
+    store.remove_from_batch(batchId, 2, "2025-01-20", "lost")
+    store.remove_from_batch(batchId, 3, "2025-01-21", "destroyed")
+    store.remove_from_batch(batchId, 4, "2025-02-03", "out_of_date")
+    store.remove_from_batch(batchId, 5, "2025-02-03", "used")
+    store.remove_from_batch(batchId, 6, "2025-02-04", "returned")
+    columns, rows = store.losses_by_month("2025-01-01", "2025-12-31")
+    assert columns == ["month", "removal_reason", "quantity", "transactions"]
+    assert rows == [
+        ("2025-01", "destroyed", 3, 1),
+        ("2025-01", "lost", 3, 2),
+        ("2025-02", "out_of_date", 4, 1),
+    ]
+
+# Test that a database made before the rollup existed has it filled in when
+# it is next initialised
+def test_daily_backfilled(tmp_path):
+    dbPath = tmp_path / "old.db"
+    initialiseDb(dbPath)
+    store = InventoryStore(dbPath)
+    store.add_batch(1, 10, "2025-01-06", "2030-01-01")
+    store.conn.execute("DROP TABLE transaction_daily")
+    store.close()
+    initialiseDb(dbPath)
+    store = InventoryStore(dbPath)
+    assert daily(store) == [(20094, 1, "addition", "N/A", 10, 1)]
+    store.close()